@@ -1,5 +1,8 @@
+import argparse
+import asyncio
 import logging
 import os
+from functools import partial
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
@@ -9,6 +12,8 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
+    TypeHandler,
 )
 from telegram.error import NetworkError, Forbidden
 
@@ -28,7 +33,15 @@ if log_level == logging.INFO:
 
 # Se importan los handlers y la configuración
 import config
-from handlers import client_handler, product_handler, sale_handler, auth_handler, admin_handler
+from db import conexion
+from db.difusion import difusiones
+from db.estado_compartido import AlmacenRedis, PersistenciaCompartida
+from db.persistencia import PersistenciaSQLite, ruta_por_worker
+from db.sesiones import sesiones
+from utils.instrumentacion import EjecutorMedido, instrumentar_handlers, registrar_medidores, iniciar_servidor_metricas
+from utils.limitador import LimitadorEnvios
+from utils.procesador import ProcesadorPorChat
+from handlers import client_handler, product_handler, sale_handler, auth_handler, admin_handler, import_handler, export_handler, inline_handler, menu_handler, broadcast_handler
 from handlers.auth_handler import (
     register_first_name, register_last_name, register_username, register_email, register_password, register_complete,
     login_email, login_password, login_complete,
@@ -53,6 +66,8 @@ from states import (
     PRODUCT_FILTER_RESPONSE,
     VIEWING_CLIENT,
     VIEWING_PRODUCT,
+    SALE_SELECT_CLIENT,
+    SALE_CART,
 )
 
 # === FUNCIONES DEL MENÚ PRINCIPAL Y NAVEGACIÓN ===
@@ -66,7 +81,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     tenant_id = context.user_data.get('tenant_id')
     context.user_data.clear()
     if tenant_id:
+        # Sesión ya iniciada (o restaurada tras un reinicio): directo al menú principal
         context.user_data['tenant_id'] = tenant_id
+        return await menu_handler.show_main_menu(update, context)
 
     texto = "¡Hola! 👋\n\nSoy tu asistente de gestión. Por favor, elige una opción para comenzar:"
     keyboard = [
@@ -79,6 +96,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cierra la sesión del usuario y finaliza la conversación."""
+    sesiones.cerrar(update.effective_user.id)
     context.user_data.clear()
     await update.message.reply_text(
         "Has cerrado la sesión. ¡Hasta pronto!",
@@ -104,17 +122,84 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def health_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Endpoint de health check para Render."""
-    await update.message.reply_text("Bot funcionando correctamente ✅")
+    texto = "Bot funcionando correctamente ✅"
+    procesador = context.application.update_processor
+    if isinstance(procesador, ProcesadorPorChat):
+        estado = procesador.resumen()
+        texto += (
+            f"\nUpdates en espera: {estado['en_espera']} · en curso: {estado['en_curso']}"
+            f"/{procesador.concurrencia}\nEspera de cerrojo p95: {estado['espera_cerrojo_p95'] * 1000:.0f} ms"
+        )
+    limitador = context.bot.rate_limiter
+    if isinstance(limitador, LimitadorEnvios):
+        texto += (
+            f"\nEnvíos en cola: {limitador.en_cola} · reintentos por flood wait: {limitador.reintentos}"
+        )
+    await update.message.reply_text(texto)
+
+_servidor_metricas = None
+
+async def iniciar_tareas(application: Application, puerto_metricas: int = 0) -> None:
+    """post_init: métricas, sincronización del catálogo y difusiones interrumpidas."""
+    global _servidor_metricas
+    # Ejecutor propio para asyncio.to_thread, con contadores de cola y ocupación
+    ejecutor = EjecutorMedido(config.TO_THREAD_WORKERS, thread_name_prefix="to_thread")
+    asyncio.get_running_loop().set_default_executor(ejecutor)
+    registrar_medidores(application, ejecutor)
+    if puerto_metricas:
+        _servidor_metricas = iniciar_servidor_metricas(puerto_metricas)
+    await product_handler.iniciar_sincronizacion_catalogo(application)
+    await broadcast_handler.iniciar_difusiones(application)
+
+async def detener_tareas(application: Application) -> None:
+    """post_stop: detiene las tareas de fondo guardando su progreso."""
+    await broadcast_handler.detener_difusiones(application)
+    await product_handler.detener_sincronizacion_catalogo(application)
+    if _servidor_metricas is not None:
+        _servidor_metricas.stop()
+
+async def cerrar_recursos(application: Application) -> None:
+    """post_shutdown: cierra los almacenes locales, el pool de /ranking y el pool HTTP compartido."""
+    sesiones.almacen.cerrar()
+    admin_handler.cerrar_pool_ranking()
+    difusiones.cerrar()
+    await conexion.cerrar_conexiones(application)
+
+def crear_persistencia(workers: int = 1, indice: int = 0):
+    """Estado en Redis si hay STATE_STORE_URL (varias réplicas); si no, SQLite local.
+
+    Con varios workers cada uno usa su propio fichero: un chat siempre cae en el mismo worker.
+    """
+    if config.STATE_STORE_URL:
+        import redis.asyncio as redis  # dependencia solo necesaria en modo multi-instancia
+
+        return PersistenciaCompartida(AlmacenRedis(redis.from_url(config.STATE_STORE_URL)))
+    if workers > 1:
+        return PersistenciaSQLite(ruta_por_worker(config.PERSISTENCE_DB_PATH, indice))
+    return PersistenciaSQLite()
 
 # === Punto de entrada de la aplicación ===
 
-def main() -> None:
-    """Arranca el bot y registra los handlers principales."""
-    if not config.supabase_admin:
-        logger.critical("El cliente de Supabase no se pudo inicializar. Abortando.")
-        return
+def construir_aplicacion(workers: int = 1, indice: int = 0) -> Application:
+    """Crea la Application y registra los handlers principales.
 
-    application = Application.builder().token(config.TELEGRAM_TOKEN).build()
+    Con `workers` > 1 cada proceso envía con su parte del límite global de Telegram y
+    el worker `indice` sirve sus métricas en METRICS_PORT + indice.
+    """
+    persistencia = crear_persistencia(workers, indice)
+    puerto_metricas = config.METRICS_PORT + indice if config.METRICS_PORT else 0
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_TOKEN)
+        .persistence(persistencia)
+        # Varios updates a la vez, pero los de un mismo chat/usuario en orden
+        .concurrent_updates(ProcesadorPorChat(config.UPDATE_CONCURRENCY, config.UPDATE_MAX_PENDING))
+        .rate_limiter(LimitadorEnvios(tasa_global=config.TELEGRAM_GLOBAL_RATE / workers))
+        .post_init(partial(iniciar_tareas, puerto_metricas=puerto_metricas))
+        .post_stop(detener_tareas)
+        .post_shutdown(cerrar_recursos)
+        .build()
+    )
 
     
 
@@ -126,6 +211,7 @@ def main() -> None:
                 MessageHandler(filters.Regex(r'^Registrarse$'), auth_handler.register_first_name),
                 MessageHandler(filters.Regex(r'^Iniciar sesión$'), auth_handler.login_email),
                 MessageHandler(filters.Regex(r'^Restablecer contraseña$'), auth_handler.start_password_reset),
+                MessageHandler(filters.Regex(r'Gestión (Clientes|Productos|Ventas)$'), menu_handler.handle_main_menu_selection),
             ],
             # Flujo de Registro
             REGISTER_FIRST_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, register_first_name)],
@@ -134,8 +220,8 @@ def main() -> None:
             REGISTER_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, register_email)],
             REGISTER_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, register_password)],
             # Flujo de Login
-            LOGIN_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_email)],
-            LOGIN_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_password)],
+            LOGIN_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_password)],
+            LOGIN_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_complete)],
             # Flujo de reseteo de contraseña
             RESET_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, request_reset_token)],
             RESET_TOKEN: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_new_password)],
@@ -146,6 +232,8 @@ def main() -> None:
                 MessageHandler(filters.Regex(r'^Consulta Cliente$'), client_handler.consulta_cliente),
                 MessageHandler(filters.Regex(r'^Modificar Cliente$'), client_handler.modificar_cliente),
                 MessageHandler(filters.Regex(r'^Eliminar Cliente$'), client_handler.eliminar_cliente),
+                # "Cancelar" lo atiende el fallback, no la búsqueda
+                MessageHandler(filters.TEXT & ~filters.COMMAND & ~filters.Regex(r'^Cancelar$'), client_handler.buscar_cliente),
             ],
             PRODUCT_SUBMENU: [
                 MessageHandler(filters.Regex(r'^Añadir Producto$'), product_handler.anadir_producto),
@@ -153,37 +241,97 @@ def main() -> None:
                 MessageHandler(filters.Regex(r'^Modificar Producto$'), product_handler.modificar_producto),
                 MessageHandler(filters.Regex(r'^Eliminar Producto$'), product_handler.eliminar_producto),
             ],
+            SALE_SUBMENU: [
+                MessageHandler(filters.Regex(r'^Añadir Venta$'), sale_handler.anadir_venta),
+                MessageHandler(filters.Regex(r'^Consulta Venta$'), sale_handler.consulta_venta),
+                MessageHandler(filters.Regex(r'^Modificar Venta$'), sale_handler.modificar_venta),
+                MessageHandler(filters.Regex(r'^Eliminar Venta$'), sale_handler.eliminar_venta),
+                CallbackQueryHandler(sale_handler.cambiar_informe_ventas, pattern='^sale_report_'),
+            ],
             # Estados de respuesta
-            CLIENT_FILTER_RESPONSE: [CallbackQueryHandler(client_handler.mostrar_clientes_filtrados)],
+            CLIENT_FILTER_RESPONSE: [
+                CallbackQueryHandler(client_handler.paginar_clientes, pattern='^client_page_'),
+                CallbackQueryHandler(client_handler.seleccionar_cliente, pattern='^client_sel_'),
+                CallbackQueryHandler(client_handler.mostrar_clientes_filtrados),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, client_handler.acciones_cliente_seleccionado),
+            ],
             PRODUCT_FILTER_RESPONSE: [
                 CallbackQueryHandler(product_handler.callback_filtro_producto, pattern='^product_filter_'),
                 CallbackQueryHandler(product_handler.mostrar_productos_filtrados, pattern='^product_value_'),
             ],
             VIEWING_PRODUCT: [MessageHandler(filters.TEXT & ~filters.COMMAND, product_handler.ver_detalle_producto)],
+            # Alta de venta con carrito
+            SALE_SELECT_CLIENT: [
+                CallbackQueryHandler(sale_handler.seleccionar_cliente_venta, pattern='^sale_client_'),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, sale_handler.buscar_cliente_venta),
+            ],
+            SALE_CART: [
+                CallbackQueryHandler(sale_handler.acciones_carrito, pattern='^sale_'),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, sale_handler.anadir_linea),
+            ],
         },
         fallbacks=[
             CommandHandler('cancel', end_conversation),
             MessageHandler(filters.Regex(r'^Cancelar$'), end_conversation),
         ],
-        conversation_timeout=600
+        conversation_timeout=600,
+        name="principal",
+        persistent=True,
     )
 
+    if isinstance(persistencia, PersistenciaCompartida):
+        # Estado compartido: se lee antes que nada (-2) y se escribe al terminar el update (99)
+        application.add_handler(TypeHandler(Update, persistencia.cargar), group=-2)
+        application.add_handler(TypeHandler(Update, persistencia.guardar), group=99)
+    # Grupo -1: restaura la sesión persistida antes de que ningún otro handler lea user_data
+    application.add_handler(TypeHandler(Update, auth_handler.restaurar_sesion), group=-1)
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("health", health_check))
     application.add_handler(CommandHandler("listusernames", admin_handler.list_usernames))
+    application.add_handler(CommandHandler("ranking", admin_handler.ranking))
+    application.add_handler(CommandHandler("broadcast", broadcast_handler.broadcast))
     application.add_handler(CommandHandler("testcrud", client_handler.test_crud_supabase_handler))
+    application.add_handler(CommandHandler("importar", import_handler.ayuda_importacion))
+    application.add_handler(CommandHandler("export", export_handler.exportar))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.FileExtension("xlsx"),
+        import_handler.importar_clientes
+    ))
+    application.add_handler(InlineQueryHandler(inline_handler.buscar_productos_inline, block=False))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, unknown_command))
     application.add_error_handler(error_handler)
+    instrumentar_handlers(application)
+    return application
+
+
+def main() -> None:
+    """Arranca el bot en modo webhook, en un proceso o repartido entre --workers N procesos."""
+    parser = argparse.ArgumentParser(description="Bot de Telegram del CRM")
+    parser.add_argument("--workers", type=int, default=config.WEBHOOK_WORKERS,
+                        help="procesos worker detrás de un frontal que reparte por chat_id (1 = sin frontal)")
+    args = parser.parse_args()
+
+    if not conexion.supabase_admin:
+        logger.critical("El cliente de Supabase no se pudo inicializar. Abortando.")
+        return
 
     port = int(os.environ.get("PORT", 8443))
     logger.info(f"Iniciando servidor webhook en el puerto {port}")
 
-    # El método run_webhook es bloqueante y se encarga de configurar y arrancar el webhook
     url_path = "webhook"
     webhook_url = f"{config.WEBHOOK_URL}/{url_path}"
 
     logger.info(f"Configurando y iniciando webhook en la URL: {webhook_url}")
 
+    if args.workers > 1:
+        from webhook_workers import ejecutar_con_workers
+
+        ejecutar_con_workers(args.workers, port, url_path, webhook_url, config.WEBHOOK_SECRET_TOKEN,
+                             config.TELEGRAM_TOKEN)
+        return
+
+    # El método run_webhook es bloqueante y se encarga de configurar y arrancar el webhook
+    application = construir_aplicacion()
     application.run_webhook(
         listen="0.0.0.0",
         port=port,
@@ -27,17 +27,47 @@ if missing_vars:
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))  # procesos worker (ver webhook_workers.py)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))    # updates en ejecución a la vez
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1024"))   # updates en vuelo (esperando o en ejecución)
+
+# --- Métricas (/metrics en formato Prometheus, ver utils/instrumentacion.py) ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))  # 0 desactiva; con --workers N, el worker i usa METRICS_PORT + i
+TO_THREAD_WORKERS = int(os.getenv("TO_THREAD_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))  # hilos de asyncio.to_thread
+
+# --- Límites de envío a Telegram (ver utils/limitador.py) ---
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # mensajes/s del bot en total
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))       # mensajes/s a un chat privado
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))     # ráfaga permitida en un chat privado
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))  # mensajes/s a un grupo (20/min)
 
 # --- Configuración de Supabase ---
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY") # Clave de servicio (rol 'service_role')
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY") # Clave anónima (rol 'anon')
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))  # segundos por petición HTTP
+AUTH_TIMEOUT = float(os.getenv("AUTH_TIMEOUT", "10"))  # segundos por llamada a Supabase Auth (cola incluida)
+AUTH_MAX_CONCURRENT = int(os.getenv("AUTH_MAX_CONCURRENT", "10"))  # llamadas simultáneas a Supabase Auth
+SESSION_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", "1000"))  # sesiones PostgREST por usuario en memoria
+SESSION_REFRESH_MARGIN = int(os.getenv("SESSION_REFRESH_MARGIN", "60"))  # segundos antes de expirar para refrescar
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sesiones.sqlite3")  # sesiones que sobreviven a reinicios
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", str(7 * 24 * 3600)))  # segundos desde el login
+SESSION_ENCRYPTION_KEY = os.getenv("SESSION_ENCRYPTION_KEY")  # clave Fernet; sin ella no se guardan los tokens en disco
+
+# --- Persistencia de conversaciones ---
+PERSISTENCE_DB_PATH = os.getenv("PERSISTENCE_DB_PATH", "persistencia.sqlite3")
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "0.5"))  # segundos entre volcados
+# redis://host:6379/0 para compartir el estado entre réplicas; vacío = SQLite local
+STATE_STORE_URL = os.getenv("STATE_STORE_URL", "")
+STATE_KNOWN_MAX = int(os.getenv("STATE_KNOWN_MAX", "10000"))  # versiones de claves recordadas por réplica
 
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 TENANT_ID = os.getenv("TENANT_ID", "00000000-0000-0000-0000-000000000001")
+# Solo desarrollo: "Iniciar sesión" entra sin credenciales (sin usuario de Auth: no recibe difusiones)
+LOGIN_DEV_BYPASS = os.getenv("LOGIN_DEV_BYPASS", "").lower() in ("1", "true", "yes")
 
 # Carga la lista de IDs de administradores desde el entorno
 ADMIN_IDS = set()
@@ -48,7 +78,41 @@ if _admin_env:
     except ValueError:
         logger.warning("La variable ADMIN_IDS contiene valores no válidos.")
 
-# Inicializa el cliente de Supabase para que sea importable desde otros módulos
+# --- Cachés en memoria ---
+FACET_CACHE_TTL = int(os.getenv("FACET_CACHE_TTL", "300"))        # segundos
+FACET_CACHE_MAXSIZE = int(os.getenv("FACET_CACHE_MAXSIZE", "512"))  # nº de tenants
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "3600"))     # segundos
+SEARCH_INDEX_MAXSIZE = int(os.getenv("SEARCH_INDEX_MAXSIZE", "64")) # nº de tenants
+CLIENT_CARD_CACHE_MAXSIZE = int(os.getenv("CLIENT_CARD_CACHE_MAXSIZE", "2048"))  # nº de fichas
+CATALOG_SYNC_INTERVAL = int(os.getenv("CATALOG_SYNC_INTERVAL", "60"))            # segundos entre deltas
+CATALOG_FULL_SYNC_INTERVAL = int(os.getenv("CATALOG_FULL_SYNC_INTERVAL", "3600"))  # recarga completa (borrados)
+
+# --- Búsqueda inline ---
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "30"))       # segundos que Telegram y el bot cachean resultados
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.3"))        # espera para agrupar pulsaciones seguidas
+
+# --- Paginación ---
+CLIENT_PAGE_SIZE = int(os.getenv("CLIENT_PAGE_SIZE", "10"))
+
+# --- Importación masiva ---
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))  # filas por insert
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))    # filas por página leída
+
+# --- Informes ---
+RANKING_WORKERS = int(os.getenv("RANKING_WORKERS", "2"))        # procesos para agregar /ranking
+RANKING_DAYS = int(os.getenv("RANKING_DAYS", "90"))             # días de historia por defecto
+RANKING_PAGE_SIZE = int(os.getenv("RANKING_PAGE_SIZE", "5000")) # líneas por bloque columnar
+
+# --- Difusiones (/broadcast) ---
+BROADCAST_DB_PATH = os.getenv("BROADCAST_DB_PATH", "difusiones.sqlite3")  # progreso de cada difusión
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))   # destinatarios leídos por página
+BROADCAST_WINDOW = int(os.getenv("BROADCAST_WINDOW", "60"))          # envíos en vuelo (~2 s al límite global)
+BROADCAST_CHECKPOINT = int(os.getenv("BROADCAST_CHECKPOINT", "100")) # envíos entre puntos de control
+BROADCAST_LEASE = int(os.getenv("BROADCAST_LEASE", "300"))           # segundos sin latido para reclamar una difusión
+BROADCAST_CLAIM_INTERVAL = int(os.getenv("BROADCAST_CLAIM_INTERVAL", "60"))  # segundos entre latidos y reclamos
+
+# Inicializa el cliente síncrono de Supabase para scripts y herramientas de línea de comandos.
+# Los handlers del bot usan los clientes asíncronos de db/conexion.py.
 try:
     supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
     supabase_anon: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
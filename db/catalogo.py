@@ -0,0 +1,127 @@
+# Instantánea en memoria del catálogo de productos de un tenant.
+# Se carga completa una vez y después se mantiene al día trayendo solo las filas con
+# `updated_at` posterior a la última sincronización (ver db/sql/products_updated_at.sql).
+
+from datetime import datetime, timedelta
+
+from db.paginacion import pagina_keyset, recortar_pagina
+from utils.search_index import TrigramIndex
+
+COLUMNAS_CATALOGO = (
+    "id", "sku", "name", "description", "category", "supplier_id", "price", "stock",
+    "image_url", "image_file_id", "image_file_url", "updated_at",
+)
+# Campos con índice secundario {valor: {ids}}; la disponibilidad (stock > 0) va aparte
+CAMPOS_INDEXADOS = ("sku", "category", "supplier_id")
+CAMPOS_BUSQUEDA = ("name", "sku")
+# Solape al pedir el delta: una transacción larga puede confirmar filas con un
+# updated_at algo anterior al máximo ya visto. Reaplicar una fila no tiene efecto.
+MARGEN_DELTA = timedelta(seconds=5)
+
+
+def _clave(valor):
+    """Valor normalizado para los índices (los callbacks siempre traen texto)."""
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    return texto or None
+
+
+def _fecha(valor):
+    if not valor:
+        return None
+    return datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+
+
+class Catalogo:
+    """Productos de un tenant indexados por id, SKU, categoría, proveedor y disponibilidad."""
+
+    def __init__(self):
+        self.productos = {}
+        self.indices = {campo: {} for campo in CAMPOS_INDEXADOS}
+        self.con_stock = set()
+        self.marca = None  # mayor updated_at aplicado (datetime)
+        self._busqueda = None  # TrigramIndex por nombre/SKU, se crea en la primera búsqueda
+
+    def __len__(self) -> int:
+        return len(self.productos)
+
+    def aplicar(self, filas) -> None:
+        """Inserta o reemplaza productos y actualiza los índices y la marca de sincronización."""
+        for fila in filas:
+            self.quitar(fila["id"])
+            self.productos[fila["id"]] = fila
+            for campo, indice in self.indices.items():
+                clave = _clave(fila.get(campo))
+                if clave is not None:
+                    indice.setdefault(clave, set()).add(fila["id"])
+            if (fila.get("stock") or 0) > 0:
+                self.con_stock.add(fila["id"])
+            if self._busqueda is not None:
+                self._busqueda.add(fila["id"], fila)
+            fecha = _fecha(fila.get("updated_at"))
+            if fecha and (self.marca is None or fecha > self.marca):
+                self.marca = fecha
+
+    def quitar(self, producto_id) -> None:
+        fila = self.productos.pop(producto_id, None)
+        if fila is None:
+            return
+        for campo, indice in self.indices.items():
+            clave = _clave(fila.get(campo))
+            ids = indice.get(clave)
+            if ids is not None:
+                ids.discard(producto_id)
+                if not ids:
+                    del indice[clave]
+        self.con_stock.discard(producto_id)
+        if self._busqueda is not None:
+            self._busqueda.remove(producto_id)
+
+    def filtrar(self, campo: str, valor: str) -> list:
+        """Productos con `campo == valor`, ordenados por nombre. Para 'stock' el valor es 'true'/'false'."""
+        if campo == "stock":
+            ids = self.con_stock if valor == "true" else self.productos.keys() - self.con_stock
+        else:
+            ids = self.indices[campo].get(_clave(valor), ())
+        productos = [self.productos[i] for i in ids]
+        productos.sort(key=lambda p: (str(p.get("name") or ""), str(p["id"])))
+        return productos
+
+    def buscar(self, texto: str, limite: int = 50) -> list:
+        """Productos por nombre o SKU, de mejor a peor; un SKU exacto va primero. Sin texto, por nombre."""
+        if not texto.strip():
+            return sorted(self.productos.values(), key=lambda p: (str(p.get("name") or ""), str(p["id"])))[:limite]
+        if self._busqueda is None:
+            self._busqueda = TrigramIndex(CAMPOS_BUSQUEDA)
+            for producto_id, fila in self.productos.items():
+                self._busqueda.add(producto_id, fila)
+        exactos = sorted(self.indices["sku"].get(_clave(texto), ()))
+        ids = exactos + [doc_id for doc_id, _, _ in self._busqueda.search(texto, limite) if doc_id not in exactos]
+        return [self.productos[i] for i in ids[:limite]]
+
+    def facetas(self, campo: str) -> list:
+        """[(valor, cantidad)] ordenado por valor, con el mismo contrato que db.facetas.contar_facetas."""
+        return sorted((valor, len(ids)) for valor, ids in self.indices[campo].items())
+
+
+async def sincronizar_catalogo(client, tenant_id, catalogo: Catalogo, tamano_pagina: int = 1000) -> int:
+    """Aplica al catálogo las filas modificadas desde su última sincronización. Devuelve cuántas llegaron.
+
+    Con un catálogo vacío equivale a la carga completa. Las páginas se recorren por
+    (updated_at, id) para que el coste no dependa del tamaño de la tabla.
+    """
+    desde = catalogo.marca - MARGEN_DELTA if catalogo.marca else None
+    ultimo = None
+    recibidas = 0
+    while True:
+        sel = client.table("products").select(", ".join(COLUMNAS_CATALOGO)).eq("tenant_id", tenant_id)
+        if desde:
+            sel = sel.gte("updated_at", desde.isoformat())
+        response = await pagina_keyset(sel, ("updated_at", "id"), ultimo, tamano_pagina).execute()
+        filas, hay_mas = recortar_pagina(response.data or [], tamano_pagina)
+        catalogo.aplicar(filas)
+        recibidas += len(filas)
+        if not hay_mas:
+            return recibidas
+        ultimo = [filas[-1]["updated_at"], filas[-1]["id"]]
@@ -0,0 +1,132 @@
+# Capa de acceso a datos asíncrona: clientes de Supabase usados por todos los handlers.
+# Las consultas se hacen con `await supabase.table(...).execute()` directamente en el
+# event loop, sin saltos a hilos. Ambos clientes comparten un único pool HTTP.
+
+import asyncio
+import logging
+import time
+
+import httpx
+from supabase import AsyncClient, AsyncClientOptions
+from supabase_auth import AsyncGoTrueClient
+
+from config import (
+    SUPABASE_URL, SUPABASE_KEY, SUPABASE_ANON_KEY, SUPABASE_TIMEOUT, AUTH_TIMEOUT, AUTH_MAX_CONCURRENT,
+)
+from utils.metricas import registro
+
+logger = logging.getLogger(__name__)
+
+latencia_supabase = registro.histograma(
+    "crm_supabase_request_seconds", "Latencia de las peticiones a Supabase", ("tabla", "operacion"))
+errores_supabase = registro.contador(
+    "crm_supabase_errors_total", "Peticiones a Supabase fallidas (HTTP >= 400 o excepción)",
+    ("tabla", "operacion", "error"))
+
+_OPERACIONES = {"GET": "select", "HEAD": "count", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+def clasificar_peticion(request: httpx.Request) -> tuple:
+    """(tabla, operación) de una petición a PostgREST (/rest/v1/...) o GoTrue (/auth/v1/...)."""
+    partes = request.url.path.strip("/").split("/")
+    if partes[:2] == ["rest", "v1"] and len(partes) > 2:
+        if partes[2] == "rpc" and len(partes) > 3:
+            return partes[3], "rpc"
+        operacion = _OPERACIONES.get(request.method, request.method.lower())
+        if operacion == "insert" and "merge-duplicates" in request.headers.get("prefer", ""):
+            operacion = "upsert"
+        return partes[2], operacion
+    if partes[:2] == ["auth", "v1"]:
+        return "auth", "/".join(partes[2:4]) or "-"
+    return "-", request.method.lower()
+
+
+class TransporteMedido(httpx.AsyncBaseTransport):
+    """Transporte httpx que mide la latencia (hasta las cabeceras) y los errores por tabla y operación."""
+
+    def __init__(self, transporte: httpx.AsyncBaseTransport):
+        self._transporte = transporte
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tabla, operacion = clasificar_peticion(request)
+        inicio = time.monotonic()
+        try:
+            response = await self._transporte.handle_async_request(request)
+        except Exception as e:
+            errores_supabase.con(tabla, operacion, type(e).__name__).inc()
+            raise
+        finally:
+            latencia_supabase.con(tabla, operacion).observar(time.monotonic() - inicio)
+        if response.status_code >= 400:
+            errores_supabase.con(tabla, operacion, str(response.status_code)).inc()
+        return response
+
+    async def aclose(self) -> None:
+        await self._transporte.aclose()
+
+# PostgREST y GoTrue envían sus cabeceras (apiKey, Authorization) en cada petición,
+# por lo que el mismo pool de conexiones puede servir a los dos roles.
+http_client = httpx.AsyncClient(
+    transport=TransporteMedido(httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )),
+    timeout=SUPABASE_TIMEOUT,
+    follow_redirects=True,
+)
+
+
+def _crear_cliente(key: str, **opciones) -> AsyncClient:
+    return AsyncClient(SUPABASE_URL, key, AsyncClientOptions(httpx_client=http_client, **opciones))
+
+
+def nuevo_cliente_auth() -> AsyncGoTrueClient:
+    """Cliente GoTrue sin persistencia sobre el pool compartido.
+
+    Guarda en memoria la última sesión que ve, así que las operaciones que dependen de
+    ella (set_session + update_user) deben usar uno propio por llamada.
+    """
+    return AsyncGoTrueClient(
+        url=f"{SUPABASE_URL.rstrip('/')}/auth/v1",
+        headers={"apiKey": SUPABASE_ANON_KEY, "Authorization": f"Bearer {SUPABASE_ANON_KEY}"},
+        auto_refresh_token=False,
+        persist_session=False,
+        http_client=http_client,
+    )
+
+
+try:
+    # Clave de servicio: sin sesión de usuario, así que no hay token que refrescar
+    supabase_admin: AsyncClient = _crear_cliente(SUPABASE_KEY, auto_refresh_token=False, persist_session=False)
+    supabase_anon: AsyncClient = _crear_cliente(SUPABASE_ANON_KEY)
+    # GoTrue sin estado para los logins: el cliente anon reescribe su cabecera Authorization
+    # con cada SIGNED_IN, así que las sesiones de usuario no deben pasar por él (ver db/sesiones.py).
+    auth_usuarios = nuevo_cliente_auth()
+except Exception as e:
+    logger.critical(f"Error fatal al inicializar los clientes asíncronos de Supabase: {e}")
+    supabase_admin = None
+    supabase_anon = None
+    auth_usuarios = None
+
+
+# GoTrue es el punto lento de los picos de login: se acota cuántas llamadas hay en vuelo
+# para que una avalancha haga cola aquí en lugar de saturar el pool HTTP compartido.
+_limite_auth = asyncio.Semaphore(AUTH_MAX_CONCURRENT)
+
+
+async def llamada_auth(funcion, *args, timeout: float | None = None):
+    """Ejecuta `await funcion(*args)` contra Supabase Auth con concurrencia acotada.
+
+    El timeout cubre la espera en cola y la petición; al vencer, la llamada se cancela
+    y se lanza asyncio.TimeoutError.
+    """
+    async def _llamar():
+        async with _limite_auth:
+            return await funcion(*args)
+
+    return await asyncio.wait_for(_llamar(), AUTH_TIMEOUT if timeout is None else timeout)
+
+
+async def cerrar_conexiones(application=None) -> None:
+    """Cierra el pool HTTP compartido. Se registra como post_shutdown de la Application."""
+    await http_client.aclose()
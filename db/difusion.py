@@ -0,0 +1,126 @@
+# Difusiones a todos los usuarios de un tenant (/broadcast).
+# Los destinatarios se leen de public.users por páginas keyset (ver db/sql/users_telegram_id.sql)
+# y el progreso de cada difusión se guarda en un SQLite local: tras un reinicio se reanuda
+# desde el último usuario confirmado en lugar de volver a escribir a todos.
+
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from config import BROADCAST_DB_PATH
+from db.paginacion import pagina_keyset, recortar_pagina
+
+EN_CURSO, TERMINADA, CANCELADA = "en_curso", "terminada", "cancelada"
+
+
+async def iterar_destinatarios(client, tenant_id, desde=None, tamano_pagina: int = 500):
+    """Genera páginas [{id, telegram_id}] de los usuarios contactables del tenant,
+    ordenadas por id y empezando después de `desde`."""
+    ultimo = [desde] if desde else None
+    while True:
+        sel = client.table("users").select("id, telegram_id") \
+            .eq("tenant_id", tenant_id) \
+            .not_.is_("telegram_id", "null") \
+            .is_("telegram_blocked_at", "null")
+        response = await pagina_keyset(sel, ("id",), ultimo, tamano_pagina).execute()
+        filas, hay_mas = recortar_pagina(response.data or [], tamano_pagina)
+        if filas:
+            yield filas
+        if not hay_mas:
+            return
+        ultimo = [filas[-1]["id"]]
+
+
+async def marcar_bloqueados(client, ids: list) -> None:
+    """Excluye de próximas difusiones a los usuarios que han bloqueado el bot."""
+    await client.table("users").update({
+        "telegram_blocked_at": datetime.now(timezone.utc).isoformat()
+    }).in_("id", ids).execute()
+
+
+class AlmacenDifusiones:
+    """Tabla SQLite de difusiones: texto, estado, cursor (último users.id confirmado) y cuentas.
+
+    `propietario` y `latido` hacen de lease: con varios workers solo uno ejecuta cada difusión.
+    """
+
+    def __init__(self, path: str = BROADCAST_DB_PATH):
+        self.path = path
+        self._conn = None
+
+    def _conexion(self) -> sqlite3.Connection:
+        # Se abre al primer uso para no crear el fichero al importar el módulo
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("pragma journal_mode = wal")
+            self._conn.execute(
+                "create table if not exists broadcast_jobs ("
+                " id integer primary key autoincrement, tenant_id text not null, autor integer not null,"
+                " texto text not null, estado text not null, cursor text,"
+                " entregados integer not null default 0, fallidos integer not null default 0,"
+                " bloqueados integer not null default 0, propietario text, latido integer,"
+                " creada integer not null, terminada integer)"
+            )
+        return self._conn
+
+    def crear(self, tenant_id, autor: int, texto: str) -> int:
+        cursor = self._conexion().execute(
+            "insert into broadcast_jobs (tenant_id, autor, texto, estado, creada) values (?, ?, ?, ?, ?)",
+            (str(tenant_id), autor, texto, EN_CURSO, int(time.time())),
+        )
+        return cursor.lastrowid
+
+    def leer(self, trabajo_id: int) -> dict | None:
+        fila = self._conexion().execute("select * from broadcast_jobs where id = ?", (trabajo_id,)).fetchone()
+        return dict(fila) if fila else None
+
+    def recientes(self, tenant_id, limite: int = 5) -> list:
+        filas = self._conexion().execute(
+            "select * from broadcast_jobs where tenant_id = ? order by id desc limit ?", (str(tenant_id), limite)
+        ).fetchall()
+        return [dict(f) for f in filas]
+
+    def pendientes(self) -> list:
+        filas = self._conexion().execute("select id from broadcast_jobs where estado = ?", (EN_CURSO,)).fetchall()
+        return [f["id"] for f in filas]
+
+    def reclamar(self, trabajo_id: int, propietario: str, caducidad: int) -> bool:
+        """Toma la difusión si no tiene dueño o si el suyo dejó de dar señales hace `caducidad` s."""
+        ahora = int(time.time())
+        cursor = self._conexion().execute(
+            "update broadcast_jobs set propietario = ?, latido = ? where id = ? and estado = ?"
+            " and (propietario is null or propietario = ? or latido < ?)",
+            (propietario, ahora, trabajo_id, EN_CURSO, propietario, ahora - caducidad),
+        )
+        return cursor.rowcount == 1
+
+    def liberar(self, propietario: str) -> None:
+        self._conexion().execute(
+            "update broadcast_jobs set propietario = null where propietario = ?", (propietario,)
+        )
+
+    def avanzar(self, trabajo_id: int, cursor, entregados: int, fallidos: int, bloqueados: int) -> str:
+        """Suma las cuentas, mueve el cursor y renueva el latido. Devuelve el estado actual
+        (otra réplica puede haberla cancelado)."""
+        conn = self._conexion()
+        conn.execute(
+            "update broadcast_jobs set cursor = coalesce(?, cursor), entregados = entregados + ?,"
+            " fallidos = fallidos + ?, bloqueados = bloqueados + ?, latido = ? where id = ?",
+            (cursor, entregados, fallidos, bloqueados, int(time.time()), trabajo_id),
+        )
+        return conn.execute("select estado from broadcast_jobs where id = ?", (trabajo_id,)).fetchone()["estado"]
+
+    def terminar(self, trabajo_id: int, estado: str = TERMINADA) -> None:
+        self._conexion().execute(
+            "update broadcast_jobs set estado = ?, propietario = null, terminada = ? where id = ? and estado = ?",
+            (estado, int(time.time()), trabajo_id, EN_CURSO),
+        )
+
+    def cerrar(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+difusiones = AlmacenDifusiones()
@@ -0,0 +1,305 @@
+# Estado de conversación compartido entre réplicas del bot (despliegue multi-instancia).
+# Los estados de ConversationHandler, user_data y chat_data viven en un almacén externo con
+# protocolo Redis en lugar de en la memoria del proceso, así que cualquier réplica puede
+# atender cualquier update del webhook:
+#   - antes de los handlers (grupo -2) se leen en un solo pipeline las claves del update;
+#   - después (grupo 99) se escriben los cambios con versionado optimista: cada clave lleva
+#     un número de versión y solo se sobrescribe si nadie la ha cambiado desde que se leyó.
+#     Si otra réplica la cambió, se relee y se aplican encima solo las claves que cambiaron aquí.
+
+import asyncio
+import json
+import logging
+import pickle
+from abc import ABC, abstractmethod
+
+from telegram import Update
+from telegram.ext import BasePersistence, ContextTypes, ConversationHandler, PersistenceInput
+
+from config import PERSISTENCE_INTERVAL, STATE_KNOWN_MAX
+from db.persistencia import CLAVES_VOLATILES, serializar_user_data
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+REINTENTOS_FUSION = 3
+
+
+class AlmacenEstado(ABC):
+    """Interfaz del almacén: valores binarios versionados por clave (versión 0 = no existe)."""
+
+    @abstractmethod
+    async def leer(self, claves: list[str]) -> dict:
+        """{clave: (versión, valor | None)} de todas las claves en un solo viaje."""
+
+    @abstractmethod
+    async def escribir(self, cambios: dict) -> set:
+        """Aplica {clave: (versión_leída, valor | None)}; None borra el valor.
+
+        Devuelve las claves en conflicto (cambiadas por otra réplica), que no se escriben.
+        """
+
+
+class AlmacenRedis(AlmacenEstado):
+    """Almacén sobre cualquier cliente compatible con redis.asyncio.
+
+    Cada clave es un hash {v: versión, d: valor}. Un borrado deja solo la versión para que
+    una réplica con una copia antigua no pueda resucitar el valor.
+    """
+
+    def __init__(self, redis, prefijo: str = "crm:", reintentos: int = 3):
+        self.redis = redis
+        self.prefijo = prefijo
+        self.reintentos = reintentos
+
+    async def _versiones(self, reales: list[str]) -> list[int]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for real in reales:
+                pipe.hget(real, "v")
+            return [int(v or 0) for v in await pipe.execute()]
+
+    async def leer(self, claves: list[str]) -> dict:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for clave in claves:
+                pipe.hmget(self.prefijo + clave, "v", "d")
+            filas = await pipe.execute()
+        return {clave: (int(v or 0), d) for clave, (v, d) in zip(claves, filas)}
+
+    async def escribir(self, cambios: dict) -> set:
+        from redis.exceptions import WatchError  # dependencia solo necesaria en modo multi-instancia
+
+        claves = list(cambios)
+        reales = [self.prefijo + clave for clave in claves]
+        for _ in range(self.reintentos):
+            async with self.redis.pipeline(transaction=True) as pipe:
+                try:
+                    # WATCH primero: si otra réplica escribe entre la lectura de versiones
+                    # y el EXEC, la transacción se descarta y se reintenta
+                    await pipe.watch(*reales)
+                    actuales = await self._versiones(reales)
+                    conflictos = {c for c, actual in zip(claves, actuales) if actual != cambios[c][0]}
+                    pipe.multi()
+                    for clave, real in zip(claves, reales):
+                        if clave in conflictos:
+                            continue
+                        version, valor = cambios[clave]
+                        if valor is None:
+                            pipe.hset(real, "v", version + 1)
+                            pipe.hdel(real, "d")
+                        else:
+                            pipe.hset(real, mapping={"v": version + 1, "d": valor})
+                    await pipe.execute()
+                    return conflictos
+                except WatchError:
+                    continue
+        logger.warning(f"Estado compartido: {len(claves)} claves no se pudieron escribir tras {self.reintentos} intentos")
+        return set(claves)
+
+
+def _clave_conversacion(handler: ConversationHandler, update: Update) -> tuple | None:
+    """Clave de la conversación como la construye ConversationHandler (per_chat/per_user/per_message)."""
+    chat, user = update.effective_chat, update.effective_user
+    clave = []
+    if handler.per_chat:
+        if chat is None:
+            return None
+        clave.append(chat.id)
+    if handler.per_user:
+        if user is None:
+            return None
+        clave.append(user.id)
+    if handler.per_message:
+        query = update.callback_query
+        if query is None:
+            return None
+        clave.append(query.inline_message_id or query.message.message_id)
+    return tuple(clave)
+
+
+def _fusionar(base: bytes | None, nuevo: bytes | None, actual: bytes | None) -> bytes | None:
+    """Aplica sobre `actual` (lo que escribió otra réplica) lo que cambió de `base` a `nuevo`.
+
+    user_data y chat_data se fusionan por clave (en la misma clave gana el cambio local);
+    un borrado o un estado de conversación se aplican tal cual.
+    """
+    if nuevo is None or actual is None:
+        return nuevo
+    previo, propio, ajeno = (pickle.loads(base) if base else {}), pickle.loads(nuevo), pickle.loads(actual)
+    if not all(isinstance(d, dict) for d in (previo, propio, ajeno)):
+        return nuevo
+    fusion = dict(ajeno)
+    for clave in previo.keys() - propio.keys():
+        fusion.pop(clave, None)
+    for clave, valor in propio.items():
+        if clave not in previo or previo[clave] != valor:
+            fusion[clave] = valor
+    return pickle.dumps(fusion)
+
+
+class PersistenciaCompartida(BasePersistence):
+    """BasePersistence sin estado local: lee por update y escribe con versionado optimista.
+
+    Se registra junto a dos TypeHandler (ver bot.py): `cargar` en el grupo -2 y `guardar`
+    en el grupo 99, para que el estado esté en el almacén antes de atender el siguiente
+    update del mismo chat, lo reciba la réplica que lo reciba.
+    """
+
+    def __init__(self, almacen: AlmacenEstado, update_interval: float = PERSISTENCE_INTERVAL,
+                 max_conocidos: int = STATE_KNOWN_MAX):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.almacen = almacen
+        # clave -> (versión, valor serializado) tal como se leyó o escribió por última vez.
+        # Acotada: cada update vuelve a leer sus claves en cargar(). Si aun así se expulsa una
+        # clave antes de escribirla, se escribe con versión 0, choca con la del almacén y se
+        # resuelve como cualquier conflicto: relectura y fusión en _volcar()
+        self._conocidos = TTLCache(maxsize=max_conocidos, ttl=None)
+        self._pendientes: dict = {}
+        self._volcado: asyncio.Task | None = None
+        self.conflictos = 0
+
+    # --- Lectura por update ---
+    def _conversaciones(self, application):
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler) and handler.persistent:
+                    yield handler
+
+    async def cargar(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Grupo -1: trae del almacén user_data, chat_data y estados de conversación del update."""
+        application = context.application
+        destinos = {}
+        if update.effective_user:
+            destinos[f"user:{update.effective_user.id}"] = application.user_data[update.effective_user.id]
+        if update.effective_chat:
+            destinos[f"chat:{update.effective_chat.id}"] = application.chat_data[update.effective_chat.id]
+        conversaciones = {}
+        for handler in self._conversaciones(application):
+            clave = _clave_conversacion(handler, update)
+            if clave is not None:
+                conversaciones[f"conv:{handler.name}:{json.dumps(list(clave))}"] = (handler, clave)
+        if not destinos and not conversaciones:
+            return
+
+        leidos = await self.almacen.leer([*destinos, *conversaciones])
+        for clave, (version, valor) in leidos.items():
+            self._conocidos.set(clave, (version, valor))
+            datos = pickle.loads(valor) if valor is not None else None
+            if clave in destinos:
+                # Las claves volátiles no están en el almacén: se conservan las de este proceso
+                volatiles = {k: destinos[clave][k] for k in CLAVES_VOLATILES if k in destinos[clave]}
+                destinos[clave].clear()
+                destinos[clave].update(datos or {})
+                destinos[clave].update(volatiles)
+            else:
+                handler, clave_conv = conversaciones[clave]
+                # Sin marcarla como escrita: es lo que ya hay en el almacén
+                if datos is None:
+                    handler._conversations.data.pop(clave_conv, None)
+                else:
+                    handler._conversations.update_no_track({clave_conv: datos})
+
+    async def guardar(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Grupo 99: escribe en el almacén lo que haya cambiado al atender el update."""
+        application = context.application
+        application.mark_data_for_update_persistence(
+            chat_ids=update.effective_chat.id if update.effective_chat else None,
+            user_ids=update.effective_user.id if update.effective_user else None,
+        )
+        await application.update_persistence()
+        if self._volcado is not None and not self._volcado.done():
+            await self._volcado
+
+    # --- Escritura diferida y agrupada ---
+    def _anotar(self, clave: str, valor: bytes | None) -> None:
+        version, anterior = self._conocidos.get(clave, (0, None))
+        if valor == anterior:
+            self._pendientes.pop(clave, None)
+            return
+        self._pendientes[clave] = valor
+        if self._volcado is None or self._volcado.done():
+            self._volcado = asyncio.create_task(self._volcar())
+
+    async def _volcar(self) -> None:
+        while self._pendientes:
+            lote, self._pendientes = self._pendientes, {}
+            # (versión, valor) sobre los que se hicieron los cambios locales
+            base = {clave: self._conocidos.get(clave, (0, None)) for clave in lote}
+            cambios = {clave: (base[clave][0], valor) for clave, valor in lote.items()}
+            try:
+                for _ in range(REINTENTOS_FUSION + 1):
+                    conflictos = await self.almacen.escribir(cambios)
+                    for clave, (version, valor) in cambios.items():
+                        if clave not in conflictos:
+                            self._conocidos.set(clave, (version + 1, valor))
+                    if not conflictos:
+                        break
+                    # Otra réplica escribió antes: se relee y se reaplican solo los cambios locales
+                    self.conflictos += len(conflictos)
+                    logger.info(f"Estado compartido: conflicto de versión en {sorted(conflictos)}; se fusiona")
+                    cambios = {}
+                    for clave, (version, actual) in (await self.almacen.leer(sorted(conflictos))).items():
+                        cambios[clave] = (version, _fusionar(base[clave][1], lote[clave], actual))
+                else:
+                    for clave in conflictos:
+                        self._conocidos.pop(clave, None)
+                    logger.error(f"Estado compartido: se descartan los cambios de {sorted(conflictos)} "
+                                 f"tras {REINTENTOS_FUSION} fusiones fallidas")
+            except Exception as e:
+                logger.error(f"Error al escribir el estado compartido ({len(lote)} claves): {e}")
+                self._pendientes = {**lote, **self._pendientes}
+                return
+
+    # --- BasePersistence ---
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._anotar(f"user:{user_id}", serializar_user_data(data))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._anotar(f"chat:{chat_id}", pickle.dumps(data))
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        clave = f"conv:{name}:{json.dumps(list(key))}"
+        self._anotar(clave, None if new_state is None else pickle.dumps(new_state))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._anotar(f"user:{user_id}", None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._anotar(f"chat:{chat_id}", None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._volcado is not None and not self._volcado.done():
+            await self._volcado
+        await self._volcar()
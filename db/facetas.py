@@ -0,0 +1,29 @@
+# Consultas de facetas (valor, nº de filas) resueltas en el servidor mediante RPC.
+# Ver db/sql/facet_counts.sql para la función de Postgres.
+
+# Columnas por las que los menús del bot permiten filtrar
+FACET_COLUMNS = {
+    "companies": ("route", "category", "city"),
+    "products": ("sku", "category", "supplier_id"),
+}
+
+
+async def contar_facetas(client, tabla: str, campo: str, tenant_id=None) -> list:
+    """Devuelve [(valor, cantidad), ...] ordenado por valor para `tabla.campo`.
+
+    `client` es el cliente asíncrono de Supabase o cualquier objeto con la misma interfaz
+    `rpc()` (por ejemplo, db.local.LocalDB en los tests).
+    """
+    if campo not in FACET_COLUMNS.get(tabla, ()):
+        raise ValueError(f"Faceta no permitida: {tabla}.{campo}")
+    response = await client.rpc("facet_counts", {
+        "p_table": tabla,
+        "p_column": campo,
+        "p_tenant_id": tenant_id,
+    }).execute()
+    return [(str(f["value"]), int(f["count"])) for f in (response.data or [])]
+
+
+def etiqueta_faceta(valor, cantidad: int) -> str:
+    """Texto del botón de una faceta, p. ej. 'Madrid (42)'."""
+    return f"{valor} ({cantidad})"
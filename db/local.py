@@ -0,0 +1,203 @@
+# Sustituto local (SQLite) de Supabase para tests y pruebas de carga.
+# Implementa el mismo contrato que las funciones RPC de db/sql/ para que el código
+# que recibe un `client` pueda ejecutarse sin red.
+
+import json
+import sqlite3
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+ESQUEMA = """
+create table if not exists companies (
+    id text primary key,
+    tenant_id text not null,
+    client_name text,
+    city text,
+    route text,
+    category text,
+    contact_person text,
+    phone text,
+    address text
+);
+create table if not exists products (
+    id text primary key,
+    tenant_id text,
+    sku text,
+    name text,
+    description text,
+    category text,
+    supplier_id text,
+    price real default 0,
+    stock integer default 0,
+    image_url text,
+    image_file_id text,
+    image_file_url text,
+    updated_at text
+);
+create table if not exists invoices (
+    id text primary key,
+    tenant_id text,
+    company_id text,
+    invoice_number text,
+    issue_date text,
+    due_date text,
+    status text,
+    total_amount real default 0
+);
+create table if not exists invoice_items (
+    id text primary key,
+    invoice_id text not null,
+    product_id text not null,
+    quantity integer not null,
+    unit_price real not null,
+    subtotal real not null
+);
+create table if not exists sales_rollups (
+    tenant_id text not null,
+    period text not null,
+    dimension text not null,
+    key text not null,
+    label text,
+    amount real not null default 0,
+    quantity integer not null default 0,
+    invoices integer not null default 0,
+    primary key (tenant_id, period, dimension, key)
+);
+"""
+
+# Clave y etiqueta de cada dimensión del rollup (ver db/sql/sales_rollups.sql)
+DIMENSIONES_ROLLUP = {
+    "route": ("coalesce(c.route, '')", "c.route"),
+    "category": ("coalesce(p.category, '')", "p.category"),
+    "product": ("p.id", "p.name"),
+    "total": ("''", "null"),
+}
+
+
+class _Respuesta:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Llamada:
+    """Imita el builder asíncrono de supabase-py: la consulta se ejecuta al esperar execute()."""
+
+    def __init__(self, funcion, params):
+        self._funcion = funcion
+        self._params = params
+
+    async def execute(self):
+        return _Respuesta(self._funcion(**self._params))
+
+
+class LocalDB:
+    """Base de datos SQLite con la interfaz `rpc(nombre, params).execute()` de Supabase."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.conn.executescript(ESQUEMA)
+
+    def insertar(self, tabla: str, filas: list) -> list:
+        """Inserta filas (dicts) en `tabla`, generando `id` si falta. Devuelve las filas."""
+        filas = [dict(f, id=f.get("id") or str(uuid.uuid4())) for f in filas]
+        if not filas:
+            return filas
+        columnas = list(filas[0].keys())
+        sql = f"insert into {tabla} ({', '.join(columnas)}) values ({', '.join('?' for _ in columnas)})"
+        with self._lock, self.conn:
+            self.conn.executemany(sql, [[f.get(c) for c in columnas] for f in filas])
+            if tabla == "invoice_items":
+                self._acumular_ventas([f["id"] for f in filas])
+        return filas
+
+    def _acumular_ventas(self, ids_lineas: list) -> None:
+        """Equivalente al trigger por sentencia de sales_rollups; se llama dentro de la transacción."""
+        for dimension, (clave, etiqueta) in DIMENSIONES_ROLLUP.items():
+            self.conn.execute(
+                "insert into sales_rollups (tenant_id, period, dimension, key, label, amount, quantity, invoices) "
+                f"select i.tenant_id, substr(i.issue_date, 1, 7) || '-01', ?, {clave}, max({etiqueta}), "
+                "sum(n.subtotal), sum(n.quantity), count(distinct n.invoice_id) "
+                "from invoice_items n join invoices i on i.id = n.invoice_id "
+                "join companies c on c.id = i.company_id join products p on p.id = n.product_id "
+                "where n.id in (select value from json_each(?)) and i.tenant_id is not null "
+                "group by 1, 2, 3, 4 "
+                "on conflict (tenant_id, period, dimension, key) do update set "
+                "amount = amount + excluded.amount, quantity = quantity + excluded.quantity, "
+                "invoices = invoices + excluded.invoices, label = coalesce(excluded.label, label)",
+                (dimension, json.dumps(ids_lineas)),
+            )
+
+    def rpc(self, nombre: str, params: dict = None) -> _Llamada:
+        funcion = getattr(self, f"_rpc_{nombre}", None)
+        if funcion is None:
+            raise ValueError(f"Función RPC desconocida: {nombre}")
+        return _Llamada(funcion, params or {})
+
+    # --- Funciones RPC (mismo contrato que db/sql/*.sql) ---
+
+    def _rpc_facet_counts(self, p_table, p_column, p_tenant_id=None):
+        from db.facetas import FACET_COLUMNS
+        if p_column not in FACET_COLUMNS.get(p_table, ()):
+            raise ValueError(f"Faceta no permitida: {p_table}.{p_column}")
+        sql = (
+            f"select cast({p_column} as text) as value, count(*) as count from {p_table} "
+            f"where {p_column} is not null and trim(cast({p_column} as text)) <> '' "
+            "and (? is null or tenant_id = ?) group by 1 order by 1"
+        )
+        with self._lock:
+            filas = self.conn.execute(sql, (p_tenant_id, p_tenant_id)).fetchall()
+        return [dict(f) for f in filas]
+
+    def _rpc_create_sale(self, p_tenant_id, p_company_id, p_items, p_status="Pendiente"):
+        cantidades = Counter()
+        for item in p_items:
+            if int(item.get("quantity") or 0) <= 0:
+                raise ValueError("Las cantidades deben ser mayores que cero")
+            cantidades[item["product_id"]] += int(item["quantity"])
+        if not cantidades:
+            raise ValueError("La venta no tiene líneas")
+
+        with self._lock, self.conn:
+            if self.conn.execute("select 1 from companies where id = ? and tenant_id = ?",
+                                 (p_company_id, p_tenant_id)).fetchone() is None:
+                raise ValueError("Cliente no encontrado")
+            marcas = ",".join("?" for _ in cantidades)
+            productos = {
+                f["id"]: f for f in self.conn.execute(
+                    f"select id, name, price, stock from products where tenant_id = ? and id in ({marcas})",
+                    (p_tenant_id, *cantidades),
+                )
+            }
+            if len(productos) != len(cantidades):
+                raise ValueError("Alguno de los productos no existe")
+            sin_stock = [productos[i]["name"] for i, n in cantidades.items() if (productos[i]["stock"] or 0) < n]
+            if sin_stock:
+                raise ValueError(f"Stock insuficiente: {', '.join(sin_stock)}")
+
+            ahora = datetime.now()
+            numero = self.conn.execute("select count(*) from invoices").fetchone()[0] + 1
+            factura = {
+                "invoice_id": str(uuid.uuid4()),
+                "invoice_number": f"FACT-{ahora.year}-{numero:06d}",
+                "total_amount": sum(n * productos[i]["price"] for i, n in cantidades.items()),
+            }
+            self.conn.execute(
+                "insert into invoices (id, tenant_id, company_id, invoice_number, issue_date, due_date, status, total_amount) "
+                "values (?, ?, ?, ?, ?, ?, ?, ?)",
+                (factura["invoice_id"], p_tenant_id, p_company_id, factura["invoice_number"], ahora.isoformat(),
+                 (ahora + timedelta(days=30)).isoformat(), p_status, factura["total_amount"]),
+            )
+            lineas = [(str(uuid.uuid4()), factura["invoice_id"], i, n, productos[i]["price"], n * productos[i]["price"])
+                      for i, n in cantidades.items()]
+            self.conn.executemany(
+                "insert into invoice_items (id, invoice_id, product_id, quantity, unit_price, subtotal) values (?, ?, ?, ?, ?, ?)",
+                lineas,
+            )
+            self._acumular_ventas([l[0] for l in lineas])
+            self.conn.executemany("update products set stock = stock - ? where id = ?",
+                                  [(n, i) for i, n in cantidades.items()])
+        return [factura]
@@ -0,0 +1,44 @@
+# Paginación por clave (keyset) sobre los builders de PostgREST/Supabase.
+# En lugar de OFFSET se filtra por "(col1, col2, ...) > último valor visto", de modo
+# que cada página cuesta lo mismo sin importar lo lejos que esté del principio.
+
+
+def _literal(valor) -> str:
+    """Cita un valor para los filtros `or=` de PostgREST (comas, puntos y paréntesis son reservados)."""
+    texto = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{texto}"'
+
+
+def filtro_keyset(columnas, valores, operador: str = "gt") -> str:
+    """Construye la comparación de tuplas (a, b) > (x, y) como filtro `or=` de PostgREST.
+
+    Para dos columnas devuelve: a.gt."x",and(a.eq."x",b.gt."y")
+    """
+    condiciones = []
+    for i, columna in enumerate(columnas):
+        iguales = [f"{c}.eq.{_literal(v)}" for c, v in zip(columnas[:i], valores[:i])]
+        actual = f"{columna}.{operador}.{_literal(valores[i])}"
+        condiciones.append(f"and({','.join(iguales + [actual])})" if iguales else actual)
+    return ",".join(condiciones)
+
+
+def pagina_keyset(query, columnas, cursor=None, limite: int = 20, hacia_atras: bool = False):
+    """Aplica orden, filtro keyset y límite a un builder de select.
+
+    Se pide una fila de más para saber si existe otra página en esa dirección
+    (ver `recortar_pagina`). Con `hacia_atras` el orden se invierte.
+    """
+    if cursor:
+        query = query.or_(filtro_keyset(columnas, cursor, "lt" if hacia_atras else "gt"))
+    for columna in columnas:
+        query = query.order(columna, desc=hacia_atras)
+    return query.limit(limite + 1)
+
+
+def recortar_pagina(filas: list, limite: int, hacia_atras: bool = False):
+    """Devuelve (filas de la página en orden ascendente, hay_mas_en_esa_direccion)."""
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    if hacia_atras:
+        filas.reverse()
+    return filas, hay_mas
@@ -0,0 +1,190 @@
+# Persistencia de python-telegram-bot sobre SQLite (WAL) con escritura diferida.
+# La Application llama a update_* cada `update_interval` segundos con los chats/usuarios
+# modificados; aquí solo se anotan en memoria (los cambios repetidos de una misma clave se
+# quedan en el último) y se vuelcan todos juntos en una única transacción en un hilo,
+# de modo que ningún update espera a un fsync.
+
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import PERSISTENCE_DB_PATH, PERSISTENCE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_BORRAR = object()
+
+# Claves de user_data que nunca salen del proceso (ni a SQLite ni al almacén compartido):
+# los tokens de la recuperación de contraseña solo hacen falta entre dos mensajes seguidos
+# (con varias réplicas, si el segundo lo atiende otra, se pide repetir /resetpassword)
+CLAVES_VOLATILES = frozenset({"reset_access_token", "reset_refresh_token"})
+
+_ESQUEMA = """
+create table if not exists user_data (id integer primary key, data blob not null);
+create table if not exists chat_data (id integer primary key, data blob not null);
+create table if not exists bot_data (id integer primary key, data blob not null);
+create table if not exists callback_data (id integer primary key, data blob not null);
+create table if not exists conversations (
+    name text not null, key text not null, state blob not null, primary key (name, key)
+);
+"""
+
+
+def serializar_user_data(data: dict) -> bytes:
+    """pickle de user_data sin las CLAVES_VOLATILES."""
+    return pickle.dumps({k: v for k, v in data.items() if k not in CLAVES_VOLATILES})
+
+
+def ruta_por_worker(path: str, indice: int) -> str:
+    """persistencia.sqlite3 -> persistencia-w<indice>.sqlite3: un fichero por worker del webhook."""
+    base, extension = os.path.splitext(path)
+    return f"{base}-w{indice}{extension}"
+
+
+class PersistenciaSQLite(BasePersistence):
+    """BasePersistence en un fichero SQLite; user_data, chat_data y estados de conversación."""
+
+    def __init__(self, path: str = PERSISTENCE_DB_PATH, store_data: PersistenceInput | None = None,
+                 update_interval: float = PERSISTENCE_INTERVAL):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.path = path
+        self._conn = None
+        # (tabla, clave) -> valor serializado o _BORRAR
+        self._pendientes: dict = {}
+        self._volcado: asyncio.Task | None = None
+        self.volcados = 0
+
+    # --- SQLite ---
+    def _conexion(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                # Solo legible por el usuario del proceso; SQLite crea -wal y -shm con los mismos permisos
+                os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+                os.chmod(self.path, 0o600)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("pragma journal_mode = wal")
+            # Con WAL, synchronous=normal no arriesga la consistencia, solo la última transacción
+            self._conn.execute("pragma synchronous = normal")
+            self._conn.executescript(_ESQUEMA)
+        return self._conn
+
+    def _leer_tabla(self, tabla: str) -> dict:
+        return {fila[0]: pickle.loads(fila[1]) for fila in self._conexion().execute(f"select id, data from {tabla}")}
+
+    def _leer_uno(self, tabla: str):
+        fila = self._conexion().execute(f"select data from {tabla} where id = 0").fetchone()
+        return pickle.loads(fila[0]) if fila else None
+
+    def _escribir(self, lote: dict) -> None:
+        conn = self._conexion()
+        altas, bajas = {}, {}
+        for (tabla, clave), valor in lote.items():
+            (bajas if valor is _BORRAR else altas).setdefault(tabla, []).append((clave, valor))
+        conn.execute("begin")
+        try:
+            for tabla, filas in altas.items():
+                if tabla == "conversations":
+                    conn.executemany("insert or replace into conversations values (?, ?, ?)",
+                                     [(nombre, clave, valor) for (nombre, clave), valor in filas])
+                else:
+                    conn.executemany(f"insert or replace into {tabla} values (?, ?)", filas)
+            for tabla, filas in bajas.items():
+                if tabla == "conversations":
+                    conn.executemany("delete from conversations where name = ? and key = ?",
+                                     [clave for clave, _ in filas])
+                else:
+                    conn.executemany(f"delete from {tabla} where id = ?", [(clave,) for clave, _ in filas])
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+
+    # --- Escritura diferida ---
+    def _anotar(self, tabla: str, clave, valor) -> None:
+        self._pendientes[(tabla, clave)] = valor
+        if self._volcado is None or self._volcado.done():
+            self._volcado = asyncio.create_task(self._volcar())
+
+    async def _volcar(self) -> None:
+        # La tarea arranca después de las demás update_* de la misma pasada de la Application,
+        # así que recoge todo el lote de golpe
+        while self._pendientes:
+            lote, self._pendientes = self._pendientes, {}
+            try:
+                await asyncio.to_thread(self._escribir, lote)
+                self.volcados += 1
+            except Exception as e:
+                logger.error(f"Error al volcar la persistencia ({len(lote)} cambios): {e}")
+                # Se reintentan en el siguiente volcado, sin pisar cambios más recientes
+                self._pendientes = {**lote, **self._pendientes}
+                return
+
+    # --- Lectura (solo al arrancar la Application) ---
+    async def get_user_data(self) -> dict:
+        datos = self._leer_tabla("user_data")
+        for user_id, data in datos.items():
+            if CLAVES_VOLATILES & data.keys():
+                # Guardadas por una versión anterior: se descartan y se reescribe la fila
+                for clave in CLAVES_VOLATILES:
+                    data.pop(clave, None)
+                self._anotar("user_data", user_id, serializar_user_data(data))
+        return datos
+
+    async def get_chat_data(self) -> dict:
+        return self._leer_tabla("chat_data")
+
+    async def get_bot_data(self) -> dict:
+        return self._leer_uno("bot_data") or {}
+
+    async def get_callback_data(self):
+        return self._leer_uno("callback_data")
+
+    async def get_conversations(self, name: str) -> dict:
+        filas = self._conexion().execute("select key, state from conversations where name = ?", (name,))
+        return {tuple(json.loads(clave)): pickle.loads(estado) for clave, estado in filas}
+
+    # --- Escritura ---
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._anotar("user_data", user_id, serializar_user_data(data))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._anotar("chat_data", chat_id, pickle.dumps(data))
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._anotar("bot_data", 0, pickle.dumps(data))
+
+    async def update_callback_data(self, data) -> None:
+        self._anotar("callback_data", 0, pickle.dumps(data))
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        clave = (name, json.dumps(list(key)))
+        self._anotar("conversations", clave, _BORRAR if new_state is None else pickle.dumps(new_state))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._anotar("user_data", user_id, _BORRAR)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._anotar("chat_data", chat_id, _BORRAR)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Vuelca lo pendiente y cierra el fichero (la Application lo llama al parar)."""
+        if self._volcado is not None and not self._volcado.done():
+            await self._volcado
+        await self._volcar()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,264 @@
+# Pool de sesiones PostgREST por usuario de Telegram.
+# Cada usuario autenticado tiene su propio AsyncPostgrestClient con su JWT en la cabecera
+# Authorization, de modo que las consultas con RLS de distintos usuarios pueden ir en
+# paralelo sin pisarse el token. Todos los clientes comparten db.conexion.http_client.
+# AlmacenSesiones guarda en un SQLite local la relación usuario de Telegram -> tenant y
+# sus tokens, para que tras un reinicio los usuarios activos no tengan que volver a entrar.
+# Los tokens solo se escriben cifrados (SESSION_ENCRYPTION_KEY); sin clave se guarda el
+# tenant y los handlers usan el cliente de servicio hasta el siguiente login.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+from postgrest import AsyncPostgrestClient
+
+from config import (
+    SUPABASE_URL, SUPABASE_ANON_KEY, SESSION_POOL_SIZE, SESSION_REFRESH_MARGIN, SESSION_DB_PATH, SESSION_MAX_AGE,
+    SESSION_ENCRYPTION_KEY,
+)
+from db import conexion
+
+logger = logging.getLogger(__name__)
+
+
+class SesionUsuario:
+    """Cliente PostgREST de un usuario junto con los tokens de su sesión."""
+
+    __slots__ = ("client", "access_token", "refresh_token", "expira", "lock")
+
+    def __init__(self, client, refresh_token, expira, access_token=None):
+        self.client = client
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expira = expira
+        self.lock = asyncio.Lock()
+
+
+class AlmacenSesiones:
+    """Tabla SQLite compacta telegram_user_id -> tenant, usuario de Auth y tokens.
+
+    Las operaciones son lecturas/escrituras de una fila por clave primaria (microsegundos),
+    así que se hacen directamente desde el event loop, como en db/local.py.
+    Los tokens se cifran con `clave` (Fernet); sin clave no se persisten.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, clave: str | bytes | None = SESSION_ENCRYPTION_KEY):
+        self.path = path
+        self._conn = None
+        self._fernet = None
+        if clave:
+            from cryptography.fernet import Fernet  # dependencia solo necesaria para persistir tokens
+            self._fernet = Fernet(clave)
+
+    def _cifrar(self, token):
+        if self._fernet is None or not token:
+            return None
+        return self._fernet.encrypt(token.encode()).decode()
+
+    def _descifrar(self, valor):
+        if self._fernet is None or not valor:
+            return None
+        from cryptography.fernet import InvalidToken
+        try:
+            return self._fernet.decrypt(valor.encode()).decode()
+        except InvalidToken:
+            # Cifrado con otra clave (rotada): el usuario tendrá que volver a entrar
+            return None
+
+    def _conexion(self) -> sqlite3.Connection:
+        # Se abre al primer uso para no crear el fichero al importar el módulo
+        if self._conn is None:
+            if self.path != ":memory:":
+                # Solo legible por el usuario del proceso; SQLite crea -wal y -shm con los mismos permisos
+                os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+                os.chmod(self.path, 0o600)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("pragma journal_mode = wal")
+            self._conn.execute(
+                "create table if not exists bot_sessions ("
+                " telegram_user_id integer primary key, tenant_id text not null, auth_user_id text,"
+                " access_token text, refresh_token text, expires_at integer, created_at integer not null)"
+            )
+            # Tokens en claro de versiones anteriores (los de Fernet empiezan por gAAAAA)
+            self._conn.execute(
+                "update bot_sessions set access_token = null, refresh_token = null"
+                " where access_token is not null and access_token not like 'gAAAAA%'"
+            )
+        return self._conn
+
+    def guardar(self, user_id: int, tenant_id, auth_user_id, access_token, refresh_token, expira) -> None:
+        self._conexion().execute(
+            "insert or replace into bot_sessions values (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, tenant_id, auth_user_id, self._cifrar(access_token), self._cifrar(refresh_token), expira,
+             int(time.time())),
+        )
+
+    def actualizar_tokens(self, user_id: int, access_token, refresh_token, expira) -> None:
+        self._conexion().execute(
+            "update bot_sessions set access_token = ?, refresh_token = ?, expires_at = ? where telegram_user_id = ?",
+            (self._cifrar(access_token), self._cifrar(refresh_token), expira, user_id),
+        )
+
+    def leer(self, user_id: int) -> dict | None:
+        fila = self._conexion().execute(
+            "select * from bot_sessions where telegram_user_id = ?", (user_id,)
+        ).fetchone()
+        if fila is None:
+            return None
+        fila = dict(fila)
+        fila["access_token"] = self._descifrar(fila["access_token"])
+        fila["refresh_token"] = self._descifrar(fila["refresh_token"])
+        return fila
+
+    def borrar(self, user_id: int) -> None:
+        self._conexion().execute("delete from bot_sessions where telegram_user_id = ?", (user_id,))
+
+    def cerrar(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+async def _refrescar_en_gotrue(refresh_token):
+    respuesta = await conexion.llamada_auth(conexion.auth_usuarios.refresh_session, refresh_token)
+    return respuesta.session
+
+
+class PoolSesiones:
+    """LRU de sesiones PostgREST por user_id de Telegram con refresco del token antes de expirar."""
+
+    def __init__(self, maximo: int = SESSION_POOL_SIZE, margen: int = SESSION_REFRESH_MARGIN,
+                 refrescar=_refrescar_en_gotrue, http_client=None, almacen: AlmacenSesiones | None = None,
+                 max_edad: int = SESSION_MAX_AGE):
+        self.maximo = maximo
+        self.margen = margen
+        self._refrescar = refrescar
+        self._http_client = http_client
+        self.almacen = almacen
+        self.max_edad = max_edad
+        self._sesiones: "OrderedDict[int, SesionUsuario]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._sesiones)
+
+    def __contains__(self, user_id):
+        return user_id in self._sesiones
+
+    def _nuevo_cliente(self, access_token: str) -> AsyncPostgrestClient:
+        return AsyncPostgrestClient(
+            f"{SUPABASE_URL.rstrip('/')}/rest/v1",
+            headers={
+                "apiKey": SUPABASE_ANON_KEY,
+                "Authorization": f"Bearer {access_token}",
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+            },
+            http_client=self._http_client or conexion.http_client,
+        )
+
+    def _registrar(self, user_id: int, access_token, refresh_token, expira) -> AsyncPostgrestClient:
+        sesion = SesionUsuario(self._nuevo_cliente(access_token), refresh_token, expira, access_token)
+        self._sesiones[user_id] = sesion
+        self._sesiones.move_to_end(user_id)
+        while len(self._sesiones) > self.maximo:
+            self._sesiones.popitem(last=False)
+        return sesion.client
+
+    def abrir(self, user_id: int, session) -> AsyncPostgrestClient:
+        """Registra la sesión de GoTrue de un usuario y devuelve su cliente PostgREST."""
+        return self._registrar(user_id, session.access_token, session.refresh_token, session.expires_at)
+
+    def guardar(self, user_id: int, tenant_id, auth_user_id) -> None:
+        """Persiste la sesión abierta del usuario para restaurarla tras un reinicio."""
+        sesion = self._sesiones.get(user_id)
+        if self.almacen is None or sesion is None:
+            return
+        self.almacen.guardar(user_id, tenant_id, auth_user_id, sesion.access_token, sesion.refresh_token, sesion.expira)
+
+    def restaurar(self, user_id: int) -> dict | None:
+        """Recupera del almacén la sesión de un usuario sin llamadas de red.
+
+        La caducidad se comprueba en local: un JWT vencido se deja en el pool para que
+        cliente() lo refresque al primer uso; un login más antiguo que max_edad se descarta.
+        """
+        if self.almacen is None:
+            return None
+        fila = self.almacen.leer(user_id)
+        if fila is None:
+            return None
+        if time.time() - fila["created_at"] > self.max_edad:
+            self.almacen.borrar(user_id)
+            return None
+        if user_id not in self._sesiones and fila["access_token"]:
+            self._registrar(user_id, fila["access_token"], fila["refresh_token"], fila["expires_at"])
+        return {"tenant_id": fila["tenant_id"], "auth_user_id": fila["auth_user_id"]}
+
+    def cerrar(self, user_id: int) -> None:
+        self._sesiones.pop(user_id, None)
+        if self.almacen is not None:
+            self.almacen.borrar(user_id)
+
+    async def cliente_de(self, user_id: int, respaldo):
+        """Cliente con el JWT del usuario (consultas bajo RLS) o `respaldo` si no tiene sesión viva.
+
+        Los handlers filtran siempre por tenant_id, así que el respaldo (clave de servicio)
+        solo cubre sesiones que no se pudieron restaurar ni refrescar.
+        """
+        try:
+            client = await self.cliente(user_id)
+        except Exception as e:
+            logger.warning(f"No se pudo obtener la sesión del usuario {user_id}: {e}")
+            client = None
+        if client is None:
+            logger.debug(f"Usuario {user_id} sin sesión propia: se usa el cliente de servicio")
+        return client or respaldo
+
+    async def cliente(self, user_id: int) -> AsyncPostgrestClient | None:
+        """Cliente PostgREST del usuario, refrescando el token si está a punto de caducar.
+
+        Devuelve None si no hay sesión o si no se pudo renovar (hay que iniciar sesión de nuevo).
+        """
+        sesion = self._sesiones.get(user_id)
+        if sesion is None and self.restaurar(user_id) is not None:
+            # Expulsada del LRU (o tras un reinicio) pero aún guardada en el almacén
+            sesion = self._sesiones.get(user_id)
+        if sesion is None:
+            return None
+        self._sesiones.move_to_end(user_id)
+        if not sesion.expira or sesion.expira - time.time() > self.margen:
+            return sesion.client
+
+        # Un único refresco por usuario aunque lleguen varias peticiones a la vez
+        async with sesion.lock:
+            if sesion.expira - time.time() > self.margen:
+                return sesion.client
+            try:
+                nueva = await self._refrescar(sesion.refresh_token)
+            except asyncio.TimeoutError:
+                # GoTrue no responde: se sigue con el token actual mientras no haya caducado
+                if sesion.expira > time.time():
+                    return sesion.client
+                raise
+            except Exception as e:
+                logger.warning(f"No se pudo refrescar la sesión del usuario {user_id}: {e}")
+                nueva = None
+            if nueva is None:
+                self.cerrar(user_id)
+                return None
+            sesion.client.auth(nueva.access_token)
+            sesion.access_token = nueva.access_token
+            sesion.refresh_token = nueva.refresh_token
+            sesion.expira = nueva.expires_at
+            if self.almacen is not None:
+                # GoTrue rota el refresh token: el guardado deja de valer
+                self.almacen.actualizar_tokens(user_id, nueva.access_token, nueva.refresh_token, nueva.expires_at)
+            return sesion.client
+
+
+# Pool compartido por todos los handlers
+sesiones = PoolSesiones(almacen=AlmacenSesiones())
@@ -0,0 +1,90 @@
+-- Alta de una venta completa en una sola transacción (un único round trip vía RPC):
+-- cabecera de la factura, todas sus líneas, el total y el descuento de stock.
+-- Se invoca con supabase.rpc('create_sale', {p_tenant_id, p_company_id, p_items}),
+-- donde p_items es [{"product_id": ..., "quantity": n}, ...]. Los precios se toman
+-- de products, no del cliente. Si falta stock de algún producto no se escribe nada.
+
+alter table public.invoices add column if not exists tenant_id uuid;
+create index if not exists invoices_tenant_issue_date_idx on public.invoices (tenant_id, issue_date);
+create sequence if not exists public.invoice_number_seq;
+
+create or replace function public.create_sale(
+    p_tenant_id uuid,
+    p_company_id uuid,
+    p_items jsonb,
+    p_status text default 'Pendiente'
+)
+returns table (invoice_id uuid, invoice_number text, total_amount numeric)
+language plpgsql
+volatile
+security invoker
+as $$
+#variable_conflict use_column
+declare
+    v_lineas int;
+    v_encontrados int;
+    v_total numeric;
+    v_sin_stock text;
+    v_invoice_id uuid;
+    v_number text;
+begin
+    select count(*) into v_lineas
+      from (select distinct x.product_id from jsonb_to_recordset(p_items) as x(product_id uuid, quantity int)) l;
+    if v_lineas = 0 then
+        raise exception 'La venta no tiene líneas';
+    end if;
+    if exists (select 1 from jsonb_to_recordset(p_items) as x(product_id uuid, quantity int) where coalesce(x.quantity, 0) <= 0) then
+        raise exception 'Las cantidades deben ser mayores que cero';
+    end if;
+    if not exists (select 1 from public.companies c where c.id = p_company_id and c.tenant_id = p_tenant_id) then
+        raise exception 'Cliente no encontrado';
+    end if;
+
+    -- Se bloquean los productos en orden de id para que dos ventas simultáneas no se interbloqueen
+    perform 1
+       from public.products p
+      where p.tenant_id = p_tenant_id
+        and p.id in (select x.product_id from jsonb_to_recordset(p_items) as x(product_id uuid, quantity int))
+      order by p.id
+        for update;
+
+    select count(*), sum(l.quantity * p.price), string_agg(p.name, ', ') filter (where p.stock < l.quantity)
+      into v_encontrados, v_total, v_sin_stock
+      from (select x.product_id, sum(x.quantity) as quantity
+              from jsonb_to_recordset(p_items) as x(product_id uuid, quantity int)
+             group by x.product_id) l
+      join public.products p on p.id = l.product_id and p.tenant_id = p_tenant_id;
+
+    if v_encontrados <> v_lineas then
+        raise exception 'Alguno de los productos no existe';
+    end if;
+    if v_sin_stock is not null then
+        raise exception 'Stock insuficiente: %', v_sin_stock;
+    end if;
+
+    v_number := format('FACT-%s-%s', extract(year from now())::int, lpad(nextval('public.invoice_number_seq')::text, 6, '0'));
+
+    insert into public.invoices (tenant_id, company_id, invoice_number, issue_date, due_date, status, total_amount)
+    values (p_tenant_id, p_company_id, v_number, now(), now() + interval '30 days', p_status, v_total)
+    returning id into v_invoice_id;
+
+    insert into public.invoice_items (invoice_id, product_id, quantity, unit_price, subtotal)
+    select v_invoice_id, l.product_id, l.quantity, p.price, l.quantity * p.price
+      from (select x.product_id, sum(x.quantity) as quantity
+              from jsonb_to_recordset(p_items) as x(product_id uuid, quantity int)
+             group by x.product_id) l
+      join public.products p on p.id = l.product_id and p.tenant_id = p_tenant_id;
+
+    update public.products p
+       set stock = p.stock - l.quantity
+      from (select x.product_id, sum(x.quantity) as quantity
+              from jsonb_to_recordset(p_items) as x(product_id uuid, quantity int)
+             group by x.product_id) l
+     where p.id = l.product_id
+       and p.tenant_id = p_tenant_id;
+
+    return query select v_invoice_id, v_number, v_total;
+end;
+$$;
+
+grant execute on function public.create_sale(uuid, uuid, jsonb, text) to authenticated, service_role;
@@ -0,0 +1,43 @@
+-- Facetas agrupadas (valor, nº de filas) para los menús de filtro del bot.
+-- Se invoca vía RPC: supabase.rpc('facet_counts', {p_table, p_column, p_tenant_id}).
+-- Solo se aceptan las columnas usadas por los filtros para que el SQL dinámico sea seguro.
+
+create or replace function public.facet_counts(
+    p_table text,
+    p_column text,
+    p_tenant_id uuid default null
+)
+returns table (value text, count bigint)
+language plpgsql
+stable
+security invoker
+as $$
+begin
+    if not (
+        (p_table = 'companies' and p_column in ('route', 'category', 'city'))
+        or (p_table = 'products' and p_column in ('sku', 'category', 'supplier_id'))
+    ) then
+        raise exception 'Faceta no permitida: %.%', p_table, p_column;
+    end if;
+
+    return query execute format(
+        'select %1$I::text, count(*)
+           from public.%2$I
+          where %1$I is not null
+            and btrim(%1$I::text) <> ''''
+            and ($1 is null or tenant_id = $1)
+          group by 1
+          order by 1',
+        p_column, p_table
+    ) using p_tenant_id;
+end;
+$$;
+
+grant execute on function public.facet_counts(text, text, uuid) to anon, authenticated, service_role;
+
+-- Índices que permiten resolver el group by con un index-only scan por tenant.
+create index if not exists companies_tenant_route_idx on public.companies (tenant_id, route);
+create index if not exists companies_tenant_category_idx on public.companies (tenant_id, category);
+create index if not exists companies_tenant_city_idx on public.companies (tenant_id, city);
+create index if not exists products_tenant_category_idx on public.products (tenant_id, category);
+create index if not exists products_tenant_supplier_idx on public.products (tenant_id, supplier_id);
@@ -0,0 +1,26 @@
+-- file_id de Telegram de la foto de cada producto, para reenviarla sin que Telegram
+-- vuelva a descargar image_url. image_file_url guarda la URL de la que se obtuvo:
+-- si image_url cambia, el file_id deja de ser válido y el bot sube la imagen nueva.
+
+alter table public.products
+    add column if not exists image_file_id text,
+    add column if not exists image_file_url text;
+
+-- Al cambiar la imagen se descarta el file_id antiguo.
+create or replace function public.products_reset_image_file_id()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.image_url is distinct from old.image_url then
+        new.image_file_id := null;
+        new.image_file_url := null;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists products_reset_image_file_id on public.products;
+create trigger products_reset_image_file_id
+    before update of image_url on public.products
+    for each row execute function public.products_reset_image_file_id();
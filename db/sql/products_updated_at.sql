@@ -0,0 +1,23 @@
+-- Marca de última modificación en products para la sincronización incremental del
+-- catálogo en memoria del bot (db/catalogo.py): se piden solo las filas con
+-- updated_at posterior a la última sincronización, paginadas por (updated_at, id).
+
+alter table public.products
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists products_set_updated_at on public.products;
+create trigger products_set_updated_at
+    before update on public.products
+    for each row execute function public.set_updated_at();
+
+create index if not exists products_tenant_updated_at_idx on public.products (tenant_id, updated_at, id);
@@ -0,0 +1,117 @@
+-- Agregados de ventas por tenant × mes × dimensión (ruta, categoría, producto y total),
+-- mantenidos de forma incremental al insertar líneas de factura. El informe
+-- "Consulta Venta" del bot lee solo esta tabla, así su coste no crece con el histórico.
+
+create table if not exists public.sales_rollups (
+    tenant_id uuid not null,
+    period date not null,              -- primer día del mes
+    dimension text not null,           -- 'route' | 'category' | 'product' | 'total'
+    key text not null,                 -- valor de la dimensión ('' para 'total')
+    label text,                        -- texto a mostrar (nombre del producto, etc.)
+    amount numeric not null default 0,
+    quantity bigint not null default 0,
+    invoices bigint not null default 0,
+    primary key (tenant_id, period, dimension, key)
+);
+
+create index if not exists sales_rollups_ranking_idx
+    on public.sales_rollups (tenant_id, period, dimension, amount desc);
+
+-- Cada usuario solo lee los agregados de su tenant; nadie escribe por PostgREST
+-- (la tabla la mantienen el trigger y refresh_sales_rollups).
+alter table public.sales_rollups enable row level security;
+
+drop policy if exists sales_rollups_tenant_select on public.sales_rollups;
+create policy sales_rollups_tenant_select on public.sales_rollups
+    for select to authenticated
+    using (tenant_id in (select u.tenant_id from public.users u where u.auth_user_id = auth.uid()));
+
+revoke all on public.sales_rollups from anon, authenticated;
+
+-- Suma al rollup las líneas de `items` (invoice_id, product_id, quantity, subtotal).
+-- `invoices` cuenta facturas distintas dentro de cada llamada: una factura cuyas líneas
+-- se inserten en varias sentencias se contaría más de una vez.
+-- security definer: las ventas insertadas con el rol del usuario (create_sale) también
+-- actualizan el rollup, aunque ese rol no pueda escribir en la tabla.
+create or replace function public.sales_rollups_acumular()
+returns trigger
+language plpgsql
+security definer
+set search_path = public, pg_temp
+as $$
+begin
+    insert into public.sales_rollups as r (tenant_id, period, dimension, key, label, amount, quantity, invoices)
+    select i.tenant_id,
+           date_trunc('month', i.issue_date)::date,
+           d.dimension,
+           d.key,
+           max(d.label),
+           sum(n.subtotal),
+           sum(n.quantity),
+           count(distinct n.invoice_id)
+      from nuevas n
+      join public.invoices i on i.id = n.invoice_id
+      join public.companies c on c.id = i.company_id
+      join public.products p on p.id = n.product_id
+     cross join lateral (values
+           ('route', coalesce(c.route, ''), c.route),
+           ('category', coalesce(p.category, ''), p.category),
+           ('product', p.id::text, p.name),
+           ('total', '', null)
+     ) as d (dimension, key, label)
+     where i.tenant_id is not null
+     group by 1, 2, 3, 4
+    on conflict (tenant_id, period, dimension, key) do update
+       set amount = r.amount + excluded.amount,
+           quantity = r.quantity + excluded.quantity,
+           invoices = r.invoices + excluded.invoices,
+           label = coalesce(excluded.label, r.label);
+    return null;
+end;
+$$;
+
+-- Trigger por sentencia con tabla de transición: una venta de 20 líneas (create_sale)
+-- o un lote de 1000 líneas de la carga masiva actualizan el rollup con un solo upsert.
+drop trigger if exists invoice_items_sales_rollups on public.invoice_items;
+create trigger invoice_items_sales_rollups
+    after insert on public.invoice_items
+    referencing new table as nuevas
+    for each statement execute function public.sales_rollups_acumular();
+
+-- Reconstrucción completa (carga inicial o tras corregir datos históricos).
+create or replace function public.refresh_sales_rollups()
+returns void
+language sql
+set search_path = public, pg_temp
+as $$
+    truncate public.sales_rollups;
+    insert into public.sales_rollups (tenant_id, period, dimension, key, label, amount, quantity, invoices)
+    select i.tenant_id,
+           date_trunc('month', i.issue_date)::date,
+           d.dimension,
+           d.key,
+           max(d.label),
+           sum(n.subtotal),
+           sum(n.quantity),
+           count(distinct n.invoice_id)
+      from public.invoice_items n
+      join public.invoices i on i.id = n.invoice_id
+      join public.companies c on c.id = i.company_id
+      join public.products p on p.id = n.product_id
+     cross join lateral (values
+           ('route', coalesce(c.route, ''), c.route),
+           ('category', coalesce(p.category, ''), p.category),
+           ('product', p.id::text, p.name),
+           ('total', '', null)
+     ) as d (dimension, key, label)
+     where i.tenant_id is not null
+     group by 1, 2, 3, 4;
+$$;
+
+select public.refresh_sales_rollups();
+
+grant select on public.sales_rollups to authenticated, service_role;
+
+-- Recalcular todo es caro: solo lo lanza el rol de servicio (scripts y administración).
+revoke execute on function public.refresh_sales_rollups() from public, anon, authenticated;
+grant execute on function public.refresh_sales_rollups() to service_role;
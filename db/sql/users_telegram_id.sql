@@ -0,0 +1,11 @@
+-- Chat de Telegram de cada usuario, para las difusiones de /broadcast (db/difusion.py).
+-- El bot guarda telegram_id en cada login; telegram_blocked_at se rellena cuando Telegram
+-- responde que el usuario bloqueó el bot, y se limpia en su siguiente login.
+
+alter table public.users
+    add column if not exists telegram_id bigint,
+    add column if not exists telegram_blocked_at timestamptz;
+
+-- Destinatarios de un tenant recorridos por id (keyset), solo los que se pueden contactar.
+create index if not exists users_tenant_broadcast_idx on public.users (tenant_id, id)
+    where telegram_id is not null and telegram_blocked_at is null;
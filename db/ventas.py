@@ -0,0 +1,67 @@
+# Lectura de datos de ventas para los informes del bot.
+# "Consulta Venta" lee solo los agregados de sales_rollups (ver db/sql/sales_rollups.sql):
+# un nº de filas acotado por tenant y mes, independiente del histórico de facturas.
+# /ranking recorre las líneas de factura en bloques columnares (iterar_lineas_venta).
+
+from datetime import date
+
+from db.paginacion import pagina_keyset, recortar_pagina
+
+# Dimensiones que se pueden consultar -> texto para el usuario
+DIMENSIONES_VENTA = {"route": "Ruta", "category": "Categoría", "product": "Producto"}
+
+
+def periodo_de(fecha: date) -> str:
+    """Primer día del mes de `fecha` en formato ISO, como la columna `period`."""
+    return fecha.replace(day=1).isoformat()
+
+
+def desplazar_periodo(periodo: str, meses: int) -> str:
+    """Suma (o resta) meses a un periodo 'YYYY-MM-01'."""
+    fecha = date.fromisoformat(periodo)
+    indice = fecha.year * 12 + fecha.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1).isoformat()
+
+
+async def leer_rollup(client, tenant_id, periodo: str, dimension: str, limite: int = 10):
+    """Devuelve (fila_total, [filas de la dimensión de mayor a menor importe]) con una sola consulta.
+
+    La fila 'total' se pide junto a la dimensión: nunca tiene menos importe que ninguna
+    otra, así que cabe siempre en las limite + 1 primeras.
+    """
+    if dimension not in DIMENSIONES_VENTA:
+        raise ValueError(f"Dimensión no permitida: {dimension}")
+    response = await client.table("sales_rollups") \
+        .select("dimension, key, label, amount, quantity, invoices") \
+        .eq("tenant_id", tenant_id) \
+        .eq("period", periodo) \
+        .in_("dimension", [dimension, "total"]) \
+        .order("amount", desc=True) \
+        .limit(limite + 1) \
+        .execute()
+    filas = response.data or []
+    total = next((f for f in filas if f["dimension"] == "total"), None)
+    return total, [f for f in filas if f["dimension"] != "total"][:limite]
+
+
+async def iterar_lineas_venta(client, tenant_id, desde: str, tamano_pagina: int = 5000):
+    """Genera bloques columnares (productos, clientes, cantidades, importes) de las líneas
+    de factura del tenant emitidas desde `desde`, por páginas keyset de invoice_items."""
+    ultimo = None
+    while True:
+        sel = client.table("invoice_items") \
+            .select("id, product_id, quantity, subtotal, invoices!inner(company_id)") \
+            .eq("invoices.tenant_id", tenant_id) \
+            .gte("invoices.issue_date", desde)
+        response = await pagina_keyset(sel, ("id",), ultimo, tamano_pagina).execute()
+        filas, hay_mas = recortar_pagina(response.data or [], tamano_pagina)
+        if filas:
+            yield (
+                [f["product_id"] for f in filas],
+                [f["invoices"]["company_id"] for f in filas],
+                [f["quantity"] for f in filas],
+                [f["subtotal"] for f in filas],
+            )
+        if not hay_mas:
+            return
+        ultimo = [filas[-1]["id"]]
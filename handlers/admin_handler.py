@@ -1,15 +1,30 @@
 """Handlers administrativos para el bot (solo uso interno).
-Actualmente incluye /listusernames para depuración/administración.
+Incluye /listusernames para depuración/administración y el informe /ranking.
 """
 
 from telegram import Update
 from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
+import asyncio
+import multiprocessing
 import os
 import logging
-from config import supabase_admin as supabase, ADMIN_IDS
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from config import ADMIN_IDS, RANKING_WORKERS, RANKING_DAYS, RANKING_PAGE_SIZE
+from db.conexion import supabase_admin as supabase
+from db.sesiones import sesiones
+from db.paginacion import pagina_keyset, recortar_pagina
+from db.ventas import iterar_lineas_venta
 
 logger = logging.getLogger(__name__)
 
+TOP_RANKING = 10        # productos en el top y en los de baja rotación
+TOP_CLIENTES_RUTA = 3   # clientes por ruta
+MAX_RUTAS_RANKING = 10  # rutas mostradas (las de más facturación)
+_pool_ranking = None
+_rankings = asyncio.Semaphore(1)  # un ranking a la vez: los procesos ya usan varios núcleos
+
 async def list_usernames(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Envía una lista de usernames disponibles. Solo admins."""
     user_id = update.effective_user.id
@@ -19,14 +34,10 @@ async def list_usernames(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     prefix = context.args[0] if context.args else None
 
-    def consulta():
-        sel = supabase.table("users").select("username")
-        if prefix:
-            sel = sel.ilike("username", f"{prefix}%")
-        return sel.execute()
-
-    import asyncio
-    response = await asyncio.to_thread(consulta)
+    sel = supabase.table("users").select("username")
+    if prefix:
+        sel = sel.ilike("username", f"{prefix}%")
+    response = await sel.execute()
     usernames = [u["username"] for u in response.data if u.get("username")]
     if not usernames:
         await update.message.reply_text("No se encontraron usernames.")
@@ -35,3 +46,129 @@ async def list_usernames(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chunks = [usernames[i:i+50] for i in range(0, len(usernames), 50)]
     for ch in chunks:
         await update.message.reply_text("\n".join(ch))
+
+
+# === /ranking ===
+
+def pool_ranking() -> ProcessPoolExecutor:
+    """Pool de procesos para las agregaciones de /ranking, creado la primera vez que se usa.
+
+    Se usa 'spawn' para no clonar el event loop ni las conexiones abiertas del bot.
+    """
+    global _pool_ranking
+    if _pool_ranking is None:
+        _pool_ranking = ProcessPoolExecutor(max_workers=RANKING_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool_ranking
+
+def cerrar_pool_ranking() -> None:
+    """Termina los procesos del pool de /ranking, descartando los bloques aún en cola."""
+    global _pool_ranking
+    if _pool_ranking is not None:
+        _pool_ranking.shutdown(cancel_futures=True)
+        _pool_ranking = None
+
+async def agregar_ventas(client, tenant_id, desde: str, executor=None, tamano_pagina: int = None):
+    """Agrega las líneas de venta por producto y por cliente en procesos aparte.
+
+    Mientras los procesos agregan un bloque se descarga el siguiente; como mucho hay
+    RANKING_WORKERS bloques en vuelo para acotar la memoria.
+    """
+    from utils import analitica
+    loop = asyncio.get_running_loop()
+    executor = executor or pool_ranking()
+    productos = clientes = None
+    en_vuelo = []
+
+    async def recoger():
+        nonlocal productos, clientes
+        parcial_productos, parcial_clientes = await en_vuelo.pop(0)
+        productos = analitica.combinar(productos, parcial_productos)
+        clientes = analitica.combinar(clientes, parcial_clientes)
+
+    async for bloque in iterar_lineas_venta(client, tenant_id, desde, tamano_pagina or RANKING_PAGE_SIZE):
+        en_vuelo.append(loop.run_in_executor(executor, analitica.agregar_bloque, *bloque))
+        if len(en_vuelo) >= RANKING_WORKERS:
+            await recoger()
+    while en_vuelo:
+        await recoger()
+    return analitica.combinar(productos), analitica.combinar(clientes)
+
+async def leer_clientes_rutas(client, tenant_id) -> dict:
+    """{id: (nombre, ruta)} de los clientes del tenant, por páginas keyset."""
+    clientes, ultimo = {}, None
+    while True:
+        sel = client.table("companies").select("id, client_name, route").eq("tenant_id", tenant_id)
+        response = await pagina_keyset(sel, ("id",), ultimo, 1000).execute()
+        filas, hay_mas = recortar_pagina(response.data or [], 1000)
+        clientes.update((f["id"], (f.get("client_name") or "-", f.get("route") or "(sin ruta)")) for f in filas)
+        if not hay_mas:
+            return clientes
+        ultimo = [filas[-1]["id"]]
+
+def _cursiva(texto: str) -> str:
+    """Cursiva de Markdown; si el texto tiene caracteres de marcado (que no se pueden
+    escapar dentro de una entidad) se deja sin formato y escapado."""
+    if any(c in texto for c in "_*`["):
+        return escape_markdown(texto)
+    return f"_{texto}_"
+
+def texto_ranking(productos, clientes, catalogo, nombres_clientes: dict, dias: int) -> str:
+    """Compone el informe a partir de los agregados (claves, unidades, importes)."""
+    import numpy as np
+    from utils import analitica
+
+    def nombre_producto(producto_id):
+        return escape_markdown((catalogo.productos.get(producto_id) or {}).get("name") or str(producto_id))
+
+    texto = f"🏆 Ranking de los últimos {dias} días\n\n*Top productos por facturación*\n"
+    for i, (producto_id, importe) in enumerate(analitica.top(productos[0], productos[2], TOP_RANKING), start=1):
+        texto += f"{i}. {nombre_producto(producto_id)}: {importe:.2f}\n"
+
+    # Baja rotación: productos con stock y menos unidades vendidas (incluidos los que no se vendieron)
+    con_stock = np.asarray(sorted(catalogo.con_stock))
+    unidades = analitica.valores_de(productos[0], productos[1], con_stock)
+    texto += "\n*Baja rotación (con stock)*\n"
+    for producto_id, vendidas in analitica.top(con_stock, unidades, TOP_RANKING, ascendente=True):
+        stock = catalogo.productos[producto_id].get("stock")
+        texto += f"- {nombre_producto(producto_id)}: {vendidas:.0f} uds. vendidas, {stock} en stock\n"
+
+    rutas = np.asarray([nombres_clientes.get(c, ("-", "(sin ruta)"))[1] for c in clientes[0]])
+    totales_ruta = analitica.agrupar(rutas, clientes[1], clientes[2])
+    principales = analitica.top(totales_ruta[0], totales_ruta[2], MAX_RUTAS_RANKING)
+    por_ruta = analitica.top_por_grupo(clientes[0], clientes[2], rutas, TOP_CLIENTES_RUTA)
+    texto += "\n*Clientes por facturación en cada ruta*\n"
+    for ruta, total in principales:
+        texto += f"\n{_cursiva(str(ruta))} ({total:.2f})\n"
+        for cliente_id, importe in por_ruta.get(str(ruta), []):
+            texto += f"  - {escape_markdown(nombres_clientes.get(cliente_id, ('-',))[0])}: {importe:.2f}\n"
+    return texto
+
+async def ranking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/ranking [días] — top de productos, baja rotación y clientes por ruta. Solo admins."""
+    user_id = update.effective_user.id
+    if ADMIN_IDS and user_id not in ADMIN_IDS:
+        await update.message.reply_text("Comando exclusivo para administradores.")
+        return
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return
+    dias = int(context.args[0]) if context.args and context.args[0].isdigit() else RANKING_DAYS
+    desde = (datetime.now() - timedelta(days=dias)).date().isoformat()
+
+    aviso = await update.message.reply_text("⏳ Calculando el ranking...")
+    async with _rankings:
+        try:
+            from handlers.product_handler import obtener_catalogo
+            client = await sesiones.cliente_de(user_id, supabase)
+            productos, clientes = await agregar_ventas(client, tenant_id, desde)
+            catalogo = await obtener_catalogo(tenant_id)
+            nombres_clientes = await leer_clientes_rutas(client, tenant_id)
+            texto = texto_ranking(productos, clientes, catalogo, nombres_clientes, dias)
+            await aviso.edit_text(texto, parse_mode='Markdown')
+        except ImportError:
+            await aviso.edit_text("No se puede calcular el ranking: falta la librería numpy.")
+            return
+        except Exception as e:
+            logger.error(f"Error al calcular el ranking: {e}")
+            await aviso.edit_text("Ocurrió un error al calcular el ranking.")
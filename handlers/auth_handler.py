@@ -2,11 +2,14 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
-from config import supabase_admin, supabase_anon, TENANT_ID
+from config import TENANT_ID, LOGIN_DEV_BYPASS
+from db.conexion import supabase_admin, supabase_anon, auth_usuarios, llamada_auth, nuevo_cliente_auth
+from db.sesiones import sesiones
 from states import (
     SELECTING_ACTION, REGISTER_FIRST_NAME, REGISTER_LAST_NAME, REGISTER_USERNAME, REGISTER_EMAIL, REGISTER_PASSWORD,
     LOGIN_EMAIL, LOGIN_PASSWORD, RESET_EMAIL, RESET_TOKEN, RESET_NEW_PASSWORD
 )
+import asyncio
 import logging
 import os
 from datetime import datetime
@@ -14,6 +17,8 @@ from datetime import datetime
 logger = logging.getLogger(__name__)
 DEBUG_MODE = os.getenv('DEBUG', 'false').lower() == 'true'
 
+AUTH_OCUPADO = "⏳ El servicio de autenticación está tardando demasiado. Inténtalo de nuevo en unos minutos."
+
 # === REGISTRO ===
 async def register_first_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Pregunta el nombre."""
@@ -50,7 +55,7 @@ async def register_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         # PASO 1: Crear usuario en Supabase Auth (solo credenciales)
         # Se elimina el user_metadata para evitar activar triggers complejos.
-        user_response = supabase_admin.auth.admin.create_user({
+        user_response = await llamada_auth(supabase_admin.auth.admin.create_user, {
             "email": email,
             "password": password,
             "email_confirm": True # Lo activamos para que el flujo sea más seguro
@@ -62,7 +67,7 @@ async def register_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # PASO 2: Insertar el perfil en la tabla public.users manualmente
         # Ahora que tenemos un auth_user_id válido, creamos el perfil.
-        insert_response = supabase_admin.table("users").insert({
+        insert_response = await supabase_admin.table("users").insert({
             "id": auth_user.id,  # Usamos el mismo UUID para ambas tablas
             "auth_user_id": auth_user.id,
             "username": username,
@@ -77,6 +82,10 @@ async def register_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return SELECTING_ACTION
 
+    except asyncio.TimeoutError:
+        logger.warning(f"Timeout de Supabase Auth en el registro de {email}")
+        await update.message.reply_text(AUTH_OCUPADO)
+        return REGISTER_PASSWORD
     except Exception as e:
         # Si el error contiene 'already been registered', damos un mensaje más claro.
         if 'already been registered' in str(e):
@@ -90,8 +99,23 @@ async def register_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return REGISTER_USERNAME
 
 # === LOGIN ===
+async def restaurar_sesion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Recupera el tenant del usuario desde la sesión persistida (p. ej. tras un reinicio).
+
+    Se ejecuta antes que el resto de handlers; no hace llamadas de red.
+    """
+    user = update.effective_user
+    if user is None or context.user_data.get('tenant_id'):
+        return
+    guardada = sesiones.restaurar(user.id)
+    if guardada:
+        context.user_data['tenant_id'] = guardada['tenant_id']
+
 async def login_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # MODO DESARROLLO: saltar login y entrar al menú principal
+    if not LOGIN_DEV_BYPASS:
+        await update.message.reply_text("Introduce tu email:", reply_markup=ReplyKeyboardRemove())
+        return LOGIN_EMAIL
+    # MODO DESARROLLO (LOGIN_DEV_BYPASS): saltar login y entrar al menú principal
     await update.message.reply_text("🔓 Acceso directo habilitado para desarrollo. ¡Bienvenido al menú principal!")
     # Simulamos un login exitoso
     context.user_data['authenticated'] = True
@@ -110,29 +134,38 @@ async def login_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     email = context.user_data.get('login_email')
     password = update.message.text
     try:
-        session_response = supabase_anon.auth.sign_in_with_password({"email": email, "password": password})
+        session_response = await llamada_auth(
+            auth_usuarios.sign_in_with_password, {"email": email, "password": password}
+        )
         session = session_response.session
         if not session:
             raise Exception("La sesión no pudo ser creada.")
-        # Usar el token de la sesión para las siguientes llamadas
-        client = supabase_anon
-        client.postgrest.auth(session.access_token)
+        # Cliente PostgREST propio del usuario (su JWT), sin tocar el cliente anon compartido
+        client = sesiones.abrir(update.effective_user.id, session)
         user_id = session.user.id
 
-        # Actualizar la fecha de último login
-        supabase_admin.table("users").update({
-            "last_login": datetime.now().isoformat()
+        # Actualizar la fecha de último login y el chat de Telegram para las difusiones
+        # (un login nuevo anula un bloqueo anterior)
+        await supabase_admin.table("users").update({
+            "last_login": datetime.now().isoformat(),
+            "telegram_id": update.effective_user.id,
+            "telegram_blocked_at": None,
         }).eq("auth_user_id", user_id).execute()
 
         # Obtener detalles del usuario para la sesión del bot
-        user_details = client.table("users").select("tenant_id, username").eq("auth_user_id", user_id).single().execute()
+        user_details = await client.table("users").select("tenant_id, username").eq("auth_user_id", user_id).single().execute()
         if not user_details.data:
             raise Exception("No se encontraron detalles del usuario en la tabla public.users.")
         context.user_data['tenant_id'] = user_details.data['tenant_id']
+        sesiones.guardar(update.effective_user.id, user_details.data['tenant_id'], user_id)
         username = user_details.data.get('username', email)
         await update.message.reply_text(f"✅ ¡Sesión iniciada correctamente para {username}!")
         logger.info(f"Login exitoso para el usuario con tenant_id: {user_details.data['tenant_id']}")
         return SELECTING_ACTION
+    except asyncio.TimeoutError:
+        logger.warning(f"Timeout de Supabase Auth en el login de {email}")
+        await update.message.reply_text(AUTH_OCUPADO)
+        return LOGIN_PASSWORD
     except Exception as e:
         logger.error(f"Login fallido para {email}: {e}")
         await update.message.reply_text(f"Error de autenticación. Verifica tus credenciales. Detalles: {e}")
@@ -154,13 +187,17 @@ async def request_reset_token(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data['reset_email'] = email
     try:
         # Solicitar a Supabase que envíe el email de reseteo
-        supabase_anon.auth.reset_password_for_email(email)
+        await llamada_auth(supabase_anon.auth.reset_password_for_email, email)
         
         await update.message.reply_text(
             "Te hemos enviado un email con un enlace de recuperación. "
             "Por favor, copia y pega la URL completa aquí."
         )
         return RESET_TOKEN
+    except asyncio.TimeoutError:
+        logger.warning(f"Timeout de Supabase Auth al solicitar reseteo para {email}")
+        await update.message.reply_text(AUTH_OCUPADO)
+        return RESET_EMAIL
     except Exception as e:
         logger.error(f"Error al solicitar reseteo para {email}: {e}")
         await update.message.reply_text("Hubo un error al procesar tu solicitud. Por favor, inténtalo de nuevo.")
@@ -197,17 +234,25 @@ async def update_password_complete(update: Update, context: ContextTypes.DEFAULT
         return ConversationHandler.END
 
     try:
+        # Cliente GoTrue propio de esta llamada: la sesión de recuperación no pasa por
+        # ningún cliente compartido, donde otro usuario podría pisarla entre los dos pasos
+        auth = nuevo_cliente_auth()
         # 1. Iniciar sesión con el token para obtener una sesión válida
-        session_response = supabase_anon.auth.set_session(access_token, context.user_data.get('reset_refresh_token', ''))
+        session_response = await llamada_auth(
+            auth.set_session, access_token, context.user_data.get('reset_refresh_token', '')
+        )
         if not session_response.user:
             raise Exception("No se pudo validar la sesión con el token proporcionado.")
 
         # 2. Actualizar la contraseña del usuario autenticado
         user_attributes = {"password": new_password}
-        supabase_anon.auth.update_user(user_attributes)
+        await llamada_auth(auth.update_user, user_attributes)
         
         await update.message.reply_text("¡Tu contraseña ha sido actualizada con éxito! Ya puedes iniciar sesión.")
         
+    except asyncio.TimeoutError:
+        logger.warning("Timeout de Supabase Auth al actualizar la contraseña")
+        await update.message.reply_text(AUTH_OCUPADO + " Si el problema persiste, repite el proceso con /resetpassword.")
     except Exception as e:
         logger.error(f"Error al actualizar la contraseña: {e}")
         await update.message.reply_text("Hubo un error al actualizar tu contraseña. Por favor, intenta el proceso de nuevo con /resetpassword.")
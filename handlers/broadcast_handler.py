@@ -0,0 +1,236 @@
+"""Difusión de avisos a todos los usuarios del tenant (/broadcast). Solo admins.
+
+Los envíos van con prioridad MASIVO por el limitador de la Application (utils/limitador.py):
+salen al máximo que permite Telegram sin retrasar las respuestas interactivas.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+from collections import Counter, deque
+
+from telegram import Update
+from telegram.error import Forbidden, TelegramError
+from telegram.ext import ContextTypes
+
+from config import (
+    ADMIN_IDS, BROADCAST_PAGE_SIZE, BROADCAST_WINDOW, BROADCAST_CHECKPOINT, BROADCAST_LEASE, BROADCAST_CLAIM_INTERVAL,
+)
+from db.conexion import supabase_admin as supabase
+from db.difusion import difusiones, iterar_destinatarios, marcar_bloqueados, EN_CURSO, TERMINADA, CANCELADA
+from utils.limitador import MASIVO
+
+logger = logging.getLogger(__name__)
+
+ENTREGADO, FALLIDO, BLOQUEADO = "entregado", "fallido", "bloqueado"
+PROPIETARIO = f"{socket.gethostname()}:{os.getpid()}"
+USO = (
+    "Uso:\n/broadcast <texto> — envía el aviso a todos los usuarios\n"
+    "/broadcast estado — últimas difusiones\n/broadcast cancelar <id>"
+)
+_trabajos: dict = {}  # id de difusión -> Task en este proceso
+_tarea_reclamos = None
+
+
+async def enviar_a(bot, chat_id: int, texto: str) -> str:
+    try:
+        await bot.send_message(chat_id, texto, rate_limit_args=MASIVO)
+        return ENTREGADO
+    except Forbidden:
+        # Bloqueó el bot o borró la cuenta
+        return BLOQUEADO
+    except TelegramError as e:
+        logger.info(f"Difusión: no se pudo enviar al chat {chat_id}: {e}")
+        return FALLIDO
+
+
+async def ejecutar_difusion(bot, trabajo_id: int, almacen=difusiones, client=supabase,
+                            tamano_pagina: int = BROADCAST_PAGE_SIZE, ventana: int = BROADCAST_WINDOW,
+                            cada: int = BROADCAST_CHECKPOINT) -> dict:
+    """Envía la difusión a partir de su cursor y devuelve la fila final.
+
+    Hay como mucho `ventana` envíos en vuelo; los resultados se recogen en orden de id, de modo
+    que el cursor guardado es siempre el último usuario con todos los anteriores ya atendidos.
+    Si se interrumpe, al reanudar solo pueden repetirse los envíos que estaban en vuelo.
+    """
+    trabajo = almacen.leer(trabajo_id)
+    texto = trabajo["texto"]
+    cuentas, bloqueados = Counter(), []
+    pendientes = deque()
+    cursor = None
+    estado = EN_CURSO
+
+    async def guardar():
+        nonlocal estado
+        if bloqueados:
+            try:
+                await marcar_bloqueados(client, list(bloqueados))
+            except Exception as e:
+                logger.warning(f"Difusión {trabajo_id}: no se pudieron marcar usuarios bloqueados: {e}")
+            bloqueados.clear()
+        estado = almacen.avanzar(trabajo_id, cursor, cuentas[ENTREGADO], cuentas[FALLIDO], cuentas[BLOQUEADO])
+        cuentas.clear()
+
+    def anotar(user_id, resultado):
+        nonlocal cursor
+        cuentas[resultado] += 1
+        if resultado == BLOQUEADO:
+            bloqueados.append(user_id)
+        cursor = user_id
+
+    async def recoger(hasta: int):
+        while len(pendientes) > hasta:
+            # Se espera sin sacarla de la cola ni cancelarla: si nos interrumpen aquí,
+            # el bloque finally decide qué quedó confirmado
+            await asyncio.wait([pendientes[0][1]])
+            user_id, tarea = pendientes.popleft()
+            anotar(user_id, tarea.result())
+            if sum(cuentas.values()) >= cada:
+                await guardar()
+
+    try:
+        async for pagina in iterar_destinatarios(client, trabajo["tenant_id"], trabajo["cursor"], tamano_pagina):
+            for fila in pagina:
+                pendientes.append((fila["id"], asyncio.create_task(enviar_a(bot, fila["telegram_id"], texto))))
+                await recoger(ventana - 1)
+                if estado != EN_CURSO:
+                    return almacen.leer(trabajo_id)  # cancelada desde otro proceso
+        await recoger(0)
+    finally:
+        # Se conserva lo ya confirmado; lo que quedaba en vuelo se reenviará al reanudar
+        while pendientes and pendientes[0][1].done() and not pendientes[0][1].cancelled():
+            user_id, tarea = pendientes.popleft()
+            anotar(user_id, tarea.result())
+        for _, tarea in pendientes:
+            tarea.cancel()
+        await guardar()
+    if estado == EN_CURSO:
+        almacen.terminar(trabajo_id, TERMINADA)
+    return almacen.leer(trabajo_id)
+
+
+def texto_informe(trabajo: dict) -> str:
+    return (
+        f"📣 Difusión #{trabajo['id']} ({trabajo['estado']})\n"
+        f"Entregados: {trabajo['entregados']} · fallidos: {trabajo['fallidos']} · bloqueados: {trabajo['bloqueados']}"
+    )
+
+
+async def _avisar_autor(bot, trabajo: dict) -> None:
+    logger.info(texto_informe(trabajo))
+    with contextlib.suppress(TelegramError):
+        await bot.send_message(trabajo["autor"], texto_informe(trabajo))
+
+
+async def _ejecutar_y_avisar(bot, trabajo_id: int) -> None:
+    try:
+        trabajo = await ejecutar_difusion(bot, trabajo_id)
+    except asyncio.CancelledError:
+        # /broadcast cancelar: el autor recibe igualmente las cuentas finales. Si es una
+        # parada del bot sigue en curso y no se avisa: se reanudará
+        trabajo = difusiones.leer(trabajo_id)
+        if trabajo and trabajo["estado"] == CANCELADA:
+            await _avisar_autor(bot, trabajo)
+        raise
+    except Exception as e:
+        logger.error(f"Error en la difusión {trabajo_id}: {e}")
+        return  # sigue en curso: se reanuda en el próximo arranque
+    await _avisar_autor(bot, trabajo)
+
+
+def lanzar_difusion(bot, trabajo_id: int) -> bool:
+    """Ejecuta la difusión en segundo plano si este proceso consigue reclamarla."""
+    if trabajo_id in _trabajos or not difusiones.reclamar(trabajo_id, PROPIETARIO, BROADCAST_LEASE):
+        return False
+    tarea = asyncio.create_task(_ejecutar_y_avisar(bot, trabajo_id), name=f"difusion-{trabajo_id}")
+    _trabajos[trabajo_id] = tarea
+    tarea.add_done_callback(lambda _: _trabajos.pop(trabajo_id, None))
+    return True
+
+
+async def reanudar_difusiones(application) -> None:
+    """Reanuda las difusiones sin dueño o cuyo dueño dejó de dar latidos (p. ej. un worker caído)."""
+    for trabajo_id in difusiones.pendientes():
+        if lanzar_difusion(application.bot, trabajo_id):
+            logger.info(f"Reanudando la difusión {trabajo_id}")
+
+
+async def _bucle_reclamos(application) -> None:
+    while True:
+        await asyncio.sleep(BROADCAST_CLAIM_INTERVAL)
+        try:
+            # Latido de las propias aunque vayan lentas (RetryAfter): que nadie las tome por huérfanas
+            for trabajo_id in list(_trabajos):
+                difusiones.reclamar(trabajo_id, PROPIETARIO, BROADCAST_LEASE)
+            await reanudar_difusiones(application)
+        except Exception as e:
+            logger.warning(f"No se pudieron revisar las difusiones pendientes: {e}")
+
+
+async def iniciar_difusiones(application) -> None:
+    """Reanuda las interrumpidas y revisa cada BROADCAST_CLAIM_INTERVAL las de otros procesos.
+    Se llama desde el post_init de la Application."""
+    global _tarea_reclamos
+    await reanudar_difusiones(application)
+    _tarea_reclamos = asyncio.create_task(_bucle_reclamos(application))
+
+
+async def detener_difusiones(application=None) -> None:
+    """Detiene las difusiones en curso guardando su progreso. Se llama desde el post_stop."""
+    if _tarea_reclamos is not None:
+        _tarea_reclamos.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _tarea_reclamos
+    tareas = list(_trabajos.values())
+    for tarea in tareas:
+        tarea.cancel()
+    for tarea in tareas:
+        with contextlib.suppress(asyncio.CancelledError):
+            await tarea
+    difusiones.liberar(PROPIETARIO)
+
+
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <texto> | estado | cancelar <id>"""
+    user_id = update.effective_user.id
+    if ADMIN_IDS and user_id not in ADMIN_IDS:
+        await update.message.reply_text("Comando exclusivo para administradores.")
+        return
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return
+
+    partes = update.message.text.split(None, 1)
+    texto = partes[1].strip() if len(partes) > 1 else ""
+    if not texto:
+        await update.message.reply_text(USO)
+        return
+
+    if texto.lower() == "estado":
+        trabajos = difusiones.recientes(tenant_id)
+        await update.message.reply_text(
+            "\n\n".join(texto_informe(t) for t in trabajos) if trabajos else "No hay difusiones.")
+        return
+
+    if context.args and context.args[0].lower() == "cancelar":
+        trabajo_id = int(context.args[1]) if len(context.args) > 1 and context.args[1].isdigit() else None
+        trabajo = difusiones.leer(trabajo_id) if trabajo_id else None
+        if not trabajo or trabajo["tenant_id"] != str(tenant_id) or trabajo["estado"] != EN_CURSO:
+            await update.message.reply_text("No hay ninguna difusión en curso con ese id.")
+            return
+        # Si la ejecuta otro worker, la detecta en su siguiente punto de control
+        difusiones.terminar(trabajo_id, CANCELADA)
+        if trabajo_id in _trabajos:
+            _trabajos[trabajo_id].cancel()
+        await update.message.reply_text(f"Difusión #{trabajo_id} cancelada.")
+        return
+
+    trabajo_id = difusiones.crear(tenant_id, update.effective_chat.id, texto)
+    lanzar_difusion(context.bot, trabajo_id)
+    await update.message.reply_text(
+        f"📣 Difusión #{trabajo_id} en marcha. Te avisaré al terminar; "
+        f"consulta el progreso con /broadcast estado."
+    )
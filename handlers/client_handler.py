@@ -1,15 +1,41 @@
 # Handler para el submenú de Gestión Clientes
-from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import logging
 import asyncio
 
 # Se importa la configuración y los estados desde los módulos correspondientes
-from config import supabase_admin as supabase
+from db.conexion import supabase_admin as supabase
+from db.sesiones import sesiones
+from config import (
+    FACET_CACHE_TTL, FACET_CACHE_MAXSIZE, CLIENT_PAGE_SIZE,
+    SEARCH_INDEX_TTL, SEARCH_INDEX_MAXSIZE, CLIENT_CARD_CACHE_MAXSIZE,
+)
+from utils.cache import TTLCache
+from utils.search_index import TrigramIndex
+from utils.validators import validar_dato_cliente
+from db.facetas import contar_facetas, etiqueta_faceta
+from db.paginacion import pagina_keyset, recortar_pagina
 from states import SELECTING_ACTION, CLIENT_SUBMENU, CLIENT_FILTER_RESPONSE, VIEWING_CLIENT, PRODUCT_FILTER_RESPONSE, PRODUCT_SUBMENU, SALE_SUBMENU
 
 logger = logging.getLogger(__name__)
 
+# Facetas de route/category/city por tenant: {tenant_id: {campo: [(valor, cantidad)]}}
+_facetas_cache = TTLCache(maxsize=FACET_CACHE_MAXSIZE, ttl=FACET_CACHE_TTL)
+# Se incrementa en cada invalidación para no cachear lecturas lanzadas antes de un cambio
+_facetas_generacion = {}
+# Índices de búsqueda libre por tenant: {tenant_id: TrigramIndex}
+_indices_busqueda = TTLCache(maxsize=SEARCH_INDEX_MAXSIZE, ttl=SEARCH_INDEX_TTL)
+_indices_locks = {}
+CAMPOS_BUSQUEDA = ("client_name", "contact_person", "phone", "city")
+# Fichas de cliente ya renderizadas: {(tenant_id, id): {'cliente': fila, 'ficha': markdown}}
+_fichas_cache = TTLCache(maxsize=CLIENT_CARD_CACHE_MAXSIZE, ttl=None)
+# Lecturas de ficha en curso: {(tenant_id, id): {'n': lecturas, 'invalidada': bool}}.
+# Solo vive mientras hay una consulta en vuelo, así que no crece con los clientes modificados
+_fichas_en_lectura = {}
+# Orden estable de las listas paginadas de clientes
+ORDEN_CLIENTES = ("client_name", "id")
+
 # --- Funciones Auxiliares ---
 
 def limpiar_contexto(context: ContextTypes.DEFAULT_TYPE, keep_keys=('tenant_id',)) -> None:
@@ -18,6 +44,85 @@ def limpiar_contexto(context: ContextTypes.DEFAULT_TYPE, keep_keys=('tenant_id',
         if key not in keep_keys:
             context.user_data.pop(key)
 
+def invalidar_facetas(tenant_id) -> None:
+    """Descarta las facetas cacheadas de un tenant tras un alta, modificación o baja."""
+    _facetas_generacion[tenant_id] = _facetas_generacion.get(tenant_id, 0) + 1
+    _facetas_cache.pop(tenant_id)
+
+async def obtener_facetas(tenant_id, campo: str) -> list:
+    """Devuelve [(valor, cantidad)] de `campo` agrupado en el servidor, usando la caché por tenant."""
+    facetas = _facetas_cache.get(tenant_id)
+    if facetas is not None and campo in facetas:
+        return facetas[campo]
+
+    generacion = _facetas_generacion.get(tenant_id, 0)
+    valores = await contar_facetas(supabase, "companies", campo, tenant_id)
+    if generacion != _facetas_generacion.get(tenant_id, 0):
+        return valores
+    facetas = dict(_facetas_cache.get(tenant_id) or {})
+    facetas[campo] = valores
+    _facetas_cache.set(tenant_id, facetas)
+    return valores
+
+async def obtener_indice_busqueda(tenant_id) -> TrigramIndex:
+    """Devuelve el índice de búsqueda del tenant, construyéndolo en la primera consulta."""
+    indice = _indices_busqueda.get(tenant_id)
+    if indice is not None:
+        return indice
+    lock = _indices_locks.setdefault(tenant_id, asyncio.Lock())
+    async with lock:
+        indice = _indices_busqueda.get(tenant_id)
+        if indice is None:
+            indice = TrigramIndex(CAMPOS_BUSQUEDA)
+            ultimo = None
+            # Se recorre por páginas de id porque PostgREST limita las filas por respuesta
+            while True:
+                sel = supabase.table("companies").select("id, " + ", ".join(CAMPOS_BUSQUEDA)).eq("tenant_id", tenant_id)
+                response = await pagina_keyset(sel, ("id",), ultimo, 1000).execute()
+                filas, hay_mas = recortar_pagina(response.data or [], 1000)
+                for fila in filas:
+                    indice.add(fila['id'], fila)
+                if not hay_mas:
+                    break
+                ultimo = [filas[-1]['id']]
+            _indices_busqueda.set(tenant_id, indice)
+    return indice
+
+def invalidar_indice_busqueda(tenant_id) -> None:
+    """Descarta el índice de un tenant (p. ej. tras una importación masiva); se reconstruye al buscar."""
+    _indices_busqueda.pop(tenant_id)
+
+def indexar_cliente(tenant_id, cliente_id, cambios: dict = None, borrado: bool = False) -> None:
+    """Propaga un alta, modificación o baja al índice de búsqueda, si ya está construido."""
+    indice = _indices_busqueda.get(tenant_id)
+    if indice is None:
+        return
+    if borrado:
+        indice.remove(cliente_id)
+    elif indice.get(cliente_id) is None:
+        indice.add(cliente_id, cambios or {})
+    else:
+        indice.update(cliente_id, cambios or {})
+
+def invalidar_ficha(tenant_id, cliente_id) -> None:
+    """Expulsa la ficha cacheada de un cliente modificado o eliminado."""
+    clave = (tenant_id, cliente_id)
+    if clave in _fichas_en_lectura:
+        _fichas_en_lectura[clave]['invalidada'] = True
+    _fichas_cache.pop(clave)
+
+def renderizar_ficha(cliente: dict) -> str:
+    """Texto Markdown de la ficha completa de un cliente."""
+    ficha = f"📄 *Ficha del Cliente*\n\n"
+    ficha += f"Nombre: {cliente.get('client_name', '-')}\n"
+    ficha += f"Ciudad: {cliente.get('city', '-')}\n"
+    ficha += f"Ruta: {cliente.get('route', '-')}\n"
+    ficha += f"Categoría: {cliente.get('category', '-')}\n"
+    ficha += f"Contacto: {cliente.get('contact_person', '-')}\n"
+    ficha += f"Teléfono: {cliente.get('phone', '-')}\n"
+    ficha += f"Dirección: {cliente.get('address', '-')}\n"
+    return ficha
+
 # --- Handlers del Submenú de Clientes ---
 
 async def mostrar_submenu_clientes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -36,10 +141,50 @@ async def mostrar_submenu_clientes(update: Update, context: ContextTypes.DEFAULT
     return CLIENT_SUBMENU
 
 async def consulta_cliente(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Maneja la opción 'Consulta Cliente', que ahora es un alias para el submenú."""
-    # Esta función puede ser un punto de entrada para una búsqueda directa en el futuro.
-    await update.message.reply_text("Por favor, elige un método de filtrado para encontrar al cliente.")
-    return await mostrar_submenu_clientes(update, context)
+    """Maneja la opción 'Consulta Cliente': pide un texto para la búsqueda directa."""
+    context.user_data['awaiting_busqueda'] = True
+    await update.message.reply_text(
+        "Escribe el nombre, contacto, teléfono o ciudad del cliente que buscas:",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return CLIENT_SUBMENU
+
+async def buscar_cliente(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Busca clientes en el índice en memoria del tenant y los muestra como botones."""
+    if not context.user_data.pop('awaiting_busqueda', None):
+        await update.message.reply_text("Opción no reconocida. Por favor, usa los botones del menú.")
+        return await mostrar_submenu_clientes(update, context)
+
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return SELECTING_ACTION
+
+    texto = update.message.text.strip()
+    try:
+        indice = await obtener_indice_busqueda(tenant_id)
+    except Exception as e:
+        logger.error(f"Error al construir el índice de búsqueda: {e}")
+        await update.message.reply_text("Ocurrió un error al buscar clientes.")
+        return await mostrar_submenu_clientes(update, context)
+
+    resultados = indice.search(texto, limite=CLIENT_PAGE_SIZE)
+    if not resultados:
+        await update.message.reply_text(f"No se encontraron clientes para '{texto}'.")
+        return await mostrar_submenu_clientes(update, context)
+
+    keyboard = [
+        [InlineKeyboardButton(f"{doc['client_name']} ({doc.get('city') or '-'})", callback_data=f"client_sel_{cliente_id}")]
+        for cliente_id, doc, _ in resultados
+    ]
+    # El texto del botón lleva la ciudad: el nombre se guarda aparte para la selección
+    context.user_data['nombres_clientes'] = {str(cliente_id): doc['client_name'] for cliente_id, doc, _ in resultados}
+    keyboard.append([InlineKeyboardButton("↩️ Volver", callback_data="client_back_submenu")])
+    await update.message.reply_text(
+        f"Resultados para '{texto}'. Selecciona uno para ver sus acciones:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return CLIENT_FILTER_RESPONSE
 
 # --- Lógica de Filtros ---
 
@@ -51,17 +196,16 @@ async def _filtrar_por_campo(update: Update, context: ContextTypes.DEFAULT_TYPE,
         return SELECTING_ACTION
 
     try:
-        def consulta():
-            return supabase.table("companies").select(campo).eq("tenant_id", tenant_id).execute()
-        
-        response = await asyncio.to_thread(consulta)
-        valores = sorted({c[campo] for c in response.data if c.get(campo) and str(c[campo]).strip()})
-        
+        valores = await obtener_facetas(tenant_id, campo)
+
         if not valores:
             await update.message.reply_text(f"No hay valores para '{campo}' registrados.")
             return CLIENT_SUBMENU
 
-        keyboard = [[InlineKeyboardButton(str(v), callback_data=f"client_{campo}_{v}")] for v in valores]
+        keyboard = [
+            [InlineKeyboardButton(etiqueta_faceta(v, n), callback_data=f"client_{campo}_{v}")]
+            for v, n in valores
+        ]
         keyboard.append([InlineKeyboardButton("↩️ Volver", callback_data="client_back_submenu")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -85,7 +229,7 @@ async def filtrar_por_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
 
 async def mostrar_clientes_filtrados(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Callback que se activa al pulsar un botón de filtro inline."""
+    """Callback que se activa al pulsar un botón de filtro inline. Muestra la primera página."""
     query = update.callback_query
     await query.answer()
     
@@ -109,41 +253,89 @@ async def mostrar_clientes_filtrados(update: Update, context: ContextTypes.DEFAU
         await query.edit_message_text("Sesión expirada. Por favor, vuelve a iniciar sesión.")
         return SELECTING_ACTION
 
-    try:
-        def consulta():
-            return supabase.table("companies").select("id, client_name, city").eq("tenant_id", tenant_id).eq(campo, valor).execute()
-        
-        response = await asyncio.to_thread(consulta)
-        clientes = response.data
+    limpiar_contexto(context)
+    # Solo se guarda el cursor de la página actual, nunca la lista de clientes
+    context.user_data['clientes_cursor'] = {
+        'campo': campo, 'valor': valor, 'pagina': 0,
+        'primero': None, 'ultimo': None, 'hay_anterior': False, 'hay_siguiente': False,
+    }
+    return await _mostrar_pagina_clientes(query, context, tenant_id, hacia_atras=False)
 
-        if not clientes:
-            await query.edit_message_text(f"No se encontraron clientes para {campo} = '{valor}'.")
-            return CLIENT_SUBMENU
 
-        limpiar_contexto(context)
-        # Guardamos los clientes para el siguiente paso
-        context.user_data['clientes_filtrados'] = {c['client_name']: c['id'] for c in clientes}
+async def paginar_clientes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Callback de los botones ◀ / ▶ de la lista de clientes filtrados."""
+    query = update.callback_query
+    await query.answer()
 
-        keyboard = [[c['client_name']] for c in clientes]
-        keyboard.append(["Volver al Submenú de Clientes"])
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-        
-        await query.edit_message_text(f"Clientes encontrados para {campo} '{valor}'. Selecciona uno para ver sus acciones:")
-        # Enviamos un nuevo mensaje porque no se puede cambiar de Inline a Reply keyboard
-        await context.bot.send_message(chat_id=update.effective_chat.id, text="Elige un cliente:", reply_markup=reply_markup)
-        
-        return VIEWING_CLIENT # Estado para esperar la selección del cliente
+    tenant_id = context.user_data.get('tenant_id')
+    cursor = context.user_data.get('clientes_cursor')
+    if not tenant_id or not cursor:
+        await query.edit_message_text("Sesión expirada. Por favor, vuelve a filtrar los clientes.")
+        return CLIENT_SUBMENU
 
+    return await _mostrar_pagina_clientes(query, context, tenant_id, hacia_atras=query.data == "client_page_prev")
+
+
+async def _mostrar_pagina_clientes(query, context: ContextTypes.DEFAULT_TYPE, tenant_id, hacia_atras: bool) -> int:
+    """Consulta una sola página por keyset (client_name, id) y edita el mensaje con ella."""
+    cursor = context.user_data['clientes_cursor']
+    campo, valor = cursor['campo'], cursor['valor']
+    desde = cursor['primero'] if hacia_atras else cursor['ultimo']
+
+    try:
+        client = await sesiones.cliente_de(query.from_user.id, supabase)
+        sel = client.table("companies").select("id, client_name").eq("tenant_id", tenant_id).eq(campo, valor)
+        response = await pagina_keyset(sel, ORDEN_CLIENTES, desde, CLIENT_PAGE_SIZE, hacia_atras).execute()
+        clientes, hay_mas = recortar_pagina(response.data or [], CLIENT_PAGE_SIZE, hacia_atras)
     except Exception as e:
         logger.error(f"Error al mostrar clientes filtrados: {e}")
         await query.edit_message_text("Ocurrió un error al obtener los clientes.")
         return CLIENT_SUBMENU
 
+    if not clientes:
+        await query.edit_message_text(f"No se encontraron clientes para {campo} = '{valor}'.")
+        return CLIENT_SUBMENU
+
+    if hacia_atras:
+        cursor.update(pagina=cursor['pagina'] - 1, hay_anterior=hay_mas, hay_siguiente=True)
+    else:
+        cursor.update(pagina=cursor['pagina'] + 1, hay_anterior=desde is not None, hay_siguiente=hay_mas)
+    cursor['primero'] = [clientes[0]['client_name'], clientes[0]['id']]
+    cursor['ultimo'] = [clientes[-1]['client_name'], clientes[-1]['id']]
+
+    keyboard = [[InlineKeyboardButton(c['client_name'], callback_data=f"client_sel_{c['id']}")] for c in clientes]
+    context.user_data['nombres_clientes'] = {str(c['id']): c['client_name'] for c in clientes}
+    navegacion = []
+    if cursor['hay_anterior']:
+        navegacion.append(InlineKeyboardButton("◀", callback_data="client_page_prev"))
+    if cursor['hay_siguiente']:
+        navegacion.append(InlineKeyboardButton("▶", callback_data="client_page_next"))
+    if navegacion:
+        keyboard.append(navegacion)
+    keyboard.append([InlineKeyboardButton("↩️ Volver", callback_data="client_back_submenu")])
+
+    await query.edit_message_text(
+        f"Clientes para {campo} '{valor}' (página {cursor['pagina']}). Selecciona uno para ver sus acciones:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return CLIENT_FILTER_RESPONSE
+
+
+async def seleccionar_cliente(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Callback al pulsar un cliente de la lista paginada."""
+    query = update.callback_query
+    await query.answer()
+
+    cliente_id = query.data[len("client_sel_"):]
+    # Nombres de la última lista mostrada: no hace falta otra consulta
+    nombre = context.user_data.get('nombres_clientes', {}).get(cliente_id, "el cliente seleccionado")
+    await query.edit_message_text(f"Cliente seleccionado: {nombre}")
+    return await _mostrar_acciones_cliente(update, context, cliente_id, nombre)
+
 
 async def acciones_cliente_seleccionado(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Muestra las acciones disponibles para un cliente seleccionado."""
+    """Gestiona los botones de navegación mientras se elige un cliente de la lista."""
     texto = update.message.text
-    clientes_filtrados = context.user_data.get('clientes_filtrados', {})
 
     # Manejo de botones de navegación
     if texto == "Volver al Submenú de Clientes":
@@ -152,13 +344,14 @@ async def acciones_cliente_seleccionado(update: Update, context: ContextTypes.DE
         from bot import start
         return await start(update, context)
 
-    if texto not in clientes_filtrados:
-        await update.message.reply_text("Por favor, selecciona un cliente de la lista.")
-        return VIEWING_CLIENT
+    await update.message.reply_text("Por favor, selecciona un cliente de la lista.")
+    return CLIENT_FILTER_RESPONSE
+
 
-    cliente_id = clientes_filtrados[texto]
+async def _mostrar_acciones_cliente(update: Update, context: ContextTypes.DEFAULT_TYPE, cliente_id, nombre: str) -> int:
+    """Muestra las acciones disponibles para un cliente seleccionado."""
     context.user_data['cliente_seleccionado_id'] = cliente_id
-    context.user_data['cliente_seleccionado_nombre'] = texto
+    context.user_data['cliente_seleccionado_nombre'] = nombre
 
     keyboard = [
         ["Ver Ficha Completa", "Crear Venta"],
@@ -166,7 +359,8 @@ async def acciones_cliente_seleccionado(update: Update, context: ContextTypes.DE
         ["Volver al Submenú de Clientes"]
     ]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-    await update.message.reply_text(f"Acciones para {texto}:", reply_markup=reply_markup)
+    # Se envía un mensaje nuevo porque no se puede cambiar de Inline a Reply keyboard
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Acciones para {nombre}:", reply_markup=reply_markup)
 
     # Aquí se podría definir un nuevo estado, por ejemplo, ACTION_ON_CLIENT
     # Por ahora, lo devolvemos al submenú de clientes para simplificar.
@@ -257,12 +451,14 @@ async def confirmar_modificacion_cliente(update: Update, context: ContextTypes.D
         cliente_id = context.user_data.get('cliente_seleccionado_id')
         field = context.user_data.get('mod_field_name')
         nuevo_valor = context.user_data.get('mod_field_value')
-        def actualiza():
-            return supabase.table("companies").update({field: nuevo_valor}).eq("id", cliente_id).execute()
-        response = await asyncio.to_thread(actualiza)
+        client = await sesiones.cliente_de(update.effective_user.id, supabase)
+        response = await client.table("companies").update({field: nuevo_valor}).eq("id", cliente_id).execute()
         if getattr(response, 'error', None):
             await update.message.reply_text(f"Error al modificar el cliente: {response.error}")
         else:
+            invalidar_facetas(context.user_data.get('tenant_id'))
+            invalidar_ficha(context.user_data.get('tenant_id'), cliente_id)
+            indexar_cliente(context.user_data.get('tenant_id'), cliente_id, {field: nuevo_valor})
             await update.message.reply_text("✅ Cliente modificado correctamente.")
         # Limpiar contexto
         context.user_data.pop('awaiting_mod_confirm', None)
@@ -317,10 +513,8 @@ async def confirmar_eliminar_cliente(update: Update, context: ContextTypes.DEFAU
             await query.edit_message_text("Error: No se pudo identificar al cliente. Operación cancelada.")
             return await mostrar_submenu_clientes(update, context)
 
-        def elimina():
-            return supabase.table("companies").delete().eq("id", client_id).eq("tenant_id", tenant_id).execute()
-
-        response = await asyncio.to_thread(elimina)
+        client = await sesiones.cliente_de(update.effective_user.id, supabase)
+        response = await client.table("companies").delete().eq("id", client_id).eq("tenant_id", tenant_id).execute()
 
         # --- LOGS DE DEPURACIÓN ---
         logger.info(f"Respuesta de Supabase al eliminar: {response}")
@@ -330,6 +524,9 @@ async def confirmar_eliminar_cliente(update: Update, context: ContextTypes.DEFAU
         elif not response.data:
             await query.edit_message_text("El cliente no pudo ser eliminado. Verifique los permisos o si el cliente aún existe.")
         else:
+            invalidar_facetas(tenant_id)
+            invalidar_ficha(tenant_id, client_id)
+            indexar_cliente(tenant_id, client_id, borrado=True)
             await query.edit_message_text("✅ Cliente eliminado correctamente.")
 
         # Limpiar contexto y volver
@@ -372,45 +569,37 @@ async def test_crud_companies():
     tenant_id = "1b42cbd4-cb32-4890-80d3-f4bed3141ee7"  # Ajusta si es necesario
     nombre = f"Test Cliente {uuid.uuid4().hex[:6]}"
     # CREATE
-    def crea():
-        return supabase.table("companies").insert({
-            "client_name": nombre,
-            "city": "TestCity",
-            "route": "TestRoute",
-            "category": "TestCat",
-            "contact_person": "TestContact",
-            "phone": "123456789",
-            "address": "TestAddress",
-            "tenant_id": tenant_id
-        }).execute()
-    resp_create = await asyncio.to_thread(crea)
+    resp_create = await supabase.table("companies").insert({
+        "client_name": nombre,
+        "city": "TestCity",
+        "route": "TestRoute",
+        "category": "TestCat",
+        "contact_person": "TestContact",
+        "phone": "123456789",
+        "address": "TestAddress",
+        "tenant_id": tenant_id
+    }).execute()
     print("CREATE:", resp_create.data)
     if not resp_create.data:
         print("ERROR EN CREATE")
         return
     company_id = resp_create.data[0]["id"]
     # READ
-    def lee():
-        return supabase.table("companies").select("*").eq("id", company_id).eq("tenant_id", tenant_id).single().execute()
-    resp_read = await asyncio.to_thread(lee)
+    resp_read = await supabase.table("companies").select("*").eq("id", company_id).eq("tenant_id", tenant_id).single().execute()
     print("READ:", resp_read.data)
     # UPDATE
-    def actualiza():
-        return supabase.table("companies")\
-            .update({"city": "CiudadActualizada"})\
-            .eq("id", company_id)\
-            .eq("tenant_id", tenant_id)\
-            .execute()
-    resp_update = await asyncio.to_thread(actualiza)
+    resp_update = await supabase.table("companies")\
+        .update({"city": "CiudadActualizada"})\
+        .eq("id", company_id)\
+        .eq("tenant_id", tenant_id)\
+        .execute()
     print("UPDATE:", resp_update.data)
     # DELETE
-    def elimina():
-        return supabase.table("companies")\
-            .delete()\
-            .eq("id", company_id)\
-            .eq("tenant_id", tenant_id)\
-            .execute()
-    resp_delete = await asyncio.to_thread(elimina)
+    resp_delete = await supabase.table("companies")\
+        .delete()\
+        .eq("id", company_id)\
+        .eq("tenant_id", tenant_id)\
+        .execute()
     print("DELETE:", resp_delete.data)
     print("--- FIN TEST CRUD ---")
 
@@ -430,58 +619,41 @@ async def recibir_dato_cliente(update: Update, context: ContextTypes.DEFAULT_TYP
         context.user_data.pop('awaiting_field', None)
         await update.message.reply_text("Alta de cliente cancelada.")
         return await mostrar_submenu_clientes(update, context)
+    error = validar_dato_cliente(field, value)
+    if error:
+        await update.message.reply_text(f"{error} Intenta de nuevo:")
+        return CLIENT_SUBMENU
     if field == 'nombre':
-        if not value:
-            await update.message.reply_text("El nombre no puede estar vacío. Intenta de nuevo:")
-            return CLIENT_SUBMENU
         context.user_data['nuevo_cliente']['client_name'] = value
         context.user_data['awaiting_field'] = 'ciudad'
         await update.message.reply_text("Introduce la *ciudad* del cliente:", parse_mode="Markdown")
         return CLIENT_SUBMENU
     if field == 'ciudad':
-        if not value:
-            await update.message.reply_text("La ciudad no puede estar vacía. Intenta de nuevo:")
-            return CLIENT_SUBMENU
         context.user_data['nuevo_cliente']['city'] = value
         context.user_data['awaiting_field'] = 'ruta'
         await update.message.reply_text("Introduce la *ruta* del cliente:", parse_mode="Markdown")
         return CLIENT_SUBMENU
     if field == 'ruta':
-        if not value:
-            await update.message.reply_text("La ruta no puede estar vacía. Intenta de nuevo:")
-            return CLIENT_SUBMENU
         context.user_data['nuevo_cliente']['route'] = value
         context.user_data['awaiting_field'] = 'categoría'
         await update.message.reply_text("Introduce la *categoría* del cliente:", parse_mode="Markdown")
         return CLIENT_SUBMENU
     if field == 'categoría':
-        if not value:
-            await update.message.reply_text("La categoría no puede estar vacía. Intenta de nuevo:")
-            return CLIENT_SUBMENU
         context.user_data['nuevo_cliente']['category'] = value
         context.user_data['awaiting_field'] = 'contacto'
         await update.message.reply_text("Introduce la *persona de contacto* del cliente:", parse_mode="Markdown")
         return CLIENT_SUBMENU
     if field == 'contacto':
-        if not value:
-            await update.message.reply_text("El contacto no puede estar vacío. Intenta de nuevo:")
-            return CLIENT_SUBMENU
         context.user_data['nuevo_cliente']['contact_person'] = value
         context.user_data['awaiting_field'] = 'teléfono'
         await update.message.reply_text("Introduce el *teléfono* del cliente:", parse_mode="Markdown")
         return CLIENT_SUBMENU
     if field == 'teléfono':
-        if not value.isdigit():
-            await update.message.reply_text("El teléfono debe ser numérico. Intenta de nuevo:")
-            return CLIENT_SUBMENU
         context.user_data['nuevo_cliente']['phone'] = value
         context.user_data['awaiting_field'] = 'dirección'
         await update.message.reply_text("Introduce la *dirección* del cliente:", parse_mode="Markdown")
         return CLIENT_SUBMENU
     if field == 'dirección':
-        if not value:
-            await update.message.reply_text("La dirección no puede estar vacía. Intenta de nuevo:")
-            return CLIENT_SUBMENU
         context.user_data['nuevo_cliente']['address'] = value
         # Confirmación
         cliente = context.user_data['nuevo_cliente']
@@ -502,14 +674,16 @@ Dirección: {cliente['address']}
         if value.lower() in ['sí', 'si', 's']:
             cliente = context.user_data['nuevo_cliente']
             cliente['tenant_id'] = context.user_data.get('tenant_id')
-            def inserta():
-                return supabase.table("companies").insert(cliente).execute()
-            response = await asyncio.to_thread(inserta)
+            client = await sesiones.cliente_de(update.effective_user.id, supabase)
+            response = await client.table("companies").insert(cliente).execute()
             if getattr(response, 'error', None):
                 await update.message.reply_text(f"Error al guardar el cliente: {response.error}")
                 context.user_data.pop('nuevo_cliente', None)
                 context.user_data.pop('awaiting_field', None)
                 return await mostrar_submenu_clientes(update, context)
+            invalidar_facetas(cliente['tenant_id'])
+            if response.data:
+                indexar_cliente(cliente['tenant_id'], response.data[0]['id'], response.data[0])
             await update.message.reply_text("✅ Cliente añadido correctamente.")
         else:
             await update.message.reply_text("Alta cancelada. No se guardó ningún cliente.")
@@ -528,21 +702,28 @@ async def ver_ficha_cliente(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not cliente_id:
         await update.message.reply_text("No hay cliente seleccionado.")
         return CLIENT_SUBMENU
-    def consulta():
-        return supabase.table("companies").select("*").eq("id", cliente_id).single().execute()
-    response = await asyncio.to_thread(consulta)
-    cliente = response.data
-    if not cliente:
-        await update.message.reply_text("No se encontró la ficha del cliente.")
-        return CLIENT_SUBMENU
-    ficha = f"📄 *Ficha del Cliente*\n\n"
-    ficha += f"Nombre: {cliente.get('client_name', '-')}\n"
-    ficha += f"Ciudad: {cliente.get('city', '-')}\n"
-    ficha += f"Ruta: {cliente.get('route', '-')}\n"
-    ficha += f"Categoría: {cliente.get('category', '-')}\n"
-    ficha += f"Contacto: {cliente.get('contact_person', '-')}\n"
-    ficha += f"Teléfono: {cliente.get('phone', '-')}\n"
-    ficha += f"Dirección: {cliente.get('address', '-')}\n"
+    tenant_id = context.user_data.get('tenant_id')
+    clave = (tenant_id, cliente_id)
+    entrada = _fichas_cache.get(clave)
+    if entrada is None:
+        lectura = _fichas_en_lectura.setdefault(clave, {'n': 0, 'invalidada': False})
+        lectura['n'] += 1
+        try:
+            client = await sesiones.cliente_de(update.effective_user.id, supabase)
+            response = await client.table("companies").select("*").eq("id", cliente_id).eq("tenant_id", tenant_id).single().execute()
+        finally:
+            lectura['n'] -= 1
+            if not lectura['n']:
+                _fichas_en_lectura.pop(clave, None)
+        cliente = response.data
+        if not cliente:
+            await update.message.reply_text("No se encontró la ficha del cliente.")
+            return CLIENT_SUBMENU
+        entrada = {'cliente': cliente, 'ficha': renderizar_ficha(cliente)}
+        # Si se modificó mientras se consultaba, no se cachea la lectura antigua
+        if not lectura['invalidada']:
+            _fichas_cache.set(clave, entrada)
+    ficha = entrada['ficha']
     keyboard = [
         ["Volver al Submenú de Clientes"],
         ["Volver al Menú Principal"]
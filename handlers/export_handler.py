@@ -0,0 +1,122 @@
+# Exportación de clientes/productos como documento CSV comprimido (/export).
+# Las filas se leen por páginas keyset y se escriben en streaming a un gzip sobre un
+# fichero temporal, así la memoria depende del tamaño de página y no de la tabla.
+
+import asyncio
+import csv
+import gzip
+import io
+import logging
+import tempfile
+from datetime import datetime
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import EXPORT_PAGE_SIZE
+from db.conexion import supabase_admin as supabase
+from db.sesiones import sesiones
+from db.paginacion import pagina_keyset, recortar_pagina
+
+logger = logging.getLogger(__name__)
+
+# Entidad del comando -> (tabla, columnas exportadas, nombre del fichero)
+EXPORTABLES = {
+    "clients": ("companies", ("id", "client_name", "city", "route", "category", "contact_person", "phone", "address"), "clientes"),
+    "products": ("products", ("id", "sku", "name", "description", "category", "supplier_id", "price", "stock"), "productos"),
+}
+MAX_SPOOL_EN_MEMORIA = 1024 * 1024  # a partir de 1 MB comprimido el temporal pasa a disco
+_exportaciones = asyncio.Semaphore(2)  # exportaciones simultáneas en todo el bot
+
+
+async def iterar_paginas(client, tabla: str, columnas, tenant_id, filtros: dict, tamano_pagina: int = None):
+    """Genera las filas de `tabla` del tenant en páginas (listas), ordenadas por id."""
+    tamano_pagina = tamano_pagina or EXPORT_PAGE_SIZE
+    ultimo = None
+    while True:
+        sel = client.table(tabla).select(", ".join(columnas)).eq("tenant_id", tenant_id)
+        for campo, valor in filtros.items():
+            sel = sel.eq(campo, valor)
+        response = await pagina_keyset(sel, ("id",), ultimo, tamano_pagina).execute()
+        filas, hay_mas = recortar_pagina(response.data or [], tamano_pagina)
+        if filas:
+            yield filas
+        if not hay_mas:
+            return
+        ultimo = [filas[-1]["id"]]
+
+
+class EscritorCSVGzip:
+    """Escribe filas como CSV comprimido en `destino` (fichero binario), página a página."""
+
+    def __init__(self, destino, columnas):
+        self.total = 0
+        self._gzip = gzip.GzipFile(fileobj=destino, mode="wb")
+        self._texto = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._texto, fieldnames=columnas, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def escribir(self, filas) -> None:
+        self._writer.writerows(filas)
+        self.total += len(filas)
+
+    def cerrar(self) -> None:
+        """Vacía el buffer y escribe el final del gzip; `destino` queda abierto."""
+        self._texto.flush()
+        self._texto.detach()
+        self._gzip.close()
+
+
+def parsear_filtros(args, columnas):
+    """Convierte ['city=Madrid', ...] en {'city': 'Madrid'}. Lanza ValueError si no es válido."""
+    filtros = {}
+    for arg in args:
+        campo, sep, valor = arg.partition("=")
+        if not sep or campo not in columnas or campo == "id":
+            raise ValueError(f"Filtro no válido: {arg}")
+        filtros[campo] = valor
+    return filtros
+
+
+async def exportar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export clients|products [campo=valor ...] — envía un CSV.gz con los datos del tenant."""
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return
+
+    args = context.args or []
+    if not args or args[0] not in EXPORTABLES:
+        await update.message.reply_text("Uso: /export clients|products [campo=valor ...]\nEjemplo: /export clients city=Madrid")
+        return
+
+    tabla, columnas, nombre = EXPORTABLES[args[0]]
+    try:
+        filtros = parsear_filtros(args[1:], columnas)
+    except ValueError as e:
+        await update.message.reply_text(f"{e}. Campos disponibles: {', '.join(columnas[1:])}")
+        return
+
+    client = await sesiones.cliente_de(update.effective_user.id, supabase)
+    aviso = await update.message.reply_text("⏳ Preparando la exportación...")
+    async with _exportaciones:
+        destino = tempfile.SpooledTemporaryFile(max_size=MAX_SPOOL_EN_MEMORIA)
+        try:
+            escritor = EscritorCSVGzip(destino, columnas)
+            async for filas in iterar_paginas(client, tabla, columnas, tenant_id, filtros):
+                # La compresión (y el volcado a disco del temporal) es bloqueante: va a un hilo
+                await asyncio.to_thread(escritor.escribir, filas)
+            await asyncio.to_thread(escritor.cerrar)
+            total = escritor.total
+            destino.seek(0)
+            await update.message.reply_document(
+                document=destino,
+                filename=f"{nombre}_{datetime.now():%Y%m%d_%H%M}.csv.gz",
+                caption=f"{total} filas exportadas."
+            )
+            await aviso.delete()
+        except Exception as e:
+            logger.error(f"Error al exportar {tabla}: {e}")
+            await aviso.edit_text("Ocurrió un error al generar la exportación.")
+        finally:
+            destino.close()
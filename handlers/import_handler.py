@@ -0,0 +1,176 @@
+# Importación masiva de clientes desde documentos CSV/XLSX enviados al bot.
+# El fichero se lee fila a fila y se inserta en lotes, de modo que la memoria
+# usada no depende del tamaño del fichero.
+
+import asyncio
+import csv
+import logging
+import os
+import tempfile
+import time
+
+from postgrest.types import ReturnMethod
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import IMPORT_BATCH_SIZE
+from db.conexion import supabase_admin as supabase
+from db.sesiones import sesiones
+from utils.validators import CAMPOS_CLIENTE, validar_fila_cliente
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES = (".csv", ".xlsx")
+MAX_ERRORES_DETALLE = 10       # errores que se detallan en el resumen final
+INTERVALO_PROGRESO = 2.0       # segundos mínimos entre ediciones del mensaje de progreso
+
+
+# --- Lectura en streaming ---
+
+def leer_filas_csv(path: str):
+    """Genera dicts por fila de un CSV, detectando el separador (',' o ';')."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.DictReader(f, dialect=dialecto)
+
+
+def leer_filas_xlsx(path: str):
+    """Genera dicts por fila de la primera hoja de un XLSX en modo de solo lectura."""
+    from openpyxl import load_workbook  # dependencia solo necesaria para XLSX
+
+    libro = load_workbook(path, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        cabecera = [str(c or "").strip() for c in next(filas, ())]
+        for fila in filas:
+            if any(v not in (None, "") for v in fila):
+                yield dict(zip(cabecera, fila))
+    finally:
+        libro.close()
+
+
+def leer_lotes(filas, tamano: int, max_errores: int = MAX_ERRORES_DETALLE):
+    """Lee las filas en tramos de `tamano` filas leídas (válidas o no).
+
+    Genera (filas_válidas, errores_del_tramo, nº_errores_del_tramo, nº_leídas); de cada
+    tramo solo se guardan los primeros `max_errores` errores, el resto solo se cuenta.
+    """
+    lote, errores, n_errores, leidas = [], [], 0, 0
+    for numero, fila in enumerate(filas, start=2):  # la fila 1 es la cabecera
+        leidas += 1
+        cliente, fallos = validar_fila_cliente(fila)
+        if fallos:
+            n_errores += 1
+            if len(errores) < max_errores:
+                errores.append((numero, " ".join(fallos)))
+        else:
+            lote.append(cliente)
+        if leidas >= tamano:
+            yield lote, errores, n_errores, leidas
+            lote, errores, n_errores, leidas = [], [], 0, 0
+    if leidas:
+        yield lote, errores, n_errores, leidas
+
+
+# --- Handlers ---
+
+async def ayuda_importacion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Explica el formato esperado del fichero de importación."""
+    columnas = ", ".join(CAMPOS_CLIENTE)
+    await update.message.reply_text(
+        "Para importar clientes envía un documento CSV o XLSX con una fila de cabecera "
+        f"con las columnas: {columnas}.\n"
+        "Cada fila se valida con las mismas reglas que el alta manual."
+    )
+
+
+async def importar_clientes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Recibe un documento CSV/XLSX y da de alta sus clientes en lotes."""
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return
+
+    documento = update.message.document
+    extension = os.path.splitext(documento.file_name or "")[1].lower()
+    if extension not in EXTENSIONES:
+        await update.message.reply_text("Formato no soportado. Envía un fichero .csv o .xlsx.")
+        return
+
+    progreso = await update.message.reply_text("📥 Importando clientes...")
+    fd, path = tempfile.mkstemp(suffix=extension)
+    os.close(fd)
+    try:
+        fichero = await documento.get_file()
+        await fichero.download_to_drive(path)
+        lector = leer_filas_xlsx if extension == ".xlsx" else leer_filas_csv
+        client = await sesiones.cliente_de(update.effective_user.id, supabase)
+        resumen = await importar_fichero(lector(path), tenant_id, progreso, client=client)
+    except ImportError:
+        await progreso.edit_text("No se pueden leer ficheros XLSX: falta la librería openpyxl. Usa CSV.")
+        return
+    except Exception as e:
+        logger.error(f"Error al importar clientes: {e}")
+        await progreso.edit_text(f"Error al importar el fichero: {e}")
+        return
+    finally:
+        os.remove(path)
+
+    await progreso.edit_text(resumen)
+
+
+async def importar_fichero(filas, tenant_id, progreso, tamano_lote: int = None, client=None) -> str:
+    """Valida e inserta las filas en lotes, editando `progreso`. Devuelve el resumen final."""
+    tamano_lote = tamano_lote or IMPORT_BATCH_SIZE
+    client = client or supabase
+    lotes = leer_lotes(filas, tamano_lote)
+    leidas = insertadas = 0
+    errores, n_errores = [], 0
+    ultimo_aviso = time.monotonic()
+
+    while True:
+        # La lectura y validación del fichero es bloqueante: se hace fuera del event loop
+        siguiente = await asyncio.to_thread(next, lotes, None)
+        if siguiente is None:
+            break
+        lote, errores_tramo, n_errores_tramo, n = siguiente
+        leidas += n
+        n_errores += n_errores_tramo
+        errores.extend(errores_tramo[:MAX_ERRORES_DETALLE - len(errores)])
+
+        if lote:
+            for cliente in lote:
+                cliente['tenant_id'] = tenant_id
+            try:
+                await client.table("companies").insert(lote, returning=ReturnMethod.minimal).execute()
+                insertadas += len(lote)
+            except Exception as e:
+                logger.error(f"Error al insertar un lote de {len(lote)} clientes: {e}")
+                n_errores += len(lote)
+                if len(errores) < MAX_ERRORES_DETALLE:
+                    errores.append((f"{leidas - n + 2}-{leidas + 1}", f"Lote rechazado por la base de datos: {e}"))
+
+        if time.monotonic() - ultimo_aviso >= INTERVALO_PROGRESO:
+            ultimo_aviso = time.monotonic()
+            try:
+                await progreso.edit_text(f"📥 Importando clientes... {leidas} filas leídas, {insertadas} insertadas.")
+            except Exception as e:
+                logger.info(f"No se pudo actualizar el progreso de la importación: {e}")
+
+    if insertadas:
+        from handlers.client_handler import invalidar_facetas, invalidar_indice_busqueda
+        invalidar_facetas(tenant_id)
+        invalidar_indice_busqueda(tenant_id)
+
+    resumen = f"✅ Importación terminada: {insertadas} clientes insertados de {leidas} filas."
+    if n_errores:
+        resumen += f"\n⚠️ {n_errores} filas con errores:"
+        resumen += "".join(f"\n- Fila {fila}: {motivo}" for fila, motivo in errores)
+        if n_errores > len(errores):
+            resumen += f"\n... y {n_errores - len(errores)} más."
+    return resumen
@@ -0,0 +1,94 @@
+# Búsqueda de productos en modo inline (`@bot tornillo`) desde cualquier chat.
+# Se responde desde el catálogo en memoria del tenant (db/catalogo.py), sin consultas
+# a la base de datos por pulsación.
+
+import asyncio
+import logging
+
+from telegram import InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent, Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from config import INLINE_CACHE_TIME, INLINE_DEBOUNCE
+from handlers.product_handler import obtener_catalogo
+from utils.cache import TTLCache
+from utils.search_index import normalizar
+
+logger = logging.getLogger(__name__)
+
+TAMANO_PAGINA = 50     # máximo de resultados por respuesta que admite Telegram
+MAX_RESULTADOS = 200   # resultados de una búsqueda que se pueden recorrer con next_offset
+# Ids ya ordenados de cada búsqueda: {(tenant_id, consulta): [ids]}. Al pedir la página
+# siguiente no se repite la búsqueda. Misma vida que la caché de Telegram.
+_resultados_cache = TTLCache(maxsize=1024, ttl=INLINE_CACHE_TIME)
+# Última inline query recibida por usuario: {user_id: query_id}
+_ultima_consulta = {}
+
+
+def _resultado(producto: dict) -> InlineQueryResultArticle:
+    precio = producto.get('price') or 0
+    stock = producto.get('stock') or 0
+    descripcion = f"SKU: {producto.get('sku', '-')} · {precio:.2f} $ · Stock: {stock}"
+    texto = f"{producto.get('name', '-')}\n{descripcion}"
+    if producto.get('description'):
+        texto += f"\n{producto['description']}"
+    return InlineQueryResultArticle(
+        id=str(producto['id']),
+        title=producto.get('name') or "-",
+        description=descripcion,
+        input_message_content=InputTextMessageContent(texto),
+        thumbnail_url=producto.get('image_url'),
+    )
+
+
+async def _es_la_ultima(usuario: int, query_id: str) -> bool:
+    """Espera INLINE_DEBOUNCE y dice si en ese tiempo no llegó otra consulta del mismo usuario."""
+    _ultima_consulta[usuario] = query_id
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    if _ultima_consulta.get(usuario) != query_id:
+        return False
+    del _ultima_consulta[usuario]
+    return True
+
+
+async def buscar_productos_inline(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Responde a `@bot texto` con productos del tenant, de 50 en 50 mediante next_offset.
+
+    Se registra con block=False: mientras una consulta espera, las siguientes pulsaciones
+    del usuario la sustituyen y solo se responde a la última.
+    """
+    query = update.inline_query
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await query.answer(
+            [], cache_time=0, is_personal=True,
+            button=InlineQueryResultsButton("Inicia sesión para buscar productos", start_parameter="login"),
+        )
+        return
+
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    # Las páginas siguientes son scroll del mismo resultado: no se agrupan
+    if offset == 0 and not await _es_la_ultima(query.from_user.id, query.id):
+        return
+
+    try:
+        catalogo = await obtener_catalogo(tenant_id)
+        clave = (tenant_id, normalizar(query.query).strip())
+        ids = _resultados_cache.get(clave)
+        if ids is None:
+            ids = [p['id'] for p in catalogo.buscar(clave[1], MAX_RESULTADOS)]
+            _resultados_cache.set(clave, ids)
+        pagina = [catalogo.productos[i] for i in ids[offset:offset + TAMANO_PAGINA] if i in catalogo.productos]
+        siguiente = str(offset + TAMANO_PAGINA) if offset + TAMANO_PAGINA < len(ids) else ""
+
+        # Los resultados dependen del tenant del usuario: is_personal evita que Telegram
+        # los comparta con otros usuarios que escriban lo mismo.
+        await query.answer(
+            [_resultado(p) for p in pagina],
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=True,
+            next_offset=siguiente,
+        )
+    except BadRequest as e:
+        # Consulta caducada: el usuario ya siguió escribiendo
+        logger.info(f"No se pudo responder a la inline query {query.id}: {e}")
@@ -1,6 +1,6 @@
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes
-from states import CLIENT_SUBMENU, PRODUCT_SUBMENU, SALE_SUBMENU
+from states import SELECTING_ACTION, CLIENT_SUBMENU, PRODUCT_SUBMENU, SALE_SUBMENU
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,7 +19,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif update.callback_query:
         await update.callback_query.message.reply_text("Selecciona una opción:", reply_markup=reply_markup)
     
-    return "SELECTING_ACTION"
+    return SELECTING_ACTION
 
 async def handle_main_menu_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja la selección del menú principal y redirige al submenú correspondiente."""
@@ -36,7 +36,7 @@ async def handle_main_menu_selection(update: Update, context: ContextTypes.DEFAU
         return await mostrar_submenu_ventas(update, context)
     elif "configuración" in text or "configuracion" in text:
         await update.message.reply_text("🔧 Configuración (en desarrollo)")
-        return "SELECTING_ACTION"
+        return SELECTING_ACTION
     else:
         await update.message.reply_text("Opción no reconocida. Por favor, usa los botones del menú.")
-        return "SELECTING_ACTION"
+        return SELECTING_ACTION
@@ -1,7 +1,16 @@
 # Handler para el submenú de Gestión Productos
+import asyncio
+import contextlib
+import logging
+import time
+
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from config import supabase_admin as supabase
+from config import CATALOG_SYNC_INTERVAL, CATALOG_FULL_SYNC_INTERVAL
+from db.conexion import supabase_admin as supabase
+from db.catalogo import Catalogo, sincronizar_catalogo
+from db.facetas import etiqueta_faceta
 # Importar los estados desde states.py para mantener consistencia
 from states import (
     SELECTING_ACTION,
@@ -10,6 +19,8 @@ from states import (
     VIEWING_PRODUCT
 )
 
+logger = logging.getLogger(__name__)
+
 PRODUCT_KEYBOARD = [
     ["Añadir Producto", "Consulta Producto"],
     ["Volver al Menú Principal"]
@@ -23,6 +34,94 @@ PRODUCT_FILTER_OPTIONS = {
     "stock": "Disponibilidad"
 }
 
+# Catálogo en memoria por tenant: {tenant_id: Catalogo}. Los filtros se resuelven
+# contra él y una tarea en segundo plano le aplica los cambios por updated_at.
+_catalogos = {}
+_catalogos_locks = {}
+_catalogos_carga_completa = {}  # {tenant_id: time.monotonic() de la última carga completa}
+_tarea_sincronizacion = None
+
+async def obtener_catalogo(tenant_id) -> Catalogo:
+    """Devuelve el catálogo del tenant, cargándolo entero la primera vez."""
+    catalogo = _catalogos.get(tenant_id)
+    if catalogo is not None:
+        return catalogo
+    async with _catalogos_locks.setdefault(tenant_id, asyncio.Lock()):
+        catalogo = _catalogos.get(tenant_id)
+        if catalogo is None:
+            catalogo = Catalogo()
+            await sincronizar_catalogo(supabase, tenant_id, catalogo)
+            _catalogos[tenant_id] = catalogo
+            _catalogos_carga_completa[tenant_id] = time.monotonic()
+    return catalogo
+
+async def refrescar_catalogos() -> None:
+    """Aplica el delta de updated_at a cada catálogo cargado.
+
+    El delta no ve las filas borradas, así que cada CATALOG_FULL_SYNC_INTERVAL el
+    catálogo se recarga entero en uno nuevo y se sustituye al terminar.
+    """
+    for tenant_id in list(_catalogos):
+        async with _catalogos_locks.setdefault(tenant_id, asyncio.Lock()):
+            try:
+                if time.monotonic() - _catalogos_carga_completa.get(tenant_id, 0) >= CATALOG_FULL_SYNC_INTERVAL:
+                    nuevo = Catalogo()
+                    await sincronizar_catalogo(supabase, tenant_id, nuevo)
+                    _catalogos[tenant_id] = nuevo
+                    _catalogos_carga_completa[tenant_id] = time.monotonic()
+                else:
+                    await sincronizar_catalogo(supabase, tenant_id, _catalogos[tenant_id])
+            except Exception as e:
+                logger.warning(f"No se pudo sincronizar el catálogo del tenant {tenant_id}: {e}")
+
+async def _bucle_sincronizacion() -> None:
+    while True:
+        await asyncio.sleep(CATALOG_SYNC_INTERVAL)
+        await refrescar_catalogos()
+
+async def iniciar_sincronizacion_catalogo(application=None) -> None:
+    """Arranca la sincronización periódica. Se registra como post_init de la Application."""
+    global _tarea_sincronizacion
+    _tarea_sincronizacion = asyncio.create_task(_bucle_sincronizacion())
+
+async def detener_sincronizacion_catalogo(application=None) -> None:
+    """Cancela la sincronización periódica. Se registra como post_stop de la Application."""
+    if _tarea_sincronizacion is not None:
+        _tarea_sincronizacion.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _tarea_sincronizacion
+
+async def enviar_foto_producto(message, product: dict, **kwargs):
+    """Envía la foto del producto reutilizando el file_id de Telegram si ya se subió antes.
+
+    El file_id solo vale para la URL de la que se obtuvo (image_file_url); si image_url
+    ha cambiado, o Telegram lo rechaza, se envía la URL y se guarda el file_id nuevo.
+    """
+    url = product['image_url']
+    if product.get('image_file_id') and product.get('image_file_url') == url:
+        try:
+            return await message.reply_photo(photo=product['image_file_id'], **kwargs)
+        except BadRequest as e:
+            logger.info(f"file_id caducado para el producto {product.get('id')}: {e}")
+
+    enviado = await message.reply_photo(photo=url, **kwargs)
+    if enviado and enviado.photo:
+        await guardar_file_id(product, enviado.photo[-1].file_id, url)
+    return enviado
+
+async def guardar_file_id(product: dict, file_id: str, url: str) -> None:
+    """Persiste el file_id de la foto; si falla, solo se pierde la optimización."""
+    product['image_file_id'] = file_id
+    product['image_file_url'] = url
+    try:
+        # Condicionado a image_url para no asociar el file_id a una imagen que ya cambió
+        await supabase.table("products").update({
+            "image_file_id": file_id,
+            "image_file_url": url,
+        }).eq("id", product['id']).eq("image_url", url).execute()
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el file_id del producto {product.get('id')}: {e}")
+
 async def mostrar_submenu_productos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Muestra el submenú de gestión de productos."""
     keyboard = ReplyKeyboardMarkup(PRODUCT_KEYBOARD, resize_keyboard=True, one_time_keyboard=True)
@@ -91,13 +190,18 @@ async def callback_filtro_producto(update: Update, context: ContextTypes.DEFAULT
         await query.edit_message_text("Selecciona la disponibilidad:", reply_markup=keyboard)
         return PRODUCT_FILTER_RESPONSE
 
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await query.edit_message_text("Sesión expirada. Por favor, vuelve a iniciar sesión.")
+        return SELECTING_ACTION
+
     try:
-        response = supabase.table("products").select(filter_type).execute()
-        if response.data:
-            items = sorted({str(p[filter_type]) for p in response.data if p.get(filter_type) and str(p[filter_type]).strip()})
+        catalogo = await obtener_catalogo(tenant_id)
+        facetas = catalogo.facetas(filter_type)
+        if facetas:
             buttons = [
-                [InlineKeyboardButton(item, callback_data=f"product_value_{filter_type}_{item}")]
-                for item in items
+                [InlineKeyboardButton(etiqueta_faceta(item, n), callback_data=f"product_value_{filter_type}_{item}")]
+                for item, n in facetas
             ]
             keyboard = InlineKeyboardMarkup(buttons)
             await query.edit_message_text(f"Selecciona una opción para {PRODUCT_FILTER_OPTIONS[filter_type]}:", reply_markup=keyboard)
@@ -119,20 +223,19 @@ async def mostrar_productos_filtrados(update: Update, context: ContextTypes.DEFA
     filter_type = parts[2]
     filter_value = "_".join(parts[3:])
 
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await query.edit_message_text("Sesión expirada. Por favor, vuelve a iniciar sesión.")
+        return SELECTING_ACTION
+
     try:
-        if filter_type == 'stock':
-            filter_value_bool = filter_value == 'true'
-            if filter_value_bool:
-                response = supabase.table("products").select("*").gt('stock', 0).execute()
-            else:
-                response = supabase.table("products").select("*").eq('stock', 0).execute()
-        else:
-            response = supabase.table("products").select("*").eq(filter_type, filter_value).execute()
+        catalogo = await obtener_catalogo(tenant_id)
+        productos = catalogo.filtrar(filter_type, filter_value)
 
-        if response.data:
-            context.user_data['filtered_products'] = response.data
+        if productos:
+            context.user_data['filtered_products'] = productos
             message = "Productos encontrados:\n\n"
-            for i, product in enumerate(response.data):
+            for i, product in enumerate(productos):
                 message += f"{i + 1}. [SKU: {product.get('sku','-')}] {product['name']} (Stock: {product['stock']})\n"
             
             message += "\nSelecciona un número para ver detalles o escribe 'cancelar'."
@@ -176,8 +279,9 @@ async def ver_detalle_producto(update: Update, context: ContextTypes.DEFAULT_TYP
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
         
         if product.get('image_url'):
-            await update.message.reply_photo(
-                photo=product['image_url'],
+            await enviar_foto_producto(
+                update.message,
+                product,
                 caption=message,
                 parse_mode='Markdown',
                 reply_markup=reply_markup
@@ -1,10 +1,18 @@
 # Handler para el submenú de Gestión Ventas
-from config import supabase_admin as supabase
-from telegram import Update, ReplyKeyboardMarkup
+import logging
+import re
+from datetime import date
+
+from db.conexion import supabase_admin as supabase
+from db.sesiones import sesiones
+from db.ventas import DIMENSIONES_VENTA, desplazar_periodo, leer_rollup, periodo_de
+from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from states import SALE_SUBMENU
+from states import SELECTING_ACTION, SALE_SUBMENU, SALE_SELECT_CLIENT, SALE_CART
+
+logger = logging.getLogger(__name__)
 
-SALE_SUBMENU = [
+SALE_KEYBOARD = [
     ["Añadir Venta"],
     ["Consulta Venta"],
     ["Modificar Venta"],
@@ -12,22 +20,269 @@ SALE_SUBMENU = [
     ["Volver Menú principal"]
 ]
 
+# "1005 x3", "tornillo * 2": texto del producto y cantidad (1 si no se indica).
+# El separador es obligatorio: en "Agua 1500" el número es parte del nombre, no la cantidad
+LINEA_RE = re.compile(r"^(?P<texto>.+?)\s*[xX*]\s*(?P<cantidad>\d+)$")
+MAX_OPCIONES = 5
+
 async def mostrar_submenu_ventas(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = ReplyKeyboardMarkup(SALE_SUBMENU, resize_keyboard=True)
-    await update.message.reply_text(
+    keyboard = ReplyKeyboardMarkup(SALE_KEYBOARD, resize_keyboard=True)
+    await update.effective_message.reply_text(
         "Gestión de Ventas - Selecciona una opción:",
         reply_markup=keyboard
     )
     return SALE_SUBMENU
 
-# Stubs para acciones de ventas
-async def anadir_venta(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Funcionalidad para añadir venta (pendiente de implementación)")
+# --- Alta de venta con carrito ---
+# El carrito vive en context.user_data['carrito'] hasta que se confirma:
+# {'company_id', 'cliente', 'lineas': {product_id: {'sku', 'name', 'price', 'quantity'}}}
+
+def texto_carrito(carrito: dict) -> str:
+    """Resumen del carrito con el total calculado con los precios del catálogo."""
+    texto = f"🛒 Venta para {carrito['cliente']}\n\n"
+    total = 0
+    for i, linea in enumerate(carrito['lineas'].values(), start=1):
+        subtotal = linea['quantity'] * (linea['price'] or 0)
+        total += subtotal
+        texto += f"{i}. [SKU: {linea.get('sku', '-')}] {linea['name']} x{linea['quantity']} = {subtotal:.2f}\n"
+    if not carrito['lineas']:
+        texto += "(carrito vacío)\n"
+    texto += f"\nTotal: {total:.2f}\n\nEscribe el SKU o nombre de otro producto y la cantidad (p. ej. '1005 x3')."
+    return texto
+
+def teclado_carrito(carrito: dict) -> InlineKeyboardMarkup:
+    botones = []
+    if carrito['lineas']:
+        botones.append([InlineKeyboardButton("✅ Confirmar venta", callback_data="sale_confirm")])
+        botones.append([InlineKeyboardButton("🗑 Vaciar carrito", callback_data="sale_clear")])
+    botones.append([InlineKeyboardButton("Cancelar", callback_data="sale_cancel")])
+    return InlineKeyboardMarkup(botones)
+
+def anadir_al_carrito(carrito: dict, producto: dict, cantidad: int) -> str:
+    """Suma `cantidad` del producto al carrito. Devuelve un aviso si no hay stock suficiente."""
+    linea = carrito['lineas'].get(producto['id'])
+    total = cantidad + (linea['quantity'] if linea else 0)
+    if total > (producto.get('stock') or 0):
+        return f"⚠️ Stock insuficiente de {producto.get('name')}: quedan {producto.get('stock') or 0}."
+    carrito['lineas'][producto['id']] = {
+        'sku': producto.get('sku'),
+        'name': producto.get('name'),
+        'price': producto.get('price') or 0,
+        'quantity': total,
+    }
     return None
 
+async def anadir_venta(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inicia el alta de una venta pidiendo el cliente."""
+    if not context.user_data.get('tenant_id'):
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return SELECTING_ACTION
+    context.user_data.pop('carrito', None)
+    await update.message.reply_text("Escribe el nombre del cliente de la venta:")
+    return SALE_SELECT_CLIENT
+
+async def buscar_cliente_venta(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Busca el cliente de la venta en el índice de búsqueda de clientes y ofrece botones."""
+    from handlers.client_handler import obtener_indice_busqueda
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return SELECTING_ACTION
+
+    indice = await obtener_indice_busqueda(tenant_id)
+    resultados = indice.search(update.message.text.strip(), limite=MAX_OPCIONES)
+    if not resultados:
+        await update.message.reply_text("No se encontró ningún cliente. Prueba con otro nombre:")
+        return SALE_SELECT_CLIENT
+    botones = [
+        [InlineKeyboardButton(doc.get('client_name') or '-', callback_data=f"sale_client_{doc_id}")]
+        for doc_id, doc, _ in resultados
+    ]
+    await update.message.reply_text("Selecciona el cliente:", reply_markup=InlineKeyboardMarkup(botones))
+    return SALE_SELECT_CLIENT
+
+async def seleccionar_cliente_venta(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Crea el carrito para el cliente elegido."""
+    query = update.callback_query
+    await query.answer()
+    cliente_id = query.data.replace("sale_client_", "")
+    nombre = next((b.text for fila in query.message.reply_markup.inline_keyboard for b in fila
+                   if b.callback_data == query.data), "-")
+    context.user_data['carrito'] = {'company_id': cliente_id, 'cliente': nombre, 'lineas': {}}
+    carrito = context.user_data['carrito']
+    await query.edit_message_text(texto_carrito(carrito), reply_markup=teclado_carrito(carrito))
+    return SALE_CART
+
+async def anadir_linea(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Añade al carrito el producto escrito (SKU exacto o búsqueda por nombre)."""
+    from handlers.product_handler import obtener_catalogo
+    carrito = context.user_data.get('carrito')
+    tenant_id = context.user_data.get('tenant_id')
+    if not carrito or not tenant_id:
+        await update.message.reply_text("Sesión expirada. Vuelve a empezar la venta.")
+        return await mostrar_submenu_ventas(update, context)
+
+    entrada = update.message.text.strip()
+    coincidencia = LINEA_RE.match(entrada)
+    texto, cantidad = (coincidencia['texto'], int(coincidencia['cantidad'])) if coincidencia else (entrada, 1)
+    if cantidad <= 0:
+        await update.message.reply_text("La cantidad debe ser mayor que cero.")
+        return SALE_CART
+
+    catalogo = await obtener_catalogo(tenant_id)
+    productos = catalogo.filtrar("sku", texto) or catalogo.buscar(texto, MAX_OPCIONES)
+    if not productos:
+        await update.message.reply_text(f"No se encontró ningún producto para '{texto}'.")
+        return SALE_CART
+    if len(productos) > 1:
+        botones = [
+            [InlineKeyboardButton(f"[{p.get('sku', '-')}] {p.get('name')}", callback_data=f"sale_add_{p['id']}_{cantidad}")]
+            for p in productos[:MAX_OPCIONES]
+        ]
+        await update.message.reply_text("¿Qué producto?", reply_markup=InlineKeyboardMarkup(botones))
+        return SALE_CART
+
+    aviso = anadir_al_carrito(carrito, productos[0], cantidad)
+    if aviso:
+        await update.message.reply_text(aviso)
+    await update.message.reply_text(texto_carrito(carrito), reply_markup=teclado_carrito(carrito))
+    return SALE_CART
+
+async def acciones_carrito(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Botones del carrito: elegir producto, confirmar, vaciar o cancelar."""
+    query = update.callback_query
+    await query.answer()
+    carrito = context.user_data.get('carrito')
+    tenant_id = context.user_data.get('tenant_id')
+    if not carrito or not tenant_id:
+        await query.edit_message_text("Sesión expirada. Vuelve a empezar la venta.")
+        return await mostrar_submenu_ventas(update, context)
+
+    if query.data.startswith("sale_add_"):
+        from handlers.product_handler import obtener_catalogo
+        producto_id, _, cantidad = query.data.replace("sale_add_", "").rpartition("_")
+        producto = (await obtener_catalogo(tenant_id)).productos.get(producto_id)
+        aviso = anadir_al_carrito(carrito, producto, int(cantidad)) if producto else "Producto no encontrado."
+        await query.edit_message_text(
+            (aviso + "\n\n" if aviso else "") + texto_carrito(carrito), reply_markup=teclado_carrito(carrito)
+        )
+        return SALE_CART
+    if query.data == "sale_clear":
+        carrito['lineas'].clear()
+        await query.edit_message_text(texto_carrito(carrito), reply_markup=teclado_carrito(carrito))
+        return SALE_CART
+    if query.data == "sale_cancel":
+        context.user_data.pop('carrito', None)
+        await query.edit_message_text("Venta cancelada.")
+        return await mostrar_submenu_ventas(update, context)
+    return await confirmar_venta(update, context)
+
+async def confirmar_venta(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Registra la venta con una sola llamada RPC (create_sale): factura, líneas, total y stock
+    se escriben en la misma transacción, o no se escribe nada."""
+    query = update.callback_query
+    carrito = context.user_data['carrito']
+    tenant_id = context.user_data['tenant_id']
+    if not carrito['lineas']:
+        await query.edit_message_text(texto_carrito(carrito), reply_markup=teclado_carrito(carrito))
+        return SALE_CART
+
+    try:
+        client = await sesiones.cliente_de(update.effective_user.id, supabase)
+        response = await client.rpc("create_sale", {
+            "p_tenant_id": tenant_id,
+            "p_company_id": carrito['company_id'],
+            "p_items": [{"product_id": pid, "quantity": l['quantity']} for pid, l in carrito['lineas'].items()],
+        }).execute()
+        factura = response.data[0]
+    except Exception as e:
+        logger.error(f"Error al registrar la venta: {e}")
+        detalle = getattr(e, 'message', None) or str(e)
+        await query.edit_message_text(
+            f"❌ No se pudo registrar la venta: {detalle}\n\n" + texto_carrito(carrito),
+            reply_markup=teclado_carrito(carrito)
+        )
+        return SALE_CART
+
+    await _descontar_stock_catalogo(tenant_id, carrito)
+    context.user_data.pop('carrito', None)
+    await query.edit_message_text(
+        f"✅ Venta registrada: {factura['invoice_number']}\nCliente: {carrito['cliente']}\n"
+        f"Total: {float(factura['total_amount']):.2f}"
+    )
+    return await mostrar_submenu_ventas(update, context)
+
+async def _descontar_stock_catalogo(tenant_id, carrito: dict) -> None:
+    """Refleja la venta en el catálogo en memoria sin esperar a la siguiente sincronización."""
+    from handlers.product_handler import _catalogos
+    catalogo = _catalogos.get(tenant_id)
+    if catalogo is None:
+        return
+    filas = []
+    for producto_id, linea in carrito['lineas'].items():
+        producto = catalogo.productos.get(producto_id)
+        if producto is not None:
+            filas.append({**producto, 'stock': (producto.get('stock') or 0) - linea['quantity']})
+    catalogo.aplicar(filas)
+
+# --- Informe de ventas (lee solo sales_rollups) ---
+
+async def informe_ventas(tenant_id, periodo: str, dimension: str, client=None):
+    """Texto y teclado del informe de ventas de un mes agrupado por `dimension`."""
+    total, filas = await leer_rollup(client or supabase, tenant_id, periodo, dimension)
+    texto = f"📊 Ventas de {periodo[:7]} por {DIMENSIONES_VENTA[dimension]}\n"
+    if not total:
+        texto += "\nNo hay ventas registradas en este mes."
+    else:
+        texto += f"Total: {float(total['amount']):.2f} · {total['invoices']} facturas\n\n"
+        for i, fila in enumerate(filas, start=1):
+            nombre = fila.get('label') or fila.get('key') or "(sin asignar)"
+            texto += f"{i}. {nombre}: {float(fila['amount']):.2f} ({fila['invoices']} facturas, {fila['quantity']} uds.)\n"
+
+    botones = [[
+        InlineKeyboardButton(("• " if clave == dimension else "") + nombre, callback_data=f"sale_report_{clave}_{periodo}")
+        for clave, nombre in DIMENSIONES_VENTA.items()
+    ]]
+    navegacion = [InlineKeyboardButton("◀ Mes anterior", callback_data=f"sale_report_{dimension}_{desplazar_periodo(periodo, -1)}")]
+    if periodo < periodo_de(date.today()):
+        navegacion.append(InlineKeyboardButton("Mes siguiente ▶", callback_data=f"sale_report_{dimension}_{desplazar_periodo(periodo, 1)}"))
+    botones.append(navegacion)
+    return texto, InlineKeyboardMarkup(botones)
+
 async def consulta_venta(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Funcionalidad para consultar venta (pendiente de implementación)")
-    return None
+    """Muestra las ventas del mes en curso por ruta."""
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await update.message.reply_text("Error: No estás autenticado. Por favor, inicia sesión.")
+        return SELECTING_ACTION
+    try:
+        client = await sesiones.cliente_de(update.effective_user.id, supabase)
+        texto, teclado = await informe_ventas(tenant_id, periodo_de(date.today()), "route", client)
+    except Exception as e:
+        logger.error(f"Error al consultar el informe de ventas: {e}")
+        await update.message.reply_text("Ocurrió un error al consultar las ventas.")
+        return SALE_SUBMENU
+    await update.message.reply_text(texto, reply_markup=teclado)
+    return SALE_SUBMENU
+
+async def cambiar_informe_ventas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Cambia la dimensión o el mes del informe desde sus botones (sale_report_<dimensión>_<periodo>)."""
+    query = update.callback_query
+    await query.answer()
+    tenant_id = context.user_data.get('tenant_id')
+    if not tenant_id:
+        await query.edit_message_text("Sesión expirada. Por favor, vuelve a iniciar sesión.")
+        return SELECTING_ACTION
+    dimension, _, periodo = query.data.replace("sale_report_", "").rpartition("_")
+    try:
+        client = await sesiones.cliente_de(update.effective_user.id, supabase)
+        texto, teclado = await informe_ventas(tenant_id, periodo, dimension, client)
+    except Exception as e:
+        logger.error(f"Error al consultar el informe de ventas: {e}")
+        await query.edit_message_text("Ocurrió un error al consultar las ventas.")
+        return SALE_SUBMENU
+    await query.edit_message_text(texto, reply_markup=teclado)
+    return SALE_SUBMENU
 
 async def modificar_venta(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Funcionalidad para modificar venta (pendiente de implementación)")
@@ -1,86 +1,254 @@
-import os
+"""Generador de datos sintéticos para pruebas de carga.
+
+Crea tenants, clientes, productos, facturas y líneas de factura con una distribución
+realista (unas pocas rutas concentran la mayoría de clientes, las ciudades tienen una
+cola larga y unos pocos productos acaparan las ventas). Es determinista para una misma
+semilla e inserta por lotes de varias filas, así que 1M de líneas se cargan en minutos.
+
+Uso:
+    python scripts/seed_invoices.py --target sqlite --sqlite-path carga.db --invoices 250000
+    python scripts/seed_invoices.py --target supabase --tenant-id <uuid> --invoices 1000
+
+Con --target supabase usa SUPABASE_URL y SUPABASE_KEY (o un archivo .env); sirve
+igual para un Postgres local levantado con `supabase start`.
+"""
+
+import argparse
+import itertools
 import random
+import sys
+import time
+import uuid
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from supabase import create_client, Client
-
-# Cargar variables de entorno
-load_dotenv(dotenv_path='../.env')
-
-# Configuración de Supabase
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
-
-def seed_invoices():
-    """Inserta 3 facturas de ejemplo con sus líneas de detalle."""
-    try:
-        print("Iniciando la inserción de datos de facturación...")
-
-        # 1. Obtener datos existentes para consistencia
-        print("Obteniendo clientes y productos existentes...")
-        companies_resp = supabase.table("companies").select("id").execute()
-        products_resp = supabase.table("products").select("id, price").execute()
-
-        if not companies_resp.data or not products_resp.data:
-            print("Error: No hay suficientes datos de clientes o productos para crear facturas.")
-            return
-
-        company_ids = [c['id'] for c in companies_resp.data]
-        products = products_resp.data
-
-        # 2. Crear 3 facturas
-        invoice_statuses = ['Pendiente', 'Pagada', 'Borrador']
-        for i in range(3):
-            print(f"\nCreando factura {i+1}/3...")
-            # Datos de la factura
-            company_id = random.choice(company_ids)
-            issue_date = datetime.now() - timedelta(days=random.randint(5, 30))
-            due_date = issue_date + timedelta(days=30)
-            status = invoice_statuses[i]
-            invoice_number = f"FACT-{issue_date.year}-{i+1:04d}"
-
-            # Insertar la cabecera de la factura (con total temporal)
-            invoice_data = {
-                'company_id': company_id,
-                'invoice_number': invoice_number,
-                'issue_date': issue_date.isoformat(),
-                'due_date': due_date.isoformat(),
-                'status': status,
-                'total_amount': 0 # Se actualizará después
+from pathlib import Path
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root))
+
+RUTAS = 20
+CIUDADES = 400
+CATEGORIAS_CLIENTE = ("A", "B", "C", "D")
+CATEGORIAS_PRODUCTO = ("Ferretería", "Pintura", "Electricidad", "Fontanería", "Jardín", "Herramientas",
+                       "Limpieza", "Iluminación", "Adhesivos", "Seguridad")
+ESTADOS = ("Pagada", "Pendiente", "Borrador")
+NOMBRES = ("Bar", "Ferretería", "Bazar", "Almacén", "Droguería", "Taller", "Comercial", "Suministros")
+APELLIDOS = ("Pepe", "García", "López", "Martín", "Sánchez", "del Sur", "Norte", "Hermanos", "Centro", "Plaza")
+
+
+def pesos_zipf(n: int, s: float = 1.1) -> list:
+    """Pesos 1/k^s: el primer elemento es el más frecuente y el resto forma una cola larga."""
+    return [1 / (k ** s) for k in range(1, n + 1)]
+
+
+def acumulados_zipf(n: int, s: float = 1.1) -> list:
+    """Pesos acumulados para `random.choices(cum_weights=...)`, que así elige en O(log n)."""
+    return list(itertools.accumulate(pesos_zipf(n, s)))
+
+
+class Generador:
+    """Genera filas de forma determinista a partir de `semilla`."""
+
+    def __init__(self, semilla: int, dias: int = 365):
+        self.rng = random.Random(semilla)
+        self.dias = dias
+        self.ahora = datetime(2025, 1, 1) + timedelta(days=dias)
+        self.pesos_rutas = acumulados_zipf(RUTAS, 1.3)
+        self.pesos_ciudades = acumulados_zipf(CIUDADES, 1.0)
+        self.numero_factura = 0
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def clientes(self, tenant_id, n: int) -> list:
+        rutas = self.rng.choices(range(1, RUTAS + 1), cum_weights=self.pesos_rutas, k=n)
+        ciudades = self.rng.choices(range(1, CIUDADES + 1), cum_weights=self.pesos_ciudades, k=n)
+        return [{
+            "id": self.uuid(),
+            "tenant_id": tenant_id,
+            "client_name": f"{self.rng.choice(NOMBRES)} {self.rng.choice(APELLIDOS)} {i}",
+            "city": f"Ciudad {ciudad}",
+            "route": f"Ruta {ruta}",
+            "category": self.rng.choices(CATEGORIAS_CLIENTE, (50, 30, 15, 5))[0],
+            "contact_person": f"{self.rng.choice(APELLIDOS)}",
+            "phone": f"6{self.rng.randrange(10**8):08d}",
+            "address": f"Calle {self.rng.randrange(1, 200)}, {self.rng.randrange(1, 100)}",
+        } for i, (ruta, ciudad) in enumerate(zip(rutas, ciudades), start=1)]
+
+    def productos(self, tenant_id, n: int) -> list:
+        pesos = pesos_zipf(len(CATEGORIAS_PRODUCTO), 0.8)
+        return [{
+            "id": self.uuid(),
+            "tenant_id": tenant_id,
+            "sku": str(1000 + i),
+            "name": f"Producto {i}",
+            "description": f"Descripción del producto {i}",
+            "category": self.rng.choices(CATEGORIAS_PRODUCTO, pesos)[0],
+            "price": round(self.rng.lognormvariate(1.5, 0.8), 2),
+            "stock": self.rng.randrange(0, 500),
+            "updated_at": self.ahora.isoformat(),
+        } for i in range(1, n + 1)]
+
+    def facturas(self, tenant_id, clientes: list, productos: list, n: int, lineas_media: float):
+        """Genera (factura, líneas) de una en una; el total ya va calculado en la cabecera."""
+        # Los clientes y productos del principio de la lista compran/se venden mucho más
+        pesos_clientes = acumulados_zipf(len(clientes), 0.8)
+        pesos_productos = acumulados_zipf(len(productos), 1.0)
+        for _ in range(n):
+            emision = self.ahora - timedelta(days=self.rng.randrange(self.dias), seconds=self.rng.randrange(86400))
+            self.numero_factura += 1
+            factura = {
+                "id": self.uuid(),
+                "tenant_id": tenant_id,
+                "company_id": self.rng.choices(clientes, cum_weights=pesos_clientes)[0]["id"],
+                "invoice_number": f"FACT-{emision.year}-{self.numero_factura:07d}",
+                "issue_date": emision.isoformat(),
+                "due_date": (emision + timedelta(days=30)).isoformat(),
+                "status": self.rng.choices(ESTADOS, (70, 25, 5))[0],
             }
-            invoice_resp = supabase.table("invoices").insert(invoice_data).execute()
-            invoice_id = invoice_resp.data[0]['id']
-            print(f"  - Factura {invoice_number} creada con ID: {invoice_id}")
-
-            # 3. Crear líneas de detalle para la factura
-            total_amount = 0
-            num_items = random.randint(2, 4)
-            for j in range(num_items):
-                product = random.choice(products)
-                quantity = random.randint(1, 5)
-                unit_price = float(product['price'])
-                subtotal = quantity * unit_price
-                total_amount += subtotal
-
-                item_data = {
-                    'invoice_id': invoice_id,
-                    'product_id': product['id'],
-                    'quantity': quantity,
-                    'unit_price': unit_price,
-                    'subtotal': subtotal
-                }
-                supabase.table("invoice_items").insert(item_data).execute()
-                print(f"    - Añadido producto {product['id']} (x{quantity}) a la factura.")
-
-            # 4. Actualizar el total de la factura
-            supabase.table("invoices").update({'total_amount': total_amount}).eq('id', invoice_id).execute()
-            print(f"  - Total de la factura actualizado a: {total_amount:.2f}")
-
-        print("\n¡Inserción de datos completada con éxito!")
-
-    except Exception as e:
-        print(f"Ocurrió un error durante la inserción: {e}")
+            elegidos = {p["id"]: p for p in self.rng.choices(productos, cum_weights=pesos_productos,
+                                                             k=max(1, round(self.rng.expovariate(1 / lineas_media))))}
+            lineas = []
+            for producto in elegidos.values():
+                cantidad = self.rng.randint(1, 10)
+                lineas.append({
+                    "invoice_id": factura["id"],
+                    "product_id": producto["id"],
+                    "quantity": cantidad,
+                    "unit_price": producto["price"],
+                    "subtotal": round(cantidad * producto["price"], 2),
+                })
+            factura["total_amount"] = round(sum(l["subtotal"] for l in lineas), 2)
+            yield factura, lineas
+
+
+class Lotes:
+    """Acumula filas por tabla y las inserta en lotes de `tamano` con `insertar(tabla, filas)`.
+
+    En las tablas de `grupos` ({tabla: columna}) los lotes solo se cortan donde cambia esa
+    columna: las líneas de una factura van siempre en la misma sentencia, porque el trigger
+    de sales_rollups cuenta las facturas distintas de cada sentencia.
+    """
+
+    def __init__(self, insertar, tamano: int, grupos=None):
+        self.insertar = insertar
+        self.tamano = tamano
+        self.grupos = {"invoice_items": "invoice_id"} if grupos is None else grupos
+        self.pendientes = {}
+        self.insertadas = {}
+
+    def anadir(self, tabla: str, filas: list) -> None:
+        pendientes = self.pendientes.setdefault(tabla, [])
+        pendientes.extend(filas)
+        if len(pendientes) >= self.tamano:
+            self.vaciar()
+
+    def vaciar(self) -> None:
+        """Inserta todo lo pendiente en el orden en que se añadieron las tablas (padres antes que hijos)."""
+        for tabla, filas in self.pendientes.items():
+            for tramo in self._tramos(filas, self.grupos.get(tabla)):
+                self.insertar(tabla, tramo)
+            self.insertadas[tabla] = self.insertadas.get(tabla, 0) + len(filas)
+            filas.clear()
+
+    def _tramos(self, filas: list, columna: str | None):
+        inicio = 0
+        while inicio < len(filas):
+            fin = min(inicio + self.tamano, len(filas))
+            if columna:
+                # Se retrocede hasta el inicio del grupo; si el grupo solo no cabe, va entero
+                corte = fin
+                while inicio < corte < len(filas) and filas[corte][columna] == filas[corte - 1][columna]:
+                    corte -= 1
+                if corte == inicio:
+                    while fin < len(filas) and filas[fin][columna] == filas[fin - 1][columna]:
+                        fin += 1
+                else:
+                    fin = corte
+            yield filas[inicio:fin]
+            inicio = fin
+
+
+def destino_sqlite(path: str):
+    from db.local import LocalDB
+    db = LocalDB(path)
+    db.conn.execute("pragma journal_mode = wal")
+    db.conn.execute("pragma synchronous = off")
+    return db.insertar
+
+
+def destino_supabase():
+    import os
+    from dotenv import load_dotenv
+    from postgrest.types import ReturnMethod
+    from supabase import create_client
+
+    load_dotenv(_root / ".env")
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        sys.exit("ERROR: SUPABASE_URL o SUPABASE_KEY no definidas.")
+    supabase = create_client(url, key)
+
+    def insertar(tabla, filas):
+        supabase.table(tabla).insert(filas, returning=ReturnMethod.minimal).execute()
+    return insertar
+
+
+def generar(insertar, semilla: int = 42, tenants: int = 1, tenant_ids=None, clientes: int = 2000,
+            productos: int = 500, facturas: int = 10000, lineas_media: float = 4.0, dias: int = 365,
+            tamano_lote: int = 1000, progreso=print) -> dict:
+    """Genera el conjunto de datos completo e inserta con `insertar(tabla, filas)`. Devuelve filas por tabla."""
+    gen = Generador(semilla, dias)
+    tenant_ids = list(tenant_ids or [gen.uuid() for _ in range(tenants)])
+    lotes = Lotes(insertar, tamano_lote)
+    # Tenants de tamaños muy distintos: el primero se lleva la mayor parte
+    reparto = pesos_zipf(len(tenant_ids), 1.0)
+    total = sum(reparto)
+    inicio = time.monotonic()
+
+    for tenant_id, peso in zip(tenant_ids, reparto):
+        fraccion = peso / total
+        filas_clientes = gen.clientes(tenant_id, max(1, round(clientes * fraccion)))
+        filas_productos = gen.productos(tenant_id, max(1, round(productos * fraccion)))
+        lotes.anadir("companies", filas_clientes)
+        lotes.anadir("products", filas_productos)
+        lotes.vaciar()
+        for i, (factura, lineas) in enumerate(gen.facturas(tenant_id, filas_clientes, filas_productos,
+                                                           max(1, round(facturas * fraccion)), lineas_media), start=1):
+            lotes.anadir("invoices", [factura])
+            lotes.anadir("invoice_items", lineas)
+            if i % 50000 == 0:
+                progreso(f"  {tenant_id}: {i} facturas ({time.monotonic() - inicio:.0f} s)")
+    lotes.vaciar()
+    return lotes.insertadas
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de clientes, productos y ventas.")
+    parser.add_argument("--target", choices=("sqlite", "supabase"), default="sqlite")
+    parser.add_argument("--sqlite-path", default="carga.db")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tenants", type=int, default=1)
+    parser.add_argument("--tenant-id", action="append", help="Usar tenants existentes (repetible)")
+    parser.add_argument("--companies", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--invoices", type=int, default=10000)
+    parser.add_argument("--items-per-invoice", type=float, default=4.0, help="Media de líneas por factura")
+    parser.add_argument("--days", type=int, default=365, help="Días de historia de las facturas")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    insertar = destino_sqlite(args.sqlite_path) if args.target == "sqlite" else destino_supabase()
+    print(f"Generando datos (semilla {args.seed}) en {args.target}...")
+    inicio = time.monotonic()
+    insertadas = generar(
+        insertar, semilla=args.seed, tenants=args.tenants, tenant_ids=args.tenant_id,
+        clientes=args.companies, productos=args.products, facturas=args.invoices,
+        lineas_media=args.items_per_invoice, dias=args.days, tamano_lote=args.batch_size,
+    )
+    for tabla, n in insertadas.items():
+        print(f"  - {tabla}: {n} filas")
+    print(f"¡Inserción completada en {time.monotonic() - inicio:.1f} s!")
+
 
 if __name__ == "__main__":
-    seed_invoices()
+    main()
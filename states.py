@@ -24,5 +24,7 @@
     CLIENT_FILTER_RESPONSE, # Respuesta filtro clientes
     PRODUCT_FILTER_RESPONSE,# Respuesta filtro productos
     VIEWING_CLIENT,         # Viendo ficha cliente
-    VIEWING_PRODUCT         # Viendo ficha producto
-) = range(18)
+    VIEWING_PRODUCT,        # Viendo ficha producto
+    SALE_SELECT_CLIENT,     # Alta de venta: eligiendo cliente
+    SALE_CART               # Alta de venta: añadiendo líneas al carrito
+) = range(20)
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from db import conexion
+from handlers import auth_handler
+from states import LOGIN_PASSWORD, RESET_EMAIL
+
+
+def _update(texto):
+    update = MagicMock()
+    update.message.text = texto
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+@pytest.mark.asyncio
+async def test_login_lento_vence_y_no_bloquea(monkeypatch):
+    cancelada = asyncio.Event()
+
+    async def sign_in_colgado(credenciales):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelada.set()
+            raise
+
+    auth = MagicMock()
+    auth.sign_in_with_password = sign_in_colgado
+    monkeypatch.setattr(auth_handler, "auth_usuarios", auth)
+    monkeypatch.setattr(conexion, "AUTH_TIMEOUT", 0.05)
+
+    otro_chat = []
+
+    async def otro_handler():
+        await asyncio.sleep(0.01)
+        otro_chat.append("atendido")
+
+    update = _update("secreto")
+    context = MagicMock(user_data={"login_email": "ana@example.com"})
+    estado, _ = await asyncio.gather(auth_handler.login_complete(update, context), otro_handler())
+
+    assert estado == LOGIN_PASSWORD
+    assert cancelada.is_set()
+    assert otro_chat == ["atendido"]
+    assert update.message.reply_text.call_args.args[0] == auth_handler.AUTH_OCUPADO
+
+
+@pytest.mark.asyncio
+async def test_llamadas_auth_acotadas(monkeypatch):
+    monkeypatch.setattr(conexion, "_limite_auth", asyncio.Semaphore(2))
+    en_vuelo, maximo = 0, 0
+
+    async def reset(email):
+        nonlocal en_vuelo, maximo
+        en_vuelo += 1
+        maximo = max(maximo, en_vuelo)
+        await asyncio.sleep(0.01)
+        en_vuelo -= 1
+
+    anon = MagicMock()
+    anon.auth.reset_password_for_email = reset
+    monkeypatch.setattr(auth_handler, "supabase_anon", anon)
+
+    estados = await asyncio.gather(*(
+        auth_handler.request_reset_token(_update(f"u{i}@example.com"), MagicMock(user_data={}))
+        for i in range(8)
+    ))
+    assert maximo == 2
+    assert len(set(estados)) == 1 and estados[0] != RESET_EMAIL
+
+
+@pytest.mark.asyncio
+async def test_timeout_incluye_la_cola(monkeypatch):
+    monkeypatch.setattr(conexion, "_limite_auth", asyncio.Semaphore(1))
+    await conexion._limite_auth.acquire()
+    with pytest.raises(asyncio.TimeoutError):
+        await conexion.llamada_auth(AsyncMock(), timeout=0.02)
@@ -0,0 +1,238 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from telegram.error import BadRequest, Forbidden
+from unittest.mock import AsyncMock, MagicMock
+
+from db.difusion import AlmacenDifusiones, EN_CURSO, TERMINADA, CANCELADA
+from handlers import broadcast_handler
+from handlers.broadcast_handler import ejecutar_difusion
+from utils.limitador import MASIVO
+
+
+class UsuariosFalsos:
+    """Builder mínimo de public.users paginado por id (keyset) con update().in_()."""
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.bloqueados = []
+        self.paginas = 0
+
+    def table(self, nombre):
+        self._desde, self._limite, self._update = None, None, None
+        return self
+
+    def select(self, columnas):
+        return self
+
+    @property
+    def not_(self):
+        return self
+
+    def eq(self, campo, valor):
+        return self
+
+    def is_(self, campo, valor):
+        return self
+
+    def or_(self, filtro):
+        self._desde = filtro.split('"')[1]
+        return self
+
+    def order(self, columna, desc=False):
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def update(self, valores):
+        self._update = valores
+        return self
+
+    def in_(self, campo, valores):
+        self.bloqueados.extend(valores)
+        return self
+
+    async def execute(self):
+        if self._update is not None:
+            return MagicMock(data=[])
+        self.paginas += 1
+        filas = [f for f in self.filas if self._desde is None or f["id"] > self._desde]
+        return MagicMock(data=filas[:self._limite])
+
+
+class BotFalso:
+    def __init__(self, bloqueados=(), invalidos=(), pausa=0.0):
+        self.recibidos = Counter()
+        self.bloqueados, self.invalidos = set(bloqueados), set(invalidos)
+        self.pausa = pausa
+        self.prioridades = set()
+
+    async def send_message(self, chat_id, texto, rate_limit_args=None):
+        self.prioridades.add(rate_limit_args)
+        await asyncio.sleep(self.pausa)
+        if chat_id in self.bloqueados:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if chat_id in self.invalidos:
+            raise BadRequest("Chat not found")
+        self.recibidos[chat_id] += 1
+
+
+def _usuarios(n):
+    return [{"id": f"u{i:05d}", "telegram_id": 1000 + i} for i in range(n)]
+
+
+@pytest.mark.asyncio
+async def test_difusion_completa_con_cuentas(tmp_path):
+    almacen = AlmacenDifusiones(str(tmp_path / "d.sqlite3"))
+    client = UsuariosFalsos(_usuarios(250))
+    bot = BotFalso(bloqueados={1003, 1100}, invalidos={1200})
+    trabajo_id = almacen.crear("t1", 42, "Nueva lista de precios")
+
+    trabajo = await ejecutar_difusion(bot, trabajo_id, almacen, client, tamano_pagina=100, ventana=20, cada=30)
+
+    assert trabajo["estado"] == TERMINADA
+    assert (trabajo["entregados"], trabajo["fallidos"], trabajo["bloqueados"]) == (247, 1, 2)
+    assert trabajo["cursor"] == "u00249"
+    assert sorted(client.bloqueados) == ["u00003", "u00100"]
+    assert set(bot.recibidos.values()) == {1} and len(bot.recibidos) == 247
+    assert bot.prioridades == {MASIVO}
+    assert client.paginas == 3
+
+
+@pytest.mark.asyncio
+async def test_reanudar_tras_interrupcion_no_repite_lo_confirmado(tmp_path):
+    almacen = AlmacenDifusiones(str(tmp_path / "d.sqlite3"))
+    usuarios = _usuarios(300)
+    bot = BotFalso(pausa=0.001)
+    trabajo_id = almacen.crear("t1", 42, "Aviso")
+
+    tarea = asyncio.create_task(
+        ejecutar_difusion(bot, trabajo_id, almacen, UsuariosFalsos(usuarios), tamano_pagina=50, ventana=10, cada=25))
+    while sum(bot.recibidos.values()) < 120:
+        await asyncio.sleep(0.001)
+    tarea.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await tarea
+    parcial = almacen.leer(trabajo_id)
+    assert parcial["estado"] == EN_CURSO
+    assert parcial["entregados"] >= 120
+
+    trabajo = await ejecutar_difusion(bot, trabajo_id, almacen, UsuariosFalsos(usuarios), tamano_pagina=50, ventana=10)
+    assert trabajo["estado"] == TERMINADA
+    assert trabajo["entregados"] == 300
+    assert len(bot.recibidos) == 300
+    # Solo se repiten, como mucho, los envíos que estaban en vuelo al interrumpir
+    assert sum(bot.recibidos.values()) - 300 <= 10
+
+
+@pytest.mark.asyncio
+async def test_cancelada_desde_otro_proceso_se_detiene(tmp_path):
+    almacen = AlmacenDifusiones(str(tmp_path / "d.sqlite3"))
+    bot = BotFalso()
+    trabajo_id = almacen.crear("t1", 42, "Aviso")
+    otro = AlmacenDifusiones(str(tmp_path / "d.sqlite3"))
+    assert almacen.reclamar(trabajo_id, "a", 300)
+    assert not otro.reclamar(trabajo_id, "b", 300)
+    otro.terminar(trabajo_id, CANCELADA)
+
+    trabajo = await ejecutar_difusion(bot, trabajo_id, almacen, UsuariosFalsos(_usuarios(500)), ventana=5, cada=20)
+    assert trabajo["estado"] == CANCELADA
+    assert sum(bot.recibidos.values()) <= 25
+    assert almacen.pendientes() == []
+
+
+@pytest.mark.asyncio
+async def test_comando_crea_y_lanza_la_difusion(tmp_path, monkeypatch):
+    almacen = AlmacenDifusiones(str(tmp_path / "d.sqlite3"))
+    monkeypatch.setattr(broadcast_handler, "difusiones", almacen)
+    monkeypatch.setattr(broadcast_handler, "ADMIN_IDS", {7})
+    lanzar = MagicMock()
+    monkeypatch.setattr(broadcast_handler, "lanzar_difusion", lanzar)
+
+    update = MagicMock()
+    update.effective_user.id = 7
+    update.effective_chat.id = 7
+    update.message.text = "/broadcast Nueva lista\nde precios"
+    update.message.reply_text = AsyncMock()
+    context = MagicMock(user_data={"tenant_id": "t1"}, args=["Nueva", "lista", "de", "precios"])
+
+    await broadcast_handler.broadcast(update, context)
+
+    trabajo = almacen.leer(1)
+    assert trabajo["texto"] == "Nueva lista\nde precios" and trabajo["autor"] == 7
+    lanzar.assert_called_once_with(context.bot, 1)
+
+    update.effective_user.id = 8
+    await broadcast_handler.broadcast(update, context)
+    assert update.message.reply_text.await_args.args[0] == "Comando exclusivo para administradores."
+
+
+@pytest.mark.asyncio
+async def test_toma_la_difusion_de_un_worker_caido(tmp_path, monkeypatch):
+    almacen = AlmacenDifusiones(str(tmp_path / "d.sqlite3"))
+    monkeypatch.setattr(broadcast_handler, "difusiones", almacen)
+    monkeypatch.setattr(broadcast_handler, "BROADCAST_CLAIM_INTERVAL", 0.01)
+    ejecutadas = []
+
+    async def ejecutar(bot, trabajo_id):
+        ejecutadas.append(trabajo_id)
+        await asyncio.sleep(3600)
+    monkeypatch.setattr(broadcast_handler, "_ejecutar_y_avisar", ejecutar)
+
+    trabajo_id = almacen.crear("t1", 42, "Aviso")
+    assert almacen.reclamar(trabajo_id, "otro-worker:1", 300)
+    await broadcast_handler.iniciar_difusiones(MagicMock())
+    try:
+        await asyncio.sleep(0.05)
+        assert ejecutadas == []  # su dueño sigue vivo
+
+        # El otro worker deja de dar latidos: se reclama sin esperar a un reinicio
+        almacen._conexion().execute("update broadcast_jobs set latido = latido - 1000")
+        for _ in range(100):
+            if ejecutadas:
+                break
+            await asyncio.sleep(0.01)
+        assert ejecutadas == [trabajo_id]
+        assert almacen.leer(trabajo_id)["propietario"] == broadcast_handler.PROPIETARIO
+    finally:
+        await broadcast_handler.detener_difusiones()
+    assert almacen.leer(trabajo_id)["propietario"] is None
+
+
+@pytest.mark.asyncio
+async def test_autor_recibe_el_informe_al_cancelar(tmp_path, monkeypatch):
+    almacen = AlmacenDifusiones(str(tmp_path / "d.sqlite3"))
+    monkeypatch.setattr(broadcast_handler, "difusiones", almacen)
+
+    async def ejecutar(bot, trabajo_id):
+        almacen.avanzar(trabajo_id, "u00009", 10, 0, 0)
+        await asyncio.sleep(3600)
+    monkeypatch.setattr(broadcast_handler, "ejecutar_difusion", ejecutar)
+    bot = MagicMock(send_message=AsyncMock())
+
+    for estado in (CANCELADA, EN_CURSO):
+        trabajo_id = almacen.crear("t1", 42, "Aviso")
+        tarea = asyncio.create_task(broadcast_handler._ejecutar_y_avisar(bot, trabajo_id))
+        await asyncio.sleep(0.01)
+        if estado == CANCELADA:
+            almacen.terminar(trabajo_id, CANCELADA)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    # Solo la cancelada: la otra es una parada del bot y se reanudará
+    bot.send_message.assert_awaited_once()
+    chat_id, texto = bot.send_message.await_args.args
+    assert chat_id == 42 and "(cancelada)" in texto and "Entregados: 10" in texto
+
+
+@pytest.mark.asyncio
+async def test_bloqueados_con_fecha_utc():
+    from db.difusion import marcar_bloqueados
+
+    client = UsuariosFalsos([])
+    await marcar_bloqueados(client, ["u1"])
+    assert client._update["telegram_blocked_at"].endswith("+00:00")
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from db.catalogo import Catalogo, sincronizar_catalogo
+from handlers import product_handler
+from states import VIEWING_PRODUCT
+
+
+def _producto(i, **campos):
+    fila = {"id": f"p{i:03d}", "sku": str(100 + i), "name": f"Producto {i}", "category": "Ferretería",
+            "supplier_id": "s1", "price": 1.0, "stock": i % 2, "updated_at": f"2024-01-01T10:{i // 60:02d}:{i % 60:02d}+00:00"}
+    fila.update(campos)
+    return fila
+
+
+class TablaProductos:
+    """Builder mínimo de PostgREST: filtra por updated_at >= desde y keyset (updated_at, id)."""
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.consultas = []
+
+    def table(self, nombre):
+        self._desde, self._cursor, self._limite = None, None, None
+        return self
+
+    def select(self, columnas):
+        return self
+
+    def eq(self, campo, valor):
+        return self
+
+    def gte(self, campo, valor):
+        self._desde = valor
+        return self
+
+    def or_(self, filtro):
+        partes = filtro.split('"')
+        self._cursor = (partes[1], partes[5])
+        return self
+
+    def order(self, columna, desc=False):
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    async def execute(self):
+        self.consultas.append(self._desde)
+        filas = sorted(self.filas, key=lambda f: (f["updated_at"], f["id"]))
+        if self._desde:
+            filas = [f for f in filas if f["updated_at"] >= self._desde]
+        if self._cursor:
+            filas = [f for f in filas if (f["updated_at"], f["id"]) > self._cursor]
+        return MagicMock(data=filas[:self._limite])
+
+
+def test_indices_y_filtros():
+    catalogo = Catalogo()
+    catalogo.aplicar([_producto(i) for i in range(4)] + [_producto(9, category="Pintura", supplier_id=None)])
+    assert [p["id"] for p in catalogo.filtrar("category", "Pintura")] == ["p009"]
+    assert [p["id"] for p in catalogo.filtrar("sku", "102")] == ["p002"]
+    assert {p["id"] for p in catalogo.filtrar("stock", "true")} == {"p001", "p003", "p009"}
+    assert {p["id"] for p in catalogo.filtrar("stock", "false")} == {"p000", "p002"}
+    assert catalogo.facetas("category") == [("Ferretería", 4), ("Pintura", 1)]
+    assert catalogo.facetas("supplier_id") == [("s1", 4)]
+
+
+def test_aplicar_reemplaza_y_reindexa():
+    catalogo = Catalogo()
+    catalogo.aplicar([_producto(1)])
+    catalogo.aplicar([_producto(1, category="Pintura", stock=0, updated_at="2024-01-02T00:00:00+00:00")])
+    assert catalogo.facetas("category") == [("Pintura", 1)]
+    assert catalogo.filtrar("stock", "true") == []
+    assert len(catalogo) == 1
+    assert catalogo.marca.day == 2
+
+
+@pytest.mark.asyncio
+async def test_sincronizacion_incremental():
+    # Una modificación por minuto para que el margen de solape solo alcance a la última
+    tabla = TablaProductos([_producto(i, updated_at=f"2024-01-01T10:{i:02d}:00+00:00") for i in range(7)])
+    catalogo = Catalogo()
+    assert await sincronizar_catalogo(tabla, "t1", catalogo, tamano_pagina=3) == 7
+    assert tabla.consultas == [None, None, None]
+
+    tabla.consultas.clear()
+    tabla.filas.append(_producto(50, updated_at="2024-01-01T11:00:00+00:00"))
+    recibidas = await sincronizar_catalogo(tabla, "t1", catalogo, tamano_pagina=3)
+    # Solo llegan la fila nueva y la que cae en el margen de solape
+    assert recibidas == 2
+    assert tabla.consultas[0] == "2024-01-01T10:05:55+00:00"
+    assert len(catalogo) == 8
+
+
+@pytest.mark.asyncio
+async def test_filtro_de_producto_se_responde_desde_memoria():
+    product_handler._catalogos.clear()
+    tabla = TablaProductos([_producto(i) for i in range(2000)])
+    query = MagicMock(data="product_value_stock_true", answer=AsyncMock(), edit_message_text=AsyncMock())
+    update = MagicMock(callback_query=query)
+    context = MagicMock(user_data={"tenant_id": "t1"})
+
+    with patch.object(product_handler, "supabase", tabla):
+        assert await product_handler.mostrar_productos_filtrados(update, context) == VIEWING_PRODUCT
+        cargas = len(tabla.consultas)
+        query.data = "product_value_category_Ferretería"
+        inicio = time.perf_counter()
+        assert await product_handler.mostrar_productos_filtrados(update, context) == VIEWING_PRODUCT
+        assert time.perf_counter() - inicio < 0.05
+    assert len(tabla.consultas) == cargas
+    assert len(context.user_data['filtered_products']) == 2000
+    product_handler._catalogos.clear()
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from handlers import client_handler
+
+CLIENTE = {"id": "c1", "client_name": "Bar Pepe", "city": "Madrid", "route": "Centro", "category": "A",
+           "contact_person": "José", "phone": "600", "address": "Calle Mayor 1"}
+
+
+def _supabase_mock():
+    sel = MagicMock()
+    for metodo in ("select", "eq", "single"):
+        getattr(sel, metodo).return_value = sel
+    sel.execute = AsyncMock(return_value=MagicMock(data=dict(CLIENTE)))
+    sb = MagicMock()
+    sb.table.return_value = sel
+    return sb
+
+
+def _update():
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+@pytest.mark.asyncio
+async def test_ficha_se_sirve_desde_cache_hasta_invalidarla():
+    client_handler._fichas_cache.clear()
+    sb = _supabase_mock()
+    context = MagicMock(user_data={"tenant_id": "t1", "cliente_seleccionado_id": "c1"})
+    hits = client_handler._fichas_cache.hits
+
+    with patch.object(client_handler, "supabase", sb):
+        update = _update()
+        await client_handler.ver_ficha_cliente(update, context)
+        await client_handler.ver_ficha_cliente(update, context)
+        assert sb.table.call_count == 1
+        assert client_handler._fichas_cache.hits == hits + 1
+        assert "Calle Mayor 1" in update.message.reply_text.call_args.args[0]
+
+        client_handler.invalidar_ficha("t1", "c1")
+        await client_handler.ver_ficha_cliente(update, context)
+        assert sb.table.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_ficha_de_otro_tenant_no_se_comparte():
+    client_handler._fichas_cache.clear()
+    sb = _supabase_mock()
+    with patch.object(client_handler, "supabase", sb):
+        await client_handler.ver_ficha_cliente(_update(), MagicMock(user_data={"tenant_id": "t1", "cliente_seleccionado_id": "c1"}))
+        await client_handler.ver_ficha_cliente(_update(), MagicMock(user_data={"tenant_id": "t2", "cliente_seleccionado_id": "c1"}))
+    assert sb.table.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_invalidada_durante_la_lectura_no_se_cachea():
+    client_handler._fichas_cache.clear()
+    sb = _supabase_mock()
+    lectura = sb.table.return_value.execute
+
+    async def leer_mientras_se_modifica():
+        client_handler.invalidar_ficha("t1", "c1")
+        return MagicMock(data=dict(CLIENTE))
+    lectura.side_effect = leer_mientras_se_modifica
+
+    with patch.object(client_handler, "supabase", sb):
+        context = MagicMock(user_data={"tenant_id": "t1", "cliente_seleccionado_id": "c1"})
+        await client_handler.ver_ficha_cliente(_update(), context)
+    assert ("t1", "c1") not in client_handler._fichas_cache
+    # Nada queda registrado por cliente una vez terminada la lectura
+    assert client_handler._fichas_en_lectura == {}
+    client_handler.invalidar_ficha("t1", "c2")
+    assert client_handler._fichas_en_lectura == {}
@@ -0,0 +1,179 @@
+import pickle
+
+import pytest
+from telegram import Update, User
+from telegram.ext import (
+    Application, CommandHandler, ConversationHandler, ExtBot, MessageHandler, TypeHandler, filters,
+)
+
+from db.estado_compartido import AlmacenRedis, PersistenciaCompartida
+
+fakeredis = pytest.importorskip("fakeredis")
+
+NOMBRE, CIUDAD = range(2)
+
+
+def _update(update_id, texto, user_id=7):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": texto,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Ana"},
+            **({"entities": [{"type": "bot_command", "offset": 0, "length": len(texto)}]} if texto.startswith("/") else {}),
+        },
+    }
+
+
+async def _replica(servidor, respuestas, monkeypatch):
+    """Application sin red con persistencia compartida sobre el servidor fakeredis común."""
+    async def iniciar_sin_red(self):
+        self._bot_user = User(1, "bot", True, username="crm_bot")
+        self._initialized = True
+
+    monkeypatch.setattr(ExtBot, "initialize", iniciar_sin_red)
+    persistencia = PersistenciaCompartida(AlmacenRedis(fakeredis.FakeAsyncRedis(server=servidor)))
+
+    async def alta(update, context):
+        return NOMBRE
+
+    async def nombre(update, context):
+        context.user_data["nuevo_cliente"] = {"nombre": update.message.text}
+        return CIUDAD
+
+    async def ciudad(update, context):
+        respuestas.append({**context.user_data["nuevo_cliente"], "ciudad": update.message.text})
+        context.user_data.pop("nuevo_cliente")
+        return ConversationHandler.END
+
+    app = Application.builder().token("1:a").updater(None).persistence(persistencia).build()
+    app.add_handler(TypeHandler(Update, persistencia.cargar), group=-2)
+    app.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("alta", alta)],
+        states={
+            NOMBRE: [MessageHandler(filters.TEXT & ~filters.COMMAND, nombre)],
+            CIUDAD: [MessageHandler(filters.TEXT & ~filters.COMMAND, ciudad)],
+        },
+        fallbacks=[],
+        name="principal",
+        persistent=True,
+    ))
+    app.add_handler(TypeHandler(Update, persistencia.guardar), group=99)
+    await app.initialize()
+    return app, persistencia
+
+
+@pytest.mark.asyncio
+async def test_cualquier_replica_continua_la_conversacion(monkeypatch):
+    servidor = fakeredis.FakeServer()
+    respuestas = []
+    a, _ = await _replica(servidor, respuestas, monkeypatch)
+    b, _ = await _replica(servidor, respuestas, monkeypatch)
+
+    await a.process_update(Update.de_json(_update(1, "/alta"), a.bot))
+    await b.process_update(Update.de_json(_update(2, "Bar Pepe"), b.bot))
+    await a.process_update(Update.de_json(_update(3, "Sevilla"), a.bot))
+
+    assert respuestas == [{"nombre": "Bar Pepe", "ciudad": "Sevilla"}]
+    # La conversación terminó en A: B no debe seguir creyendo que está en CIUDAD
+    await b.process_update(Update.de_json(_update(4, "Cádiz"), b.bot))
+    assert len(respuestas) == 1
+    await a.shutdown()
+    await b.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_lectura_en_un_solo_pipeline(monkeypatch):
+    servidor = fakeredis.FakeServer()
+    app, persistencia = await _replica(servidor, [], monkeypatch)
+    redis = persistencia.almacen.redis
+    ejecuciones = []
+    original = redis.pipeline
+
+    def pipeline(*args, **kwargs):
+        ejecuciones.append(kwargs.get("transaction", True))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(redis, "pipeline", pipeline)
+    await app.process_update(Update.de_json(_update(1, "/alta"), app.bot))
+    # Lectura (1 pipeline) + escritura (WATCH/MULTI + lectura de versiones)
+    assert ejecuciones[0] is False
+    assert len(ejecuciones) == 3
+    await app.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_versiones_conocidas_acotadas(monkeypatch):
+    respuestas = []
+    app, persistencia = await _replica(fakeredis.FakeServer(), respuestas, monkeypatch)
+    persistencia._conocidos.maxsize = 6
+
+    for user_id in range(1, 21):
+        await app.process_update(Update.de_json(_update(user_id * 10, "/alta", user_id), app.bot))
+    assert persistencia._conocidos.stats()["size"] <= 6
+
+    # El primer usuario ya no está entre las conocidas y su conversación sigue igual
+    await app.process_update(Update.de_json(_update(1001, "Bar Pepe", 1), app.bot))
+    await app.process_update(Update.de_json(_update(1002, "Sevilla", 1), app.bot))
+    assert respuestas == [{"nombre": "Bar Pepe", "ciudad": "Sevilla"}]
+    assert persistencia.conflictos == 0
+    await app.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_versionado_optimista():
+    almacen = AlmacenRedis(fakeredis.FakeAsyncRedis())
+    leido = await almacen.leer(["user:1"])
+    assert leido == {"user:1": (0, None)}
+
+    assert await almacen.escribir({"user:1": (0, b"replica A")}) == set()
+    # Réplica B escribe con la versión que leyó antes: conflicto y no pisa a A
+    assert await almacen.escribir({"user:1": (0, b"replica B"), "user:2": (0, b"otro")}) == {"user:1"}
+    assert await almacen.leer(["user:1", "user:2"]) == {"user:1": (1, b"replica A"), "user:2": (1, b"otro")}
+
+    # Un borrado conserva la versión: una copia antigua no puede resucitar el valor
+    assert await almacen.escribir({"user:1": (1, None)}) == set()
+    assert await almacen.escribir({"user:1": (1, b"antiguo")}) == {"user:1"}
+    assert await almacen.leer(["user:1"]) == {"user:1": (2, None)}
+
+
+@pytest.mark.asyncio
+async def test_tokens_de_recuperacion_no_salen_del_proceso(monkeypatch):
+    servidor = fakeredis.FakeServer()
+    app, persistencia = await _replica(servidor, [], monkeypatch)
+    app.user_data[7].update({"tenant_id": "t1", "reset_access_token": "secreto"})
+    await persistencia.update_user_data(7, app.user_data[7])
+    await persistencia.flush()
+
+    guardado = await persistencia.almacen.redis.hget("crm:user:7", "d")
+    assert b"secreto" not in guardado
+    # La siguiente lectura del almacén conserva los tokens de este proceso
+    await app.process_update(Update.de_json(_update(1, "hola"), app.bot))
+    assert app.user_data[7] == {"tenant_id": "t1", "reset_access_token": "secreto"}
+    await app.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_conflicto_se_fusiona_sin_perder_cambios():
+    almacen = AlmacenRedis(fakeredis.FakeAsyncRedis())
+    a, b = PersistenciaCompartida(almacen), PersistenciaCompartida(almacen)
+    await almacen.escribir({"user:7": (0, pickle.dumps({"tenant_id": "t1", "paso": 1}))})
+    for replica in (a, b):
+        for clave, valor in (await almacen.leer(["user:7"])).items():
+            replica._conocidos.set(clave, valor)
+
+    await b.update_user_data(7, {"tenant_id": "t1", "paso": 1, "carrito": ["p1"]})
+    await b.flush()
+    # A cambió otra clave a partir de la misma versión: choca y se fusiona
+    await a.update_user_data(7, {"tenant_id": "t1", "paso": 2})
+    await a.flush()
+
+    version, valor = (await almacen.leer(["user:7"]))["user:7"]
+    assert pickle.loads(valor) == {"tenant_id": "t1", "paso": 2, "carrito": ["p1"]}
+    assert version == 3 and a.conflictos == 1
+
+    # Una clave expulsada de las conocidas se escribe con versión 0 y también se fusiona
+    a._conocidos.clear()
+    await a.update_user_data(7, {"ultimo": "x"})
+    await a.flush()
+    assert pickle.loads((await almacen.leer(["user:7"]))["user:7"][1])["carrito"] == ["p1"]
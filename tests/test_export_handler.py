@@ -0,0 +1,68 @@
+import gzip
+import io
+
+import pytest
+from unittest.mock import MagicMock
+
+from handlers import export_handler
+
+COLUMNAS = ("id", "client_name", "city")
+
+
+class PaginasFalsas:
+    """Builder mínimo que devuelve filas > último id, como haría PostgREST con el keyset."""
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.consultas = 0
+
+    def table(self, nombre):
+        self._desde, self._limite = None, None
+        return self
+
+    def select(self, columnas):
+        return self
+
+    def eq(self, campo, valor):
+        return self
+
+    def or_(self, filtro):
+        self._desde = filtro.split('"')[1]
+        return self
+
+    def order(self, columna, desc=False):
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    async def execute(self):
+        self.consultas += 1
+        filas = [f for f in self.filas if self._desde is None or f["id"] > self._desde]
+        return MagicMock(data=filas[:self._limite])
+
+
+@pytest.mark.asyncio
+async def test_iterar_paginas_por_id():
+    filas = [{"id": f"{i:03d}", "client_name": f"C{i}", "city": "Madrid"} for i in range(7)]
+    cliente = PaginasFalsas(filas)
+    paginas = [p async for p in export_handler.iterar_paginas(cliente, "companies", COLUMNAS, "t1", {}, tamano_pagina=3)]
+    assert [len(p) for p in paginas] == [3, 3, 1]
+    assert sum(paginas, []) == filas
+    assert cliente.consultas == 3
+
+
+def test_escritor_csv_gzip():
+    destino = io.BytesIO()
+    escritor = export_handler.EscritorCSVGzip(destino, COLUMNAS)
+    escritor.escribir([{"id": "1", "client_name": "Bar, S.L.", "city": "Soria", "x": 1}])
+    escritor.cerrar()
+    assert escritor.total == 1
+    assert gzip.decompress(destino.getvalue()).decode() == 'id,client_name,city\r\n1,"Bar, S.L.",Soria\r\n'
+
+
+def test_parsear_filtros():
+    assert export_handler.parsear_filtros(["city=Madrid"], COLUMNAS) == {"city": "Madrid"}
+    with pytest.raises(ValueError):
+        export_handler.parsear_filtros(["tenant_id=otro"], COLUMNAS)
@@ -0,0 +1,42 @@
+import pytest
+from unittest.mock import patch
+
+from handlers import client_handler
+from db.local import LocalDB
+from utils.cache import TTLCache
+
+
+def test_ttl_cache_caduca_y_expulsa(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr("utils.cache.time.monotonic", lambda: ahora[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser el más reciente
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    ahora[0] += 11
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_facetas_se_cachean_e_invalidan():
+    client_handler._facetas_cache.clear()
+    db = LocalDB()
+    db.insertar("companies", [
+        {"tenant_id": "t1", "client_name": "Uno", "city": "Madrid"},
+        {"tenant_id": "t1", "client_name": "Dos", "city": "Bilbao"},
+        {"tenant_id": "t1", "client_name": "Tres", "city": "Madrid"},
+    ])
+    with patch.object(client_handler, "supabase", db), \
+            patch.object(db, "rpc", wraps=db.rpc) as rpc:
+        assert await client_handler.obtener_facetas("t1", "city") == [("Bilbao", 1), ("Madrid", 2)]
+        assert await client_handler.obtener_facetas("t1", "city") == [("Bilbao", 1), ("Madrid", 2)]
+        assert rpc.call_count == 1
+
+        db.insertar("companies", [{"tenant_id": "t1", "client_name": "Cuatro", "city": "Bilbao"}])
+        client_handler.invalidar_facetas("t1")
+        assert await client_handler.obtener_facetas("t1", "city") == [("Bilbao", 2), ("Madrid", 2)]
+        assert rpc.call_count == 2
@@ -0,0 +1,41 @@
+import pytest
+
+from db.facetas import contar_facetas, etiqueta_faceta
+from db.local import LocalDB
+
+
+@pytest.fixture
+def db():
+    db = LocalDB()
+    db.insertar("companies", [
+        {"tenant_id": "t1", "client_name": "A", "route": "Norte", "city": "Madrid"},
+        {"tenant_id": "t1", "client_name": "B", "route": "Norte", "city": "Madrid"},
+        {"tenant_id": "t1", "client_name": "C", "route": "Sur", "city": ""},
+        {"tenant_id": "t2", "client_name": "D", "route": "Este", "city": "Madrid"},
+    ])
+    db.insertar("products", [
+        {"tenant_id": "t1", "sku": "10", "name": "Tornillo", "category": "Ferretería"},
+        {"tenant_id": "t2", "sku": "11", "name": "Tuerca", "category": "Ferretería"},
+    ])
+    return db
+
+
+@pytest.mark.asyncio
+async def test_facetas_agrupadas_por_tenant(db):
+    assert await contar_facetas(db, "companies", "route", "t1") == [("Norte", 2), ("Sur", 1)]
+    assert await contar_facetas(db, "companies", "city", "t1") == [("Madrid", 2)]
+
+
+@pytest.mark.asyncio
+async def test_facetas_sin_tenant_cuentan_todo(db):
+    assert await contar_facetas(db, "products", "category") == [("Ferretería", 2)]
+
+
+@pytest.mark.asyncio
+async def test_faceta_no_permitida(db):
+    with pytest.raises(ValueError):
+        await contar_facetas(db, "companies", "phone", "t1")
+
+
+def test_etiqueta_faceta():
+    assert etiqueta_faceta("Madrid", 42) == "Madrid (42)"
@@ -0,0 +1,71 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from handlers import import_handler
+from utils.validators import validar_dato_cliente, validar_fila_cliente
+
+CABECERA = "nombre;ciudad;ruta;categoría;contacto;teléfono;dirección\n"
+
+
+def test_validar_dato_cliente_mismas_reglas_que_el_dialogo():
+    assert validar_dato_cliente("teléfono", "60a") == "El teléfono debe ser numérico."
+    assert validar_dato_cliente("ciudad", " ") == "La ciudad no puede estar vacía."
+    assert validar_dato_cliente("nombre", "Bar Pepe") is None
+
+
+def test_validar_fila_acepta_columnas_de_companies():
+    cliente, errores = validar_fila_cliente({
+        "client_name": "Bar", "City": "Madrid", "route": "Centro", "category": "A",
+        "contact_person": "Ana", "phone": 600111222, "address": "Calle 1",
+    })
+    assert errores == []
+    assert cliente["city"] == "Madrid" and cliente["phone"] == "600111222"
+
+
+def test_leer_filas_csv_detecta_punto_y_coma(tmp_path):
+    path = tmp_path / "clientes.csv"
+    path.write_text(CABECERA + "Bar;Madrid;Centro;A;Ana;600;Calle 1\n", encoding="utf-8-sig")
+    filas = list(import_handler.leer_filas_csv(str(path)))
+    assert filas[0]["ciudad"] == "Madrid"
+
+
+@pytest.mark.asyncio
+async def test_importar_fichero_inserta_en_lotes(tmp_path):
+    path = tmp_path / "clientes.csv"
+    filas = [f"Cliente {i};Madrid;Centro;A;Ana;600{i};Calle {i}\n" for i in range(5)]
+    filas.insert(2, "Sin teléfono;Madrid;Centro;A;Ana;;Calle\n")
+    path.write_text(CABECERA + "".join(filas), encoding="utf-8")
+
+    sb = MagicMock()
+    sb.table.return_value.insert.return_value.execute = AsyncMock()
+    progreso = MagicMock(edit_text=AsyncMock())
+    with patch.object(import_handler, "supabase", sb):
+        resumen = await import_handler.importar_fichero(
+            import_handler.leer_filas_csv(str(path)), "t1", progreso, tamano_lote=2
+        )
+
+    lotes = [c.args[0] for c in sb.table.return_value.insert.call_args_list]
+    # Los tramos son de 2 filas leídas: la fila inválida deja su lote con un solo cliente
+    assert [len(lote) for lote in lotes] == [2, 1, 2]
+    assert all(c["tenant_id"] == "t1" for lote in lotes for c in lote)
+    assert "5 clientes insertados de 6 filas" in resumen
+    assert "Fila 4: El teléfono debe ser numérico." in resumen
+
+
+def test_leer_filas_xlsx(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    libro = openpyxl.Workbook()
+    hoja = libro.active
+    hoja.append(["nombre", "ciudad", "teléfono"])
+    hoja.append(["Bar", "Madrid", 600111222])
+    hoja.append([None, None, None])
+    libro.save(tmp_path / "clientes.xlsx")
+    filas = list(import_handler.leer_filas_xlsx(str(tmp_path / "clientes.xlsx")))
+    assert filas == [{"nombre": "Bar", "ciudad": "Madrid", "teléfono": 600111222}]
+
+
+def test_leer_lotes_avanza_con_filas_invalidas():
+    filas = [{"nombre": ""} for _ in range(25)]  # cabecera equivocada: ninguna fila válida
+    tramos = list(import_handler.leer_lotes(iter(filas), 10, max_errores=3))
+    assert [(len(lote), len(errores), n_errores, leidas) for lote, errores, n_errores, leidas in tramos] == [
+        (0, 3, 10, 10), (0, 3, 10, 10), (0, 3, 5, 5)]
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from db.catalogo import Catalogo
+from handlers import inline_handler, product_handler
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    catalogo = Catalogo()
+    catalogo.aplicar([
+        {"id": f"p{i:03d}", "sku": str(1000 + i), "name": f"Tornillo {i} mm", "price": 0.1, "stock": 5}
+        for i in range(120)
+    ] + [{"id": "t1", "sku": "9", "name": "Tuerca", "price": 0.2, "stock": 0}])
+    monkeypatch.setitem(product_handler._catalogos, "t1", catalogo)
+    monkeypatch.setattr(inline_handler, "INLINE_DEBOUNCE", 0.01)
+    inline_handler._resultados_cache.clear()
+    return catalogo
+
+
+def _inline(texto, offset="", query_id="q1", usuario=7):
+    query = MagicMock(query=texto, offset=offset, id=query_id, answer=AsyncMock())
+    query.from_user.id = usuario
+    return MagicMock(inline_query=query), query
+
+
+def test_buscar_sku_exacto_primero(catalogo):
+    assert catalogo.buscar("1005", 3)[0]["id"] == "p005"
+    assert catalogo.buscar("tuerca", 3)[0]["id"] == "t1"
+    assert [p["name"] for p in catalogo.buscar("", 2)] == ["Tornillo 0 mm", "Tornillo 1 mm"]
+
+
+@pytest.mark.asyncio
+async def test_paginas_con_next_offset(catalogo):
+    context = MagicMock(user_data={"tenant_id": "t1"})
+
+    update, query = _inline("tornillo")
+    await inline_handler.buscar_productos_inline(update, context)
+    resultados = query.answer.call_args.args[0]
+    assert len(resultados) == 50
+    assert query.answer.call_args.kwargs["next_offset"] == "50"
+    assert query.answer.call_args.kwargs["is_personal"] is True
+    assert query.answer.call_args.kwargs["cache_time"] == inline_handler.INLINE_CACHE_TIME
+
+    catalogo._busqueda = None  # la página siguiente sale de la caché, no de otra búsqueda
+    update, query = _inline("tornillo", offset="100")
+    await inline_handler.buscar_productos_inline(update, context)
+    assert len(query.answer.call_args.args[0]) == 20
+    assert query.answer.call_args.kwargs["next_offset"] == ""
+    assert catalogo._busqueda is None
+
+
+@pytest.mark.asyncio
+async def test_rafaga_solo_responde_a_la_ultima(catalogo):
+    context = MagicMock(user_data={"tenant_id": "t1"})
+    consultas = [_inline(texto, query_id=f"q{i}") for i, texto in enumerate(("to", "tor", "torn"))]
+
+    async def escribir(i):
+        await asyncio.sleep(i * 0.001)
+        await inline_handler.buscar_productos_inline(consultas[i][0], context)
+
+    await asyncio.gather(*(escribir(i) for i in range(3)))
+    assert [q.answer.await_count for _, q in consultas] == [0, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_sin_sesion_ofrece_iniciarla(catalogo):
+    update, query = _inline("tornillo")
+    await inline_handler.buscar_productos_inline(update, MagicMock(user_data={}))
+    assert query.answer.call_args.args[0] == []
+    assert query.answer.call_args.kwargs["cache_time"] == 0
+    assert query.answer.call_args.kwargs["button"].start_parameter == "login"
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from telegram.error import RetryAfter
+
+from utils.limitador import INTERACTIVO, MASIVO, LimitadorEnvios
+
+
+class Api:
+    """Simula la API de Telegram registrando el orden y el instante de cada envío."""
+
+    def __init__(self, fallos=None):
+        self.envios = []
+        self.fallos = dict(fallos or {})  # texto -> segundos de RetryAfter (una sola vez)
+
+    async def enviar(self, chat_id, texto):
+        if texto in self.fallos:
+            raise RetryAfter(timedelta(seconds=self.fallos.pop(texto)))
+        self.envios.append((chat_id, texto, asyncio.get_running_loop().time()))
+        return texto
+
+
+def _enviar(limitador, api, chat_id, texto, prioridad=None):
+    return limitador.process_request(api.enviar, (chat_id, texto), {}, "sendMessage",
+                                     {"chat_id": chat_id, "text": texto}, prioridad)
+
+
+@pytest.mark.asyncio
+async def test_interactivos_adelantan_a_los_masivos():
+    limitador = LimitadorEnvios(tasa_global=5, tasa_chat=100, rafaga_chat=1)
+    api = Api()
+    masivos = [asyncio.create_task(_enviar(limitador, api, 1000 + i, f"m{i}", MASIVO)) for i in range(10)]
+    await asyncio.sleep(0.1)  # la ráfaga global (5) ya ha salido y el resto espera turno
+    interactivo = asyncio.create_task(_enviar(limitador, api, 1, "hola"))
+    await asyncio.gather(interactivo, *masivos)
+    await limitador.shutdown()
+
+    textos = [t for _, t, _ in api.envios]
+    assert textos.index("hola") == 5
+    assert limitador.enviados == {INTERACTIVO: 1, MASIVO: 10}
+    assert limitador.espera[MASIVO].total == 10
+
+
+@pytest.mark.asyncio
+async def test_respeta_limite_global_y_por_chat():
+    limitador = LimitadorEnvios(tasa_global=20, tasa_chat=10, rafaga_chat=2)
+    api = Api()
+    inicio = asyncio.get_running_loop().time()
+    await asyncio.gather(*(_enviar(limitador, api, 1 + i % 3, f"t{i}") for i in range(12)))
+    await limitador.shutdown()
+
+    duracion = api.envios[-1][2] - inicio
+    # Ráfaga global de 20: 12 mensajes caben, pero cada chat (4 mensajes) tiene ráfaga 2 y 10/s
+    assert duracion >= 0.18
+    por_chat = {}
+    for chat_id, texto, _ in api.envios:
+        por_chat.setdefault(chat_id, []).append(texto)
+    # Orden de llegada dentro de cada chat
+    assert por_chat[1] == ["t0", "t3", "t6", "t9"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_se_reprograma_y_mantiene_el_orden():
+    limitador = LimitadorEnvios(tasa_global=100, tasa_chat=100, rafaga_chat=5)
+    api = Api(fallos={"a2": 0.2})
+    inicio = asyncio.get_running_loop().time()
+    resultados = await asyncio.gather(*(_enviar(limitador, api, 7, f"a{i}") for i in range(4)))
+    await limitador.shutdown()
+
+    assert resultados == ["a0", "a1", "a2", "a3"]
+    assert [t for _, t, _ in api.envios] == ["a0", "a1", "a2", "a3"]
+    assert api.envios[2][2] - inicio >= 0.2
+    assert limitador.reintentos == 1
+
+
+@pytest.mark.asyncio
+async def test_sin_chat_no_se_limita_y_reintentos_agotados():
+    limitador = LimitadorEnvios(tasa_global=1, max_reintentos=1)
+    api = Api()
+    respuestas = await asyncio.gather(*(
+        limitador.process_request(api.enviar, (None, f"cb{i}"), {}, "answerCallbackQuery", {}, None)
+        for i in range(5)))
+    assert respuestas == [f"cb{i}" for i in range(5)]
+
+
+    async def siempre_flood(chat_id, texto):
+        raise RetryAfter(timedelta(seconds=0.01))
+
+    with pytest.raises(RetryAfter):
+        await limitador.process_request(siempre_flood, (5, "x"), {}, "sendMessage", {"chat_id": 5}, None)
+    assert limitador.reintentos == 1
+    await limitador.shutdown()
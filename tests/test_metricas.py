@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler, MessageHandler, filters
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+
+from db.conexion import TransporteMedido, clasificar_peticion, errores_supabase, latencia_supabase
+from states import CLIENT_SUBMENU
+from utils import instrumentacion
+from utils.instrumentacion import EjecutorMedido, instrumentar_handlers, latencia_handlers, errores_handlers
+from utils.metricas import Registro
+
+
+def test_exportar_formato_prometheus():
+    registro = Registro()
+    latencia = registro.histograma("x_seconds", "Latencia", ("tabla",), buckets=(0.1, 1.0))
+    latencia.con('com"pa').observar(0.05)
+    latencia.con('com"pa').observar(0.5)
+    registro.contador("x_total", "Total", ("error",)).con("500").inc(3)
+    registro.medidor("x_cola", "Cola", lambda: 7)
+    registro.medidor("x_roto", "Roto", lambda: 1 / 0)
+
+    texto = registro.exportar()
+    assert "# TYPE x_seconds histogram" in texto
+    assert 'x_seconds_bucket{tabla="com\\"pa",le="0.1"} 1' in texto
+    assert 'x_seconds_bucket{tabla="com\\"pa",le="1"} 2' in texto
+    assert 'x_seconds_bucket{tabla="com\\"pa",le="+Inf"} 2' in texto
+    assert 'x_seconds_count{tabla="com\\"pa"} 2' in texto
+    assert 'x_total{error="500"} 3' in texto
+    assert "x_cola 7" in texto
+    assert "x_roto" not in texto
+
+
+@pytest.mark.asyncio
+async def test_transporte_mide_supabase_por_tabla_y_operacion():
+    def responder(request):
+        return httpx.Response(500 if request.url.path.endswith("/fallo") else 200, json=[])
+
+    async with httpx.AsyncClient(transport=TransporteMedido(httpx.MockTransport(responder)),
+                                 base_url="https://x.supabase.co") as http:
+        antes = latencia_supabase.con("companies", "select").total
+        await http.get("/rest/v1/companies?select=*")
+        await http.post("/rest/v1/rpc/facet_counts", json={})
+        await http.patch("/rest/v1/fallo", json={})
+
+    assert latencia_supabase.con("companies", "select").total == antes + 1
+    assert latencia_supabase.con("facet_counts", "rpc").total >= 1
+    assert errores_supabase.con("fallo", "update", "500").valor >= 1
+    assert clasificar_peticion(httpx.Request("POST", "https://x/auth/v1/token?grant_type=password")) == ("auth", "token")
+    assert clasificar_peticion(httpx.Request(
+        "POST", "https://x/rest/v1/products", headers={"Prefer": "resolution=merge-duplicates"})) == ("products", "upsert")
+
+
+@pytest.mark.asyncio
+async def test_instrumentar_handlers_por_estado():
+    async def consulta(update, context):
+        return CLIENT_SUBMENU
+
+    async def falla(update, context):
+        raise ValueError("x")
+
+    application = ApplicationBuilder().token("123:abc").build()
+    conv = ConversationHandler(
+        entry_points=[CommandHandler("start", consulta)],
+        states={CLIENT_SUBMENU: [MessageHandler(filters.TEXT, consulta)]},
+        fallbacks=[],
+    )
+    application.add_handler(conv)
+    application.add_handler(CommandHandler("falla", falla))
+    instrumentar_handlers(application)
+    instrumentar_handlers(application)  # idempotente
+
+    estado_handler = conv.states[CLIENT_SUBMENU][0]
+    assert await estado_handler.callback(None, None) == CLIENT_SUBMENU
+    with pytest.raises(ValueError):
+        await application.handlers[0][1].callback(None, None)
+
+    nombre = "test_metricas.test_instrumentar_handlers_por_estado.<locals>.consulta"
+    assert latencia_handlers.con("CLIENT_SUBMENU", nombre).total == 1
+    assert latencia_handlers.con("entrada", nombre).total == 0
+    assert errores_handlers.con("-", nombre.replace("consulta", "falla")).valor == 1
+
+
+@pytest.mark.asyncio
+async def test_servidor_metricas_y_ejecutor():
+    ejecutor = EjecutorMedido(1)
+    loop = asyncio.get_running_loop()
+    liberar = threading.Event()
+    tareas = [loop.run_in_executor(ejecutor, liberar.wait) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    assert (ejecutor.ocupados, ejecutor.en_cola) == (1, 2)
+    liberar.set()
+    await asyncio.gather(*tareas)
+    assert (ejecutor.ocupados, ejecutor.en_cola) == (0, 0)
+    ejecutor.shutdown()
+
+    sock, puerto = bind_unused_port()
+    servidor = HTTPServer(instrumentacion.aplicacion_metricas())
+    servidor.add_sockets([sock])
+    try:
+        async with httpx.AsyncClient() as http:
+            respuesta = await http.get(f"http://127.0.0.1:{puerto}/metrics")
+        assert respuesta.status_code == 200
+        assert respuesta.headers["content-type"].startswith("text/plain")
+        assert "# TYPE crm_handler_seconds histogram" in respuesta.text
+    finally:
+        servidor.stop()
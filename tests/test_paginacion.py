@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from db.paginacion import filtro_keyset, pagina_keyset, recortar_pagina
+from handlers import client_handler
+from states import CLIENT_FILTER_RESPONSE
+
+
+def test_filtro_keyset_dos_columnas():
+    assert filtro_keyset(("client_name", "id"), ["Bar, S.L.", "7"]) == (
+        'client_name.gt."Bar, S.L.",and(client_name.eq."Bar, S.L.",id.gt."7")'
+    )
+
+
+def test_filtro_keyset_escapa_comillas():
+    assert filtro_keyset(("id",), ['a"b'], "lt") == 'id.lt."a\\"b"'
+
+
+def test_pagina_keyset_hacia_atras_invierte_orden():
+    query = MagicMock()
+    query.or_.return_value = query
+    query.order.return_value = query
+    pagina_keyset(query, ("client_name", "id"), ["B", "2"], limite=5, hacia_atras=True)
+    query.order.assert_any_call("client_name", desc=True)
+    query.limit.assert_called_once_with(6)
+
+
+def test_recortar_pagina():
+    assert recortar_pagina([1, 2, 3], 2) == ([1, 2], True)
+    assert recortar_pagina([3, 2], 2, hacia_atras=True) == ([2, 3], False)
+
+
+def _sel_mock(filas):
+    sel = MagicMock()
+    for metodo in ("select", "eq", "or_", "order", "limit"):
+        getattr(sel, metodo).return_value = sel
+    sel.execute = AsyncMock(return_value=MagicMock(data=filas))
+    sb = MagicMock()
+    sb.table.return_value = sel
+    return sb, sel
+
+
+@pytest.mark.asyncio
+async def test_primera_pagina_guarda_solo_cursor(monkeypatch):
+    monkeypatch.setattr(client_handler, "CLIENT_PAGE_SIZE", 2)
+    filas = [{"id": "1", "client_name": "A"}, {"id": "2", "client_name": "B"}, {"id": "3", "client_name": "C"}]
+    sb, sel = _sel_mock(filas)
+    query = MagicMock(data="client_city_Madrid", answer=AsyncMock(), edit_message_text=AsyncMock())
+    update = MagicMock(callback_query=query)
+    context = MagicMock(user_data={"tenant_id": "t1"})
+
+    with patch.object(client_handler, "supabase", sb):
+        estado = await client_handler.mostrar_clientes_filtrados(update, context)
+
+    assert estado == CLIENT_FILTER_RESPONSE
+    sel.or_.assert_not_called()
+    cursor = context.user_data["clientes_cursor"]
+    assert cursor["ultimo"] == ["B", "2"] and cursor["hay_siguiente"] and not cursor["hay_anterior"]
+    assert "clientes_filtrados" not in context.user_data
+    teclado = query.edit_message_text.call_args.kwargs["reply_markup"].inline_keyboard
+    assert [b.callback_data for b in teclado[0] + teclado[1]] == ["client_sel_1", "client_sel_2"]
+    assert [b.callback_data for b in teclado[2]] == ["client_page_next"]
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import time
+
+import pytest
+
+from db.persistencia import PersistenciaSQLite
+
+
+@pytest.mark.asyncio
+async def test_una_pasada_se_vuelca_en_un_solo_lote(tmp_path):
+    ruta = str(tmp_path / "p.sqlite3")
+    persistencia = PersistenciaSQLite(ruta)
+
+    # Lo que hace la Application en cada update_interval: un gather de update_*
+    await asyncio.gather(
+        *(persistencia.update_user_data(i, {"nuevo_cliente": {"nombre": f"Cliente {i}"}}) for i in range(200)),
+        *(persistencia.update_conversation("principal", (i, i), 7) for i in range(200)),
+        persistencia.update_bot_data({"version": 1}),
+    )
+    # Los cambios repetidos de un mismo usuario se quedan en el último
+    await persistencia.update_user_data(3, {"awaiting_field": "ciudad"})
+    await persistencia.flush()
+
+    assert persistencia.volcados <= 2
+    recargada = PersistenciaSQLite(ruta)
+    usuarios = await recargada.get_user_data()
+    assert len(usuarios) == 200
+    assert usuarios[3] == {"awaiting_field": "ciudad"}
+    assert usuarios[10] == {"nuevo_cliente": {"nombre": "Cliente 10"}}
+    conversaciones = await recargada.get_conversations("principal")
+    assert conversaciones[(5, 5)] == 7
+    assert await recargada.get_bot_data() == {"version": 1}
+    assert recargada._conexion().execute("pragma journal_mode").fetchone()[0] == "wal"
+
+
+@pytest.mark.asyncio
+async def test_fin_de_conversacion_y_baja_de_usuario(tmp_path):
+    ruta = str(tmp_path / "p.sqlite3")
+    persistencia = PersistenciaSQLite(ruta)
+    await persistencia.update_conversation("principal", (1, 1), 3)
+    await persistencia.update_user_data(1, {"tenant_id": "t1"})
+    await asyncio.sleep(0.05)
+
+    await persistencia.update_conversation("principal", (1, 1), None)
+    await persistencia.drop_user_data(1)
+    await persistencia.flush()
+
+    recargada = PersistenciaSQLite(ruta)
+    assert await recargada.get_conversations("principal") == {}
+    assert await recargada.get_user_data() == {}
+
+
+@pytest.mark.asyncio
+async def test_update_no_espera_a_disco(tmp_path, monkeypatch):
+    persistencia = PersistenciaSQLite(str(tmp_path / "p.sqlite3"))
+    escribiendo = []
+
+    def escribir_lento(lote):
+        escribiendo.append(len(lote))
+        time.sleep(0.1)
+
+    monkeypatch.setattr(persistencia, "_escribir", escribir_lento)
+    inicio = asyncio.get_running_loop().time()
+    await persistencia.update_user_data(1, {"a": 1})
+    assert asyncio.get_running_loop().time() - inicio < 0.05
+    await persistencia.flush()
+    assert escribiendo == [1]
+
+
+@pytest.mark.asyncio
+async def test_tokens_de_recuperacion_no_se_persisten(tmp_path):
+    ruta = str(tmp_path / "p.sqlite3")
+    persistencia = PersistenciaSQLite(ruta)
+    await persistencia.update_user_data(1, {"tenant_id": "t1", "reset_access_token": "secreto",
+                                            "reset_refresh_token": "r-secreto"})
+    await persistencia.flush()
+
+    assert os.stat(ruta).st_mode & 0o777 == 0o600
+    volcado = "\n".join(sqlite3.connect(ruta).iterdump())
+    assert "secreto" not in volcado
+    assert await PersistenciaSQLite(ruta).get_user_data() == {1: {"tenant_id": "t1"}}
+
+
+@pytest.mark.asyncio
+async def test_tokens_guardados_por_versiones_anteriores_se_borran(tmp_path):
+    ruta = str(tmp_path / "p.sqlite3")
+    antigua = PersistenciaSQLite(ruta)
+    antigua._escribir({("user_data", 1): pickle.dumps({"tenant_id": "t1", "reset_access_token": "secreto"})})
+    await antigua.flush()
+
+    persistencia = PersistenciaSQLite(ruta)
+    assert await persistencia.get_user_data() == {1: {"tenant_id": "t1"}}
+    await persistencia.flush()
+    assert "secreto" not in "\n".join(sqlite3.connect(ruta).iterdump())
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from telegram import Update
+
+from utils.procesador import ProcesadorPorChat
+
+
+def _update(update_id, chat_id, user_id=None):
+    user_id = chat_id if user_id is None else user_id
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "x",
+            "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Ana"},
+        },
+    }, None)
+
+
+class Registro:
+    def __init__(self):
+        self.eventos = []
+        self.en_curso = 0
+        self.maximo = 0
+
+    async def atender(self, nombre, duracion=0.02):
+        self.en_curso += 1
+        self.maximo = max(self.maximo, self.en_curso)
+        self.eventos.append(("inicio", nombre))
+        await asyncio.sleep(duracion)
+        self.eventos.append(("fin", nombre))
+        self.en_curso -= 1
+
+
+@pytest.mark.asyncio
+async def test_orden_por_chat_y_paralelo_entre_chats():
+    procesador = ProcesadorPorChat(8)
+    registro = Registro()
+    updates = [(_update(i, 1 + i % 2), f"chat{1 + i % 2}-{i}") for i in range(6)]
+
+    await asyncio.gather(*(procesador.process_update(u, registro.atender(n)) for u, n in updates))
+
+    for chat in ("chat1", "chat2"):
+        propios = [e for e in registro.eventos if e[1].startswith(chat)]
+        # Nunca se solapan dos updates del mismo chat y se atienden en orden de llegada
+        assert [tipo for tipo, _ in propios] == ["inicio", "fin"] * 3
+        assert [n for tipo, n in propios if tipo == "inicio"] == [n for _, n in updates if n.startswith(chat)]
+    assert registro.maximo == 2
+    assert procesador.en_espera == 0 and procesador.en_curso == 0
+    assert procesador.procesados == 6
+    assert procesador._cerrojos == {}
+
+
+@pytest.mark.asyncio
+async def test_mismo_usuario_en_dos_chats_se_serializa():
+    procesador = ProcesadorPorChat(8)
+    registro = Registro()
+    await asyncio.gather(
+        procesador.process_update(_update(1, -100, user_id=5), registro.atender("grupo")),
+        procesador.process_update(_update(2, 5), registro.atender("privado")),
+    )
+    assert registro.maximo == 1
+
+
+@pytest.mark.asyncio
+async def test_limite_de_concurrencia_sin_bloqueo_de_cabeza():
+    procesador = ProcesadorPorChat(2)
+    registro = Registro()
+    terminado = {}
+
+    async def atender(nombre):
+        await registro.atender(nombre)
+        terminado[nombre] = asyncio.get_running_loop().time()
+
+    # Un chat con muchos mensajes en cola no ocupa todos los huecos de ejecución
+    tareas = [procesador.process_update(_update(i, 1), atender(f"a{i}")) for i in range(10)]
+    tareas += [procesador.process_update(_update(100 + i, 10 + i), atender(f"b{i}")) for i in range(4)]
+    inicio = asyncio.get_running_loop().time()
+    await asyncio.gather(*tareas)
+
+    assert registro.maximo <= 2
+    assert max(terminado[f"b{i}"] for i in range(4)) - inicio < terminado["a9"] - inicio
+    assert procesador.espera_cerrojo.total == 14
+    assert procesador.espera_cerrojo.percentil(95) > 0
@@ -0,0 +1,68 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from telegram.error import BadRequest
+
+from handlers import product_handler
+
+
+def _supabase_mock():
+    sel = MagicMock()
+    for metodo in ("update", "eq"):
+        getattr(sel, metodo).return_value = sel
+    sel.execute = AsyncMock(return_value=MagicMock(data=[]))
+    sb = MagicMock()
+    sb.table.return_value = sel
+    return sb, sel
+
+
+def _mensaje(file_id="AgAD-nuevo"):
+    enviado = MagicMock(photo=[MagicMock(file_id="AgAD-mini"), MagicMock(file_id=file_id)])
+    return MagicMock(reply_photo=AsyncMock(return_value=enviado))
+
+
+@pytest.mark.asyncio
+async def test_primer_envio_guarda_file_id_y_luego_se_reutiliza():
+    sb, sel = _supabase_mock()
+    producto = {"id": "p1", "image_url": "https://img/p1.jpg"}
+    mensaje = _mensaje()
+
+    with patch.object(product_handler, "supabase", sb):
+        await product_handler.enviar_foto_producto(mensaje, producto, caption="P1")
+        await product_handler.enviar_foto_producto(mensaje, producto, caption="P1")
+
+    fotos = [c.kwargs["photo"] for c in mensaje.reply_photo.call_args_list]
+    assert fotos == ["https://img/p1.jpg", "AgAD-nuevo"]
+    sel.update.assert_called_once_with({"image_file_id": "AgAD-nuevo", "image_file_url": "https://img/p1.jpg"})
+    sel.eq.assert_any_call("image_url", "https://img/p1.jpg")
+    assert sel.execute.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_cambio_de_url_invalida_file_id():
+    sb, sel = _supabase_mock()
+    producto = {"id": "p1", "image_url": "https://img/p1-v2.jpg",
+                "image_file_id": "AgAD-viejo", "image_file_url": "https://img/p1.jpg"}
+    mensaje = _mensaje("AgAD-v2")
+
+    with patch.object(product_handler, "supabase", sb):
+        await product_handler.enviar_foto_producto(mensaje, producto)
+
+    assert mensaje.reply_photo.call_args.kwargs["photo"] == "https://img/p1-v2.jpg"
+    assert producto["image_file_id"] == "AgAD-v2"
+    assert producto["image_file_url"] == "https://img/p1-v2.jpg"
+
+
+@pytest.mark.asyncio
+async def test_file_id_rechazado_vuelve_a_la_url():
+    sb, _ = _supabase_mock()
+    producto = {"id": "p1", "image_url": "https://img/p1.jpg",
+                "image_file_id": "AgAD-otro-bot", "image_file_url": "https://img/p1.jpg"}
+    mensaje = _mensaje()
+    mensaje.reply_photo.side_effect = [BadRequest("Wrong file identifier"), mensaje.reply_photo.return_value]
+
+    with patch.object(product_handler, "supabase", sb):
+        await product_handler.enviar_foto_producto(mensaje, producto)
+
+    assert [c.kwargs["photo"] for c in mensaje.reply_photo.call_args_list] == ["AgAD-otro-bot", "https://img/p1.jpg"]
+    assert producto["image_file_id"] == "AgAD-nuevo"
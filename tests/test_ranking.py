@@ -0,0 +1,163 @@
+import multiprocessing
+import random
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from db.catalogo import Catalogo
+from handlers import admin_handler, product_handler
+from utils import analitica
+
+
+def _lineas(n, semilla=1):
+    rng = random.Random(semilla)
+    return [{
+        "id": f"{i:08d}",
+        "product_id": f"p{rng.randrange(40):02d}",
+        "quantity": rng.randint(1, 5),
+        "subtotal": round(rng.uniform(1, 50), 2),
+        "invoices": {"company_id": f"c{rng.randrange(25):02d}"},
+    } for i in range(n)]
+
+
+class LineasFalsas:
+    """Builder mínimo de invoice_items paginado por id (keyset)."""
+
+    def __init__(self, filas):
+        self.filas = filas
+
+    def table(self, nombre):
+        self._desde, self._limite = None, None
+        return self
+
+    def select(self, columnas):
+        return self
+
+    def eq(self, campo, valor):
+        return self
+
+    def gte(self, campo, valor):
+        return self
+
+    def or_(self, filtro):
+        self._desde = filtro.split('"')[1]
+        return self
+
+    def order(self, columna, desc=False):
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    async def execute(self):
+        filas = [f for f in self.filas if self._desde is None or f["id"] > self._desde]
+        return MagicMock(data=filas[:self._limite])
+
+
+def _referencia(lineas, campo):
+    totales = defaultdict(lambda: [0, 0.0])
+    for l in lineas:
+        clave = l["invoices"]["company_id"] if campo == "company_id" else l[campo]
+        totales[clave][0] += l["quantity"]
+        totales[clave][1] += l["subtotal"]
+    return totales
+
+
+def test_agrupar_y_combinar_equivalen_a_sumar():
+    lineas = _lineas(3000)
+    mitad = len(lineas) // 2
+    bloques = [analitica.agregar_bloque(
+        [l["product_id"] for l in parte], [l["invoices"]["company_id"] for l in parte],
+        [l["quantity"] for l in parte], [l["subtotal"] for l in parte],
+    ) for parte in (lineas[:mitad], lineas[mitad:])]
+    claves, unidades, importes = analitica.combinar(bloques[0][0], bloques[1][0])
+
+    referencia = _referencia(lineas, "product_id")
+    assert list(claves) == sorted(referencia)
+    assert unidades.tolist() == [referencia[c][0] for c in claves]
+    assert importes == pytest.approx([referencia[c][1] for c in claves])
+
+
+def test_top_y_top_por_grupo():
+    claves = np.asarray(["a", "b", "c", "d", "e"])
+    valores = np.asarray([5.0, 9.0, 1.0, 9.0, 3.0])
+    assert analitica.top(claves, valores, 3) == [("b", 9.0), ("d", 9.0), ("a", 5.0)]
+    assert analitica.top(claves, valores, 2, ascendente=True) == [("c", 1.0), ("e", 3.0)]
+
+    grupos = np.asarray(["N", "S", "N", "N", "S"])
+    assert analitica.top_por_grupo(claves, valores, grupos, 2) == {
+        "N": [("d", 9.0), ("a", 5.0)],
+        "S": [("b", 9.0), ("e", 3.0)],
+    }
+    assert analitica.valores_de(claves, valores, np.asarray(["d", "z"])).tolist() == [9.0, 0.0]
+
+
+@pytest.mark.asyncio
+async def test_agregar_ventas_en_procesos():
+    lineas = _lineas(20000)
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        productos, clientes = await admin_handler.agregar_ventas(
+            LineasFalsas(lineas), "t1", "2025-01-01", executor=pool, tamano_pagina=3000
+        )
+    referencia = _referencia(lineas, "company_id")
+    assert list(clientes[0]) == sorted(referencia)
+    assert clientes[2] == pytest.approx([referencia[c][1] for c in clientes[0]])
+    assert productos[1].sum() == sum(l["quantity"] for l in lineas)
+
+
+@pytest.mark.asyncio
+async def test_comando_ranking(monkeypatch):
+    lineas = _lineas(500)
+    catalogo = Catalogo()
+    catalogo.aplicar([{"id": f"p{i:02d}", "name": f"Producto {i}", "stock": 10} for i in range(45)])
+    monkeypatch.setitem(product_handler._catalogos, "t1", catalogo)
+    monkeypatch.setattr(admin_handler, "ADMIN_IDS", {1})
+
+    async def agregar_en_linea(client, tenant_id, desde):
+        bloque = ([l["product_id"] for l in lineas], [l["invoices"]["company_id"] for l in lineas],
+                  [l["quantity"] for l in lineas], [l["subtotal"] for l in lineas])
+        productos, clientes = analitica.agregar_bloque(*bloque)
+        return productos, clientes
+
+    nombres = {f"c{i:02d}": (f"Cliente {i}", "Norte" if i % 2 else "Sur") for i in range(25)}
+    aviso = MagicMock(edit_text=AsyncMock())
+    update = MagicMock()
+    update.effective_user.id = 1
+    update.message.reply_text = AsyncMock(return_value=aviso)
+    context = MagicMock(user_data={"tenant_id": "t1"}, args=["30"])
+
+    with patch.object(admin_handler, "agregar_ventas", agregar_en_linea), \
+         patch.object(admin_handler, "leer_clientes_rutas", AsyncMock(return_value=nombres)):
+        await admin_handler.ranking(update, context)
+
+    texto = aviso.edit_text.call_args.args[0]
+    referencia = _referencia(lineas, "product_id")
+    mejor = max(referencia, key=lambda c: referencia[c][1])
+    assert f"1. Producto {int(mejor[1:])}:" in texto
+    # Los productos sin ventas encabezan la baja rotación
+    assert "- Producto 40: 0 uds. vendidas" in texto
+    assert "_Norte_" in texto and "_Sur_" in texto
+
+
+def test_texto_ranking_escapa_nombres_con_marcado():
+    catalogo = Catalogo()
+    catalogo.productos = {"p1": {"id": "p1", "name": "Tornillo_M6 *inox*", "stock": 0}}
+    catalogo.con_stock = set()
+    productos = (np.asarray(["p1"]), np.asarray([3.0]), np.asarray([9.0]))
+    clientes = (np.asarray(["c1"]), np.asarray([3.0]), np.asarray([9.0]))
+    texto = admin_handler.texto_ranking(productos, clientes, catalogo, {"c1": ("Bar_Pepe", "Ruta_1")}, 30)
+    assert "Tornillo\\_M6 \\*inox\\*" in texto
+    assert "Bar\\_Pepe" in texto and "\nRuta\\_1 (9.00)" in texto
+
+
+def test_cerrar_pool_ranking():
+    pool = admin_handler.pool_ranking()
+    admin_handler.cerrar_pool_ranking()
+    assert admin_handler._pool_ranking is None
+    with pytest.raises(RuntimeError):
+        pool.submit(sum, [1])
+    admin_handler.cerrar_pool_ranking()  # sin pool: no hace nada
@@ -0,0 +1,110 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from db.catalogo import Catalogo
+from db.local import LocalDB
+from handlers import product_handler, sale_handler
+from states import SALE_CART, SALE_SUBMENU
+
+PRODUCTOS = [
+    {"id": "p1", "tenant_id": "t1", "sku": "1005", "name": "Tornillo", "price": 0.5, "stock": 10},
+    {"id": "p2", "tenant_id": "t1", "sku": "1006", "name": "Tuerca", "price": 0.25, "stock": 1},
+]
+
+
+@pytest.fixture
+def db():
+    db = LocalDB()
+    db.insertar("companies", [{"id": "c1", "tenant_id": "t1", "client_name": "Bar Pepe"}])
+    db.insertar("products", [dict(p) for p in PRODUCTOS])
+    return db
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    catalogo = Catalogo()
+    catalogo.aplicar([dict(p) for p in PRODUCTOS])
+    monkeypatch.setitem(product_handler._catalogos, "t1", catalogo)
+    return catalogo
+
+
+def _consulta(db, tabla, columnas):
+    return [tuple(f) for f in db.conn.execute(f"select {columnas} from {tabla} order by 1")]
+
+
+@pytest.mark.asyncio
+async def test_create_sale_escribe_todo_en_una_llamada(db):
+    items = [{"product_id": "p1", "quantity": 3}, {"product_id": "p2", "quantity": 1}, {"product_id": "p1", "quantity": 1}]
+    factura = (await db.rpc("create_sale", {"p_tenant_id": "t1", "p_company_id": "c1", "p_items": items}).execute()).data[0]
+
+    assert factura["total_amount"] == pytest.approx(2.25)
+    assert _consulta(db, "invoices", "company_id, total_amount") == [("c1", 2.25)]
+    assert _consulta(db, "invoice_items", "product_id, quantity, subtotal") == [("p1", 4, 2.0), ("p2", 1, 0.25)]
+    assert _consulta(db, "products", "id, stock") == [("p1", 6), ("p2", 0)]
+
+
+@pytest.mark.asyncio
+async def test_create_sale_sin_stock_no_escribe_nada(db):
+    items = [{"product_id": "p1", "quantity": 3}, {"product_id": "p2", "quantity": 2}]
+    with pytest.raises(ValueError, match="Stock insuficiente: Tuerca"):
+        await db.rpc("create_sale", {"p_tenant_id": "t1", "p_company_id": "c1", "p_items": items}).execute()
+    assert _consulta(db, "invoices", "id") == []
+    assert _consulta(db, "invoice_items", "id") == []
+    assert _consulta(db, "products", "id, stock") == [("p1", 10), ("p2", 1)]
+
+
+@pytest.mark.asyncio
+async def test_carrito_y_confirmacion(db, catalogo):
+    context = MagicMock(user_data={"tenant_id": "t1", "carrito": {"company_id": "c1", "cliente": "Bar Pepe", "lineas": {}}})
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+
+    for texto in ("1005 x3", "tuerca", "tuerca"):
+        update.message.text = texto
+        assert await sale_handler.anadir_linea(update, context) == SALE_CART
+    lineas = context.user_data["carrito"]["lineas"]
+    assert {pid: l["quantity"] for pid, l in lineas.items()} == {"p1": 3, "p2": 1}
+    assert "Stock insuficiente de Tuerca" in update.message.reply_text.call_args_list[-2].args[0]
+
+    query = MagicMock(data="sale_confirm", answer=AsyncMock(), edit_message_text=AsyncMock())
+    update = MagicMock(callback_query=query)
+    update.effective_message.reply_text = AsyncMock()
+    with patch.object(sale_handler, "supabase", db), patch.object(db, "rpc", wraps=db.rpc) as rpc:
+        assert await sale_handler.acciones_carrito(update, context) == SALE_SUBMENU
+
+    rpc.assert_called_once()
+    assert "Venta registrada: FACT-" in query.edit_message_text.call_args.args[0]
+    assert "carrito" not in context.user_data
+    assert catalogo.productos["p1"]["stock"] == 7
+    assert catalogo.filtrar("stock", "false")[0]["id"] == "p2"
+
+
+@pytest.mark.asyncio
+async def test_error_de_la_rpc_conserva_el_carrito(db, catalogo):
+    carrito = {"company_id": "c1", "cliente": "Bar Pepe",
+               "lineas": {"p2": {"sku": "1006", "name": "Tuerca", "price": 0.25, "quantity": 5}}}
+    context = MagicMock(user_data={"tenant_id": "t1", "carrito": carrito})
+    query = MagicMock(data="sale_confirm", answer=AsyncMock(), edit_message_text=AsyncMock())
+
+    with patch.object(sale_handler, "supabase", db):
+        assert await sale_handler.acciones_carrito(MagicMock(callback_query=query), context) == SALE_CART
+
+    assert "Stock insuficiente" in query.edit_message_text.call_args.args[0]
+    assert context.user_data["carrito"] is carrito
+
+
+@pytest.mark.asyncio
+async def test_numero_al_final_del_nombre_no_es_cantidad(catalogo):
+    catalogo.aplicar([{"id": "p3", "tenant_id": "t1", "sku": "2001", "name": "Agua 1500", "price": 0.6, "stock": 50}])
+    context = MagicMock(user_data={"tenant_id": "t1", "carrito": {"company_id": "c1", "cliente": "Bar Pepe", "lineas": {}}})
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+
+    update.message.text = "Agua 1500"
+    assert await sale_handler.anadir_linea(update, context) == SALE_CART
+    assert context.user_data["carrito"]["lineas"]["p3"]["quantity"] == 1
+
+    update.message.text = "Agua 1500 x2"
+    await sale_handler.anadir_linea(update, context)
+    assert context.user_data["carrito"]["lineas"]["p3"]["quantity"] == 3
+    assert sale_handler.LINEA_RE.match("1005x4")["cantidad"] == "4"
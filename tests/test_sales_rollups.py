@@ -0,0 +1,121 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from db.local import LocalDB
+from db.ventas import desplazar_periodo, leer_rollup
+from handlers import sale_handler
+from scripts import seed_invoices
+from states import SALE_SUBMENU
+
+
+class RollupSQLite:
+    """Builder mínimo de PostgREST que resuelve select/eq/in_/order/limit sobre LocalDB."""
+
+    def __init__(self, db):
+        self.db = db
+        self.tablas = []
+
+    def table(self, nombre):
+        self.tablas.append(nombre)
+        self._tabla, self._filtros, self._params, self._orden, self._limite = nombre, [], [], "", ""
+        return self
+
+    def select(self, columnas):
+        self._columnas = columnas
+        return self
+
+    def eq(self, campo, valor):
+        self._filtros.append(f"{campo} = ?")
+        self._params.append(valor)
+        return self
+
+    def in_(self, campo, valores):
+        self._filtros.append(f"{campo} in ({', '.join('?' for _ in valores)})")
+        self._params.extend(valores)
+        return self
+
+    def order(self, campo, desc=False):
+        self._orden = f" order by {campo}{' desc' if desc else ''}"
+        return self
+
+    def limit(self, n):
+        self._limite = f" limit {n}"
+        return self
+
+    async def execute(self):
+        sql = f"select {self._columnas} from {self._tabla} where {' and '.join(self._filtros)}{self._orden}{self._limite}"
+        return MagicMock(data=[dict(f) for f in self.db.conn.execute(sql, self._params)])
+
+
+@pytest.fixture
+def db():
+    db = LocalDB()
+    db.insertar("companies", [
+        {"id": "c1", "tenant_id": "t1", "client_name": "Bar Pepe", "route": "Norte"},
+        {"id": "c2", "tenant_id": "t1", "client_name": "Bazar Sol", "route": "Sur"},
+    ])
+    db.insertar("products", [
+        {"id": "p1", "tenant_id": "t1", "name": "Tornillo", "category": "Ferretería", "price": 2.0, "stock": 100},
+        {"id": "p2", "tenant_id": "t1", "name": "Brocha", "category": "Pintura", "price": 5.0, "stock": 100},
+    ])
+    return db
+
+
+async def _venta(db, cliente, items):
+    await db.rpc("create_sale", {"p_tenant_id": "t1", "p_company_id": cliente, "p_items": items}).execute()
+
+
+def _rollup(db, dimension):
+    return {f["key"]: (f["amount"], f["quantity"], f["invoices"]) for f in db.conn.execute(
+        "select key, amount, quantity, invoices from sales_rollups where dimension = ?", (dimension,))}
+
+
+@pytest.mark.asyncio
+async def test_cada_venta_actualiza_el_rollup(db):
+    await _venta(db, "c1", [{"product_id": "p1", "quantity": 3}, {"product_id": "p2", "quantity": 1}])
+    await _venta(db, "c2", [{"product_id": "p1", "quantity": 1}])
+
+    assert _rollup(db, "route") == {"Norte": (11.0, 4, 1), "Sur": (2.0, 1, 1)}
+    assert _rollup(db, "category") == {"Ferretería": (8.0, 4, 2), "Pintura": (5.0, 1, 1)}
+    assert _rollup(db, "product") == {"p1": (8.0, 4, 2), "p2": (5.0, 1, 1)}
+    assert _rollup(db, "total") == {"": (13.0, 5, 2)}
+
+
+def test_carga_masiva_mantiene_el_rollup():
+    db = LocalDB()
+    seed_invoices.generar(db.insertar, semilla=3, clientes=200, productos=30, facturas=300,
+                          tamano_lote=250, progreso=lambda m: None)
+    por_mes = db.conn.execute(
+        "select substr(i.issue_date, 1, 7) || '-01', round(sum(n.subtotal), 2) from invoice_items n "
+        "join invoices i on i.id = n.invoice_id group by 1"
+    ).fetchall()
+    rollup = dict(db.conn.execute("select period, round(amount, 2) from sales_rollups where dimension = 'total'"))
+    assert dict(por_mes) == rollup
+    facturas = db.conn.execute("select count(*) from invoices").fetchone()[0]
+    assert db.conn.execute("select sum(invoices) from sales_rollups where dimension = 'total'").fetchone()[0] == facturas
+
+
+@pytest.mark.asyncio
+async def test_informe_lee_solo_el_rollup(db):
+    await _venta(db, "c1", [{"product_id": "p1", "quantity": 3}, {"product_id": "p2", "quantity": 1}])
+    await _venta(db, "c2", [{"product_id": "p2", "quantity": 4}])
+    periodo = db.conn.execute("select period from sales_rollups limit 1").fetchone()[0]
+    cliente = RollupSQLite(db)
+
+    total, filas = await leer_rollup(cliente, "t1", periodo, "product", limite=1)
+    assert total["amount"] == 31.0
+    assert [f["label"] for f in filas] == ["Brocha"]
+
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+    with patch.object(sale_handler, "supabase", cliente):
+        assert await sale_handler.consulta_venta(update, MagicMock(user_data={"tenant_id": "t1"})) == SALE_SUBMENU
+    texto = update.message.reply_text.call_args.args[0]
+    assert "Total: 31.00 · 2 facturas" in texto
+    assert texto.index("Sur: 20.00") < texto.index("Norte: 11.00")
+    assert set(cliente.tablas) == {"sales_rollups"}
+
+
+def test_desplazar_periodo():
+    assert desplazar_periodo("2025-01-01", -1) == "2024-12-01"
+    assert desplazar_periodo("2024-12-01", 1) == "2025-01-01"
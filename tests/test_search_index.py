@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from handlers import client_handler
+from states import CLIENT_FILTER_RESPONSE
+from utils.search_index import TrigramIndex, normalizar
+
+CAMPOS = ("client_name", "contact_person", "phone", "city")
+
+
+@pytest.fixture
+def indice():
+    indice = TrigramIndex(CAMPOS)
+    indice.add("1", {"client_name": "Bar Pepe", "contact_person": "José", "phone": "600111222", "city": "Logroño"})
+    indice.add("2", {"client_name": "Panadería Sol", "contact_person": "Ana", "phone": "600333444", "city": "Madrid"})
+    indice.add("3", {"client_name": "Bar Luna", "contact_person": "Luis", "phone": "611000000", "city": "Madrid"})
+    return indice
+
+
+def test_normalizar_quita_tildes():
+    assert normalizar("Logroño ÁRBOL") == "logrono arbol"
+
+
+def test_busqueda_tolera_erratas(indice):
+    assert [r[0] for r in indice.search("panaderia")] == ["2"]
+    assert indice.search("madird")[0][0] in {"2", "3"}
+
+
+def test_prefijo_y_telefono(indice):
+    assert indice.search("bar lu")[0][0] == "3"
+    assert indice.search("600111")[0][0] == "1"
+
+
+def test_actualizacion_incremental(indice):
+    indice.update("3", {"client_name": "Cafetería Luna"})
+    assert "3" not in [r[0] for r in indice.search("bar")]
+    indice.remove("1")
+    assert indice.search("pepe") == []
+    assert len(indice) == 2
+
+
+def test_busqueda_rapida_con_miles_de_clientes():
+    indice = TrigramIndex(CAMPOS)
+    for i in range(5000):
+        indice.add(str(i), {"client_name": f"Cliente {i} Comercial", "city": f"Ciudad {i % 300}", "phone": f"6{i:08d}"})
+    inicio = time.perf_counter()
+    assert indice.search("cliente 4321 comercal")[0][0] == "4321"
+    assert time.perf_counter() - inicio < 0.1
+
+
+@pytest.mark.asyncio
+async def test_buscar_cliente_construye_indice_una_vez():
+    client_handler._indices_busqueda.clear()
+    filas = [{"id": "1", "client_name": "Bar Pepe", "contact_person": None, "phone": "600", "city": "Madrid"}]
+    sel = MagicMock()
+    for metodo in ("select", "eq", "or_", "order", "limit"):
+        getattr(sel, metodo).return_value = sel
+    sel.execute = AsyncMock(return_value=MagicMock(data=filas))
+    sb = MagicMock()
+    sb.table.return_value = sel
+
+    update = MagicMock()
+    update.message.text = "pepe"
+    update.message.reply_text = AsyncMock()
+    context = MagicMock(user_data={"tenant_id": "t1", "awaiting_busqueda": True})
+
+    with patch.object(client_handler, "supabase", sb):
+        assert await client_handler.buscar_cliente(update, context) == CLIENT_FILTER_RESPONSE
+        client_handler.indexar_cliente("t1", "2", {"client_name": "Pepa Bar", "city": "Soria"})
+        context.user_data["awaiting_busqueda"] = True
+        await client_handler.buscar_cliente(update, context)
+
+    assert sb.table.call_count == 1
+    teclado = update.message.reply_text.call_args.kwargs["reply_markup"].inline_keyboard
+    assert {fila[0].callback_data for fila in teclado[:-1]} == {"client_sel_1", "client_sel_2"}
+
+    # Al elegir un resultado se usa el nombre del cliente, no el texto del botón con la ciudad
+    query = MagicMock(data="client_sel_2")
+    query.answer = AsyncMock()
+    query.edit_message_text = AsyncMock()
+    update.callback_query = query
+    context.bot.send_message = AsyncMock()
+    await client_handler.seleccionar_cliente(update, context)
+    assert context.user_data["cliente_seleccionado_nombre"] == "Pepa Bar"
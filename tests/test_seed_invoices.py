@@ -0,0 +1,66 @@
+from collections import Counter
+
+from db.local import LocalDB
+from scripts import seed_invoices
+
+
+def _generar(db=None, **opciones):
+    lotes = []
+    destino = db.insertar if db else (lambda tabla, filas: lotes.append((tabla, [dict(f) for f in filas])))
+    params = dict(semilla=7, tenants=2, clientes=300, productos=50, facturas=400, tamano_lote=100, progreso=lambda m: None)
+    params.update(opciones)
+    return seed_invoices.generar(destino, **params), lotes
+
+
+def test_determinista_por_semilla():
+    _, a = _generar()
+    _, b = _generar()
+    _, c = _generar(semilla=8)
+    assert a == b
+    assert a != c
+
+
+def test_inserta_por_lotes_padres_antes_que_hijos():
+    insertadas, lotes = _generar()
+    assert all(len(filas) <= 100 for _, filas in lotes)
+    assert insertadas["invoice_items"] > insertadas["invoices"]
+    # Cada lote de líneas solo referencia facturas ya insertadas
+    vistas = set()
+    for tabla, filas in lotes:
+        if tabla == "invoices":
+            vistas.update(f["id"] for f in filas)
+        elif tabla == "invoice_items":
+            assert {f["invoice_id"] for f in filas} <= vistas
+    # Las líneas de una factura nunca se reparten entre dos lotes
+    lotes_por_factura = Counter()
+    for tabla, filas in lotes:
+        if tabla == "invoice_items":
+            for factura in {f["invoice_id"] for f in filas}:
+                lotes_por_factura[factura] += 1
+    assert set(lotes_por_factura.values()) == {1}
+
+
+def test_datos_coherentes_y_sesgados():
+    db = LocalDB()
+    _generar(db, tenants=1, clientes=2000, facturas=500)
+    descuadres = db.conn.execute(
+        "select count(*) from invoices i join (select invoice_id, sum(subtotal) s from invoice_items group by 1) l "
+        "on l.invoice_id = i.id where abs(i.total_amount - l.s) > 0.01"
+    ).fetchone()[0]
+    assert descuadres == 0
+    assert db.conn.execute(
+        "select count(*) from invoices i left join companies c on c.id = i.company_id and c.tenant_id = i.tenant_id "
+        "where c.id is null"
+    ).fetchone()[0] == 0
+
+    rutas = Counter(r for (r,) in db.conn.execute("select route from companies"))
+    ciudades = Counter(c for (c,) in db.conn.execute("select city from companies"))
+    # Unas pocas rutas concentran la mayoría de los clientes; las ciudades tienen cola larga
+    assert sum(n for _, n in rutas.most_common(3)) / 2000 > 0.5
+    assert sum(1 for n in ciudades.values() if n <= 2) > 100
+
+
+def test_tenants_existentes():
+    insertadas, lotes = _generar(tenant_ids=["t-existente"], tenants=5)
+    assert {f["tenant_id"] for tabla, filas in lotes for f in filas if tabla != "invoice_items"} == {"t-existente"}
+    assert insertadas["companies"] == 300
@@ -0,0 +1,221 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+import httpx
+import pytest
+from cryptography.fernet import Fernet
+from unittest.mock import AsyncMock, MagicMock
+
+from db.sesiones import AlmacenSesiones, PoolSesiones
+from handlers import auth_handler
+from states import SELECTING_ACTION
+
+
+def _sesion(token, expira_en=3600):
+    return MagicMock(access_token=token, refresh_token=f"r-{token}", expires_at=int(time.time()) + expira_en)
+
+
+def _http(cabeceras):
+    async def responder(request):
+        await asyncio.sleep(0.01)
+        cabeceras.append(request.headers["Authorization"])
+        return httpx.Response(200, json=[])
+    return httpx.AsyncClient(transport=httpx.MockTransport(responder), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_consultas_concurrentes_con_su_propio_token():
+    cabeceras = []
+    pool = PoolSesiones(http_client=_http(cabeceras))
+    clientes = [pool.abrir(i, _sesion(f"jwt{i}")) for i in range(5)]
+
+    await asyncio.gather(*(c.table("users").select("*").execute() for c in clientes))
+
+    assert sorted(cabeceras) == [f"Bearer jwt{i}" for i in range(5)]
+    assert len({id(c.session) for c in clientes}) == 1
+
+
+def test_lru_expulsa_la_sesion_menos_usada():
+    pool = PoolSesiones(maximo=2, http_client=_http([]))
+    pool.abrir(1, _sesion("a"))
+    pool.abrir(2, _sesion("b"))
+    asyncio.run(pool.cliente(1))
+    pool.abrir(3, _sesion("c"))
+    assert 1 in pool and 3 in pool and 2 not in pool
+
+
+@pytest.mark.asyncio
+async def test_refresca_una_vez_antes_de_expirar():
+    refrescar = AsyncMock(return_value=_sesion("nuevo"))
+    pool = PoolSesiones(margen=60, refrescar=refrescar, http_client=_http([]))
+    pool.abrir(7, _sesion("viejo", expira_en=30))
+
+    clientes = await asyncio.gather(*(pool.cliente(7) for _ in range(5)))
+
+    refrescar.assert_awaited_once_with("r-viejo")
+    assert clientes[0].headers["Authorization"] == "Bearer nuevo"
+    assert all(c is clientes[0] for c in clientes)
+
+
+@pytest.mark.asyncio
+async def test_refresco_fallido_cierra_la_sesion():
+    pool = PoolSesiones(refrescar=AsyncMock(side_effect=Exception("refresh token revocado")), http_client=_http([]))
+    pool.abrir(7, _sesion("viejo", expira_en=10))
+    assert await pool.cliente(7) is None
+    assert 7 not in pool
+
+
+@pytest.mark.asyncio
+async def test_cliente_de_usa_la_sesion_o_el_respaldo():
+    pool = PoolSesiones(http_client=_http([]))
+    propio = pool.abrir(7, _sesion("jwt7"))
+    respaldo = object()
+    assert await pool.cliente_de(7, respaldo) is propio
+    assert await pool.cliente_de(8, respaldo) is respaldo
+
+
+@pytest.mark.asyncio
+async def test_cambio_de_contrasena_con_cliente_auth_propio(monkeypatch):
+    clientes = []
+
+    def nuevo():
+        auth = MagicMock()
+        auth.set_session = AsyncMock(return_value=MagicMock(user=MagicMock()))
+        auth.update_user = AsyncMock()
+        clientes.append(auth)
+        return auth
+    monkeypatch.setattr(auth_handler, "nuevo_cliente_auth", nuevo)
+    anon = MagicMock()
+    monkeypatch.setattr(auth_handler, "supabase_anon", anon)
+
+    for usuario in ("ana", "luis"):
+        update = MagicMock()
+        update.message.text = f"clave-{usuario}"
+        update.message.reply_text = AsyncMock()
+        context = MagicMock(user_data={"reset_access_token": f"tok-{usuario}", "reset_refresh_token": "r"})
+        await auth_handler.update_password_complete(update, context)
+
+    assert len(clientes) == 2
+    clientes[0].update_user.assert_awaited_once_with({"password": "clave-ana"})
+    clientes[1].set_session.assert_awaited_once_with("tok-luis", "r")
+    assert not anon.auth.set_session.called and not anon.auth.update_user.called
+
+
+@pytest.mark.asyncio
+async def test_login_no_toca_el_cliente_anon(monkeypatch):
+    pool = PoolSesiones(http_client=_http([]))
+    monkeypatch.setattr(auth_handler, "sesiones", pool)
+    auth = MagicMock()
+    auth.sign_in_with_password = AsyncMock(return_value=MagicMock(session=_sesion("jwt-ana")))
+    monkeypatch.setattr(auth_handler, "auth_usuarios", auth)
+    anon = MagicMock()
+    monkeypatch.setattr(auth_handler, "supabase_anon", anon)
+    admin = MagicMock()
+    admin.table.return_value.update.return_value.eq.return_value.execute = AsyncMock()
+    monkeypatch.setattr(auth_handler, "supabase_admin", admin)
+
+    respuesta = MagicMock(data={"tenant_id": "t1", "username": "ana"})
+    monkeypatch.setattr(pool, "_nuevo_cliente", lambda token: MagicMock(
+        table=MagicMock(return_value=MagicMock(**{
+            "select.return_value.eq.return_value.single.return_value.execute": AsyncMock(return_value=respuesta)
+        }))
+    ))
+
+    update = MagicMock()
+    update.effective_user.id = 42
+    update.message.text = "secreto"
+    update.message.reply_text = AsyncMock()
+    context = MagicMock(user_data={"login_email": "ana@example.com"})
+
+    assert await auth_handler.login_complete(update, context) == SELECTING_ACTION
+    assert context.user_data["tenant_id"] == "t1"
+    assert 42 in pool
+    assert not anon.postgrest.auth.called
+
+
+@pytest.mark.asyncio
+async def test_sesion_sobrevive_al_reinicio_sin_red(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "sesiones.sqlite3")
+    clave = Fernet.generate_key()
+    antes = PoolSesiones(http_client=_http([]), almacen=AlmacenSesiones(ruta, clave))
+    antes.abrir(42, _sesion("jwt-ana"))
+    antes.guardar(42, "t1", "auth-ana")
+    antes.almacen.cerrar()
+
+    # Proceso nuevo: pool vacío y cualquier llamada de red haría fallar el test
+    cabeceras = []
+    despues = PoolSesiones(refrescar=AsyncMock(side_effect=AssertionError), http_client=_http(cabeceras),
+                           almacen=AlmacenSesiones(ruta, clave))
+    monkeypatch.setattr(auth_handler, "sesiones", despues)
+    update = MagicMock()
+    update.effective_user.id = 42
+    context = MagicMock(user_data={})
+
+    await auth_handler.restaurar_sesion(update, context)
+    assert context.user_data["tenant_id"] == "t1"
+    cliente = await despues.cliente(42)
+    await cliente.table("products").select("*").execute()
+    assert cabeceras == ["Bearer jwt-ana"]
+
+
+@pytest.mark.asyncio
+async def test_jwt_caducado_se_refresca_y_se_persiste(tmp_path):
+    almacen = AlmacenSesiones(str(tmp_path / "s.sqlite3"), Fernet.generate_key())
+    almacen.guardar(7, "t1", "auth-7", "viejo", "r-viejo", int(time.time()) - 10)
+    pool = PoolSesiones(refrescar=AsyncMock(return_value=_sesion("nuevo")), http_client=_http([]), almacen=almacen)
+
+    cliente = await pool.cliente(7)
+    assert cliente.headers["Authorization"] == "Bearer nuevo"
+    assert almacen.leer(7)["refresh_token"] == "r-nuevo"
+
+
+def test_login_antiguo_o_cerrado_no_se_restaura(tmp_path):
+    almacen = AlmacenSesiones(str(tmp_path / "s.sqlite3"))
+    pool = PoolSesiones(http_client=_http([]), almacen=almacen, max_edad=3600)
+    almacen.guardar(1, "t1", "a1", "jwt", "r", int(time.time()) + 3600)
+    almacen._conexion().execute("update bot_sessions set created_at = created_at - 7200")
+    assert pool.restaurar(1) is None
+    assert almacen.leer(1) is None
+
+    pool.abrir(2, _sesion("jwt2"))
+    pool.guardar(2, "t1", "a2")
+    pool.cerrar(2)
+    assert pool.restaurar(2) is None
+
+
+def test_tokens_cifrados_y_fichero_privado(tmp_path):
+    ruta = str(tmp_path / "s.sqlite3")
+    cifrado = AlmacenSesiones(ruta, Fernet.generate_key())
+    cifrado.guardar(1, "t1", "a1", "jwt-secreto", "r-secreto", int(time.time()) + 3600)
+    assert os.stat(ruta).st_mode & 0o777 == 0o600
+    assert cifrado.leer(1)["access_token"] == "jwt-secreto"
+
+    # Sin clave solo queda el tenant: no hay token que restaurar
+    sin_clave = AlmacenSesiones(str(tmp_path / "p.sqlite3"), clave=None)
+    pool = PoolSesiones(http_client=_http([]), almacen=sin_clave)
+    sin_clave.guardar(2, "t2", "a2", "jwt-secreto", "r-secreto", int(time.time()) + 3600)
+    assert pool.restaurar(2) == {"tenant_id": "t2", "auth_user_id": "a2"}
+    assert 2 not in pool
+
+    for almacen in (cifrado, sin_clave):
+        almacen.cerrar()
+        volcado = "\n".join(sqlite3.connect(almacen.path).iterdump())
+        assert "secreto" not in volcado
+
+
+@pytest.mark.asyncio
+async def test_iniciar_sesion_pide_credenciales_sin_modo_desarrollo(monkeypatch):
+    from states import LOGIN_EMAIL, LOGIN_PASSWORD
+
+    monkeypatch.setattr(auth_handler, "LOGIN_DEV_BYPASS", False)
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+    context = MagicMock(user_data={})
+    assert await auth_handler.login_email(update, context) == LOGIN_EMAIL
+    assert "tenant_id" not in context.user_data
+
+    update.message.text = "ana@example.com"
+    assert await auth_handler.login_password(update, context) == LOGIN_PASSWORD
+    assert context.user_data["login_email"] == "ana@example.com"
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+from functools import partial
+
+import httpx
+import pytest
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+from unittest.mock import MagicMock
+
+import webhook_workers
+from webhook_workers import Reparto, clave_de_reparto, recibir_updates
+
+
+def _mensaje(update_id, chat_id, texto="hola"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": texto,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Ana"},
+        },
+    }
+
+
+def test_clave_de_reparto():
+    assert clave_de_reparto(_mensaje(1, 42)) == 42
+    assert clave_de_reparto({"update_id": 2, "callback_query": {
+        "id": "q", "from": {"id": 42}, "message": {"chat": {"id": -100}}, "chat_instance": "x"}}) == -100
+    assert clave_de_reparto({"update_id": 3, "inline_query": {"id": "i", "from": {"id": 42}, "query": ""}}) == 42
+    assert clave_de_reparto({"update_id": 4, "my_chat_member": {"chat": {"id": -5}, "from": {"id": 1}}}) == -5
+    assert webhook_workers.indice_worker(-5, 4) in range(4)
+
+
+@pytest.mark.asyncio
+async def test_frontal_reparte_por_chat_en_orden(tmp_path):
+    colas, servidores = [], []
+    for i in range(2):
+        application = MagicMock(bot=None, update_queue=asyncio.Queue())
+        colas.append(application.update_queue)
+        servidores.append(await asyncio.start_unix_server(
+            partial(recibir_updates, application=application), path=str(tmp_path / f"w{i}.sock")))
+
+    reparto = Reparto([str(tmp_path / f"w{i}.sock") for i in range(2)])
+    await reparto.conectar()
+    sock, puerto = bind_unused_port()
+    servidor = HTTPServer(webhook_workers.aplicacion_frontal(reparto, "secreto", "webhook"))
+    servidor.add_sockets([sock])
+
+    url = f"http://127.0.0.1:{puerto}/webhook"
+    cabeceras = {"X-Telegram-Bot-Api-Secret-Token": "secreto"}
+    try:
+        async with httpx.AsyncClient() as http:
+            prohibido = await http.post(url, content=json.dumps(_mensaje(1, 10)),
+                                        headers={"X-Telegram-Bot-Api-Secret-Token": "otro"})
+            assert prohibido.status_code == 403
+            assert (await http.post(url, content=b"no es json", headers=cabeceras)).status_code == 400
+
+            for i in range(20):
+                respuesta = await http.post(url, content=json.dumps(_mensaje(100 + i, 10 + i % 2, f"m{i}")),
+                                            headers=cabeceras)
+                assert respuesta.status_code == 200
+
+        recibidos = []
+        for cola in colas:
+            updates = [await asyncio.wait_for(cola.get(), 1) for _ in range(10)]
+            recibidos.append(updates)
+        # chat 10 -> worker 0, chat 11 -> worker 1, cada uno en su orden de llegada
+        assert {u.effective_chat.id for u in recibidos[0]} == {10}
+        assert {u.effective_chat.id for u in recibidos[1]} == {11}
+        assert [u.message.text for u in recibidos[0]] == [f"m{i}" for i in range(0, 20, 2)]
+        assert reparto.enviados == [10, 10]
+    finally:
+        servidor.stop()
+        await reparto.cerrar()
+        for s in servidores:
+            s.close()
+
+
+class ProcesoFalso:
+    """Proceso con sentinel de verdad (un pipe): termina al cerrar el extremo de escritura."""
+
+    def __init__(self):
+        self.sentinel, self._escritura = os.pipe()
+        self.exitcode = None
+
+    def terminar(self, codigo=1):
+        self.exitcode = codigo
+        os.close(self._escritura)
+
+    def join(self, timeout=None):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_supervisor_relanza_y_reconecta(tmp_path):
+    colas, servidores = [], []
+    for i in range(2):
+        application = MagicMock(bot=None, update_queue=asyncio.Queue())
+        colas.append(application.update_queue)
+        servidores.append(await asyncio.start_unix_server(
+            partial(recibir_updates, application=application), path=str(tmp_path / f"w{i}.sock")))
+    reparto = Reparto([str(tmp_path / f"w{i}.sock") for i in range(2)])
+    await reparto.conectar()
+    procesos = [ProcesoFalso(), ProcesoFalso()]
+    lanzados = []
+
+    def lanzar(indice):
+        lanzados.append(indice)
+        return ProcesoFalso()
+
+    supervisor = asyncio.create_task(webhook_workers.supervisar(procesos, lanzar, reparto, max_reinicios=2))
+    try:
+        caido = procesos[1]
+        caido.terminar()
+        while procesos[1] is caido or reparto._escritores[1] is None:
+            await asyncio.sleep(0.01)
+        assert lanzados == [1]
+        update = _mensaje(1, 11)
+        assert await reparto.enviar(update, json.dumps(update).encode()) == 1
+        assert (await asyncio.wait_for(colas[1].get(), 1)).effective_chat.id == 11
+
+        # Caídas en bucle: el supervisor se rinde y el servicio se detiene
+        procesos[0].terminar()
+        procesos[1].terminar()
+        await asyncio.wait_for(supervisor, 1)
+        assert len(lanzados) == 2
+    finally:
+        supervisor.cancel()
+        await reparto.cerrar()
+        for s in servidores:
+            s.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_desconectado_responde_error(tmp_path):
+    servidor = await asyncio.start_unix_server(
+        partial(recibir_updates, application=MagicMock(bot=None, update_queue=asyncio.Queue())),
+        path=str(tmp_path / "w0.sock"))
+    reparto = Reparto([str(tmp_path / "w0.sock")])
+    await reparto.conectar()
+    reparto.desconectar(0)
+    with pytest.raises(ConnectionError):
+        await reparto.enviar(_mensaje(1, 10), b"{}")
+    await reparto.cerrar()
+    servidor.close()
+
+
+def test_persistencia_por_worker():
+    from db.persistencia import ruta_por_worker
+
+    assert ruta_por_worker("persistencia.sqlite3", 2) == "persistencia-w2.sqlite3"
+    assert ruta_por_worker("/datos/estado", 0) == "/datos/estado-w0"
@@ -0,0 +1,80 @@
+# Agregaciones vectorizadas con NumPy para el informe /ranking.
+# Las funciones son de nivel de módulo y reciben/devuelven arrays o listas para poder
+# ejecutarse en un ProcessPoolExecutor (se serializan con pickle).
+
+import numpy as np
+
+
+def agrupar(claves, unidades, importes):
+    """Suma unidades e importes por clave. Devuelve (claves_únicas, unidades, importes) ordenado por clave."""
+    claves = np.asarray(claves)
+    if claves.size == 0:
+        return claves, np.zeros(0), np.zeros(0)
+    unicas, inversa = np.unique(claves, return_inverse=True)
+    return (
+        unicas,
+        np.bincount(inversa, weights=np.asarray(unidades, dtype=np.float64), minlength=unicas.size),
+        np.bincount(inversa, weights=np.asarray(importes, dtype=np.float64), minlength=unicas.size),
+    )
+
+
+def agregar_bloque(productos, clientes, cantidades, importes):
+    """Agrega un bloque columnar de líneas de venta por producto y por cliente."""
+    cantidades = np.asarray(cantidades, dtype=np.float64)
+    importes = np.asarray(importes, dtype=np.float64)
+    return agrupar(productos, cantidades, importes), agrupar(clientes, cantidades, importes)
+
+
+def combinar(*parciales):
+    """Une agregados parciales (claves, unidades, importes) en uno solo."""
+    parciales = [p for p in parciales if p is not None and p[0].size]
+    if not parciales:
+        return np.asarray([]), np.zeros(0), np.zeros(0)
+    return agrupar(
+        np.concatenate([p[0] for p in parciales]),
+        np.concatenate([p[1] for p in parciales]),
+        np.concatenate([p[2] for p in parciales]),
+    )
+
+
+def valores_de(claves_agregadas, valores, claves):
+    """Valor agregado de cada clave de `claves` (0 si no aparece); `claves_agregadas` va ordenado."""
+    claves_agregadas, claves = np.asarray(claves_agregadas), np.asarray(claves)
+    valores = np.asarray(valores, dtype=np.float64)
+    if claves_agregadas.size == 0 or claves.size == 0:
+        return np.zeros(claves.size)
+    posiciones = np.clip(np.searchsorted(claves_agregadas, claves), 0, claves_agregadas.size - 1)
+    return np.where(claves_agregadas[posiciones] == claves, valores[posiciones], 0.0)
+
+
+def top(claves, valores, n: int, ascendente: bool = False) -> list:
+    """[(clave, valor)] de los n mayores (o menores) valores, sin ordenar el array completo."""
+    valores = np.asarray(valores, dtype=np.float64)
+    if valores.size == 0 or n <= 0:
+        return []
+    claves_orden = -valores if not ascendente else valores
+    if n < valores.size:
+        indices = np.argpartition(claves_orden, n)[:n]
+    else:
+        indices = np.arange(valores.size)
+    # Desempate estable por clave para que el resultado sea determinista
+    indices = indices[np.lexsort((np.asarray(claves)[indices], claves_orden[indices]))]
+    return [(claves[i], float(valores[i])) for i in indices]
+
+
+def top_por_grupo(claves, valores, grupos, n: int) -> dict:
+    """{grupo: [(clave, valor)]} con las n claves de mayor valor de cada grupo."""
+    claves, grupos = np.asarray(claves), np.asarray(grupos)
+    valores = np.asarray(valores, dtype=np.float64)
+    if claves.size == 0:
+        return {}
+    nombres, codigos = np.unique(grupos, return_inverse=True)
+    orden = np.lexsort((claves, -valores, codigos))
+    codigos_orden = codigos[orden]
+    # Posición de cada fila dentro de su grupo: índice menos el inicio del grupo
+    inicios = np.flatnonzero(np.r_[True, codigos_orden[1:] != codigos_orden[:-1]])
+    posicion = np.arange(orden.size) - np.repeat(inicios, np.diff(np.r_[inicios, orden.size]))
+    resultado = {}
+    for i in orden[posicion < n]:
+        resultado.setdefault(str(nombres[codigos[i]]), []).append((claves[i], float(valores[i])))
+    return resultado
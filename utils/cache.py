@@ -0,0 +1,63 @@
+# Cachés en memoria reutilizables por los handlers (TTL + expulsión por tamaño).
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Caché acotada con caducidad por entrada y expulsión LRU al superar `maxsize`.
+
+    Con `ttl=None` las entradas no caducan y se comporta como una LRU pura.
+    Es segura entre hilos, así que puede usarse también desde `asyncio.to_thread`.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expira, valor = item
+            if expira is not None and expira < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return valor
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            expira = None if self.ttl is None else time.monotonic() + self.ttl
+            self._data[key] = (expira, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Contadores de aciertos/fallos y ocupación, para logs y métricas."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,132 @@
+# Instrumentación de la Application para el endpoint /metrics (formato Prometheus).
+# Mide la latencia de cada callback según el estado de la conversación en que se atiende,
+# expone la profundidad de las colas (updates y envíos) y la saturación del ejecutor de
+# hilos que usa asyncio.to_thread. La latencia de Supabase se mide en db/conexion.py y la
+# de la API de Telegram en utils/limitador.py.
+
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram.ext import ConversationHandler
+
+import states
+from utils.limitador import LimitadorEnvios
+from utils.metricas import registro
+from utils.procesador import ProcesadorPorChat
+
+logger = logging.getLogger(__name__)
+
+latencia_handlers = registro.histograma(
+    "crm_handler_seconds", "Duración de cada callback por estado de conversación", ("estado", "callback"))
+errores_handlers = registro.contador(
+    "crm_handler_errors_total", "Callbacks que terminaron con excepción", ("estado", "callback"))
+
+NOMBRES_ESTADOS = {v: k for k, v in vars(states).items() if k.isupper() and isinstance(v, int)}
+
+
+class EjecutorMedido(ThreadPoolExecutor):
+    """ThreadPoolExecutor que cuenta las tareas en cola y en ejecución (ejecutor de to_thread)."""
+
+    def __init__(self, max_workers: int | None = None, **kwargs):
+        super().__init__(max_workers, **kwargs)
+        self.maximo = self._max_workers
+        self.en_cola = 0
+        self.ocupados = 0
+        self._lock_cuentas = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._lock_cuentas:
+            self.en_cola += 1
+
+        def medido():
+            with self._lock_cuentas:
+                self.en_cola -= 1
+                self.ocupados += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock_cuentas:
+                    self.ocupados -= 1
+
+        return super().submit(medido)
+
+
+def _medir(callback, estado: str):
+    nombre = f"{callback.__module__.rsplit('.', 1)[-1]}.{getattr(callback, '__qualname__', repr(callback))}"
+
+    @functools.wraps(callback)
+    async def medido(update, context):
+        inicio = time.monotonic()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errores_handlers.con(estado, nombre).inc()
+            raise
+        finally:
+            latencia_handlers.con(estado, nombre).observar(time.monotonic() - inicio)
+
+    medido.medido = True
+    return medido
+
+
+def _envolver(handler, estado: str) -> None:
+    if isinstance(handler, ConversationHandler):
+        for h in handler.entry_points:
+            _envolver(h, "entrada")
+        for clave, lista in handler.states.items():
+            for h in lista:
+                _envolver(h, NOMBRES_ESTADOS.get(clave, str(clave)))
+        for h in handler.fallbacks:
+            _envolver(h, "fallback")
+    elif not getattr(handler.callback, "medido", False):
+        handler.callback = _medir(handler.callback, estado)
+
+
+def instrumentar_handlers(application) -> None:
+    """Envuelve los callbacks registrados para medir su duración. Llamar tras añadir los handlers."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _envolver(handler, "-")
+
+
+def registrar_medidores(application, ejecutor: EjecutorMedido | None = None) -> None:
+    """Valores instantáneos de la Application que se leen en cada scrape."""
+    registro.medidor("crm_update_queue_depth", "Updates recibidos aún no despachados",
+                     lambda: application.update_queue.qsize())
+    procesador = application.update_processor
+    if isinstance(procesador, ProcesadorPorChat):
+        registro.medidor("crm_updates", "Updates en espera de su cerrojo o en ejecución",
+                         lambda: {"en_espera": procesador.en_espera, "en_curso": procesador.en_curso},
+                         etiqueta="estado")
+    limitador = application.bot.rate_limiter
+    if isinstance(limitador, LimitadorEnvios):
+        registro.medidor("crm_telegram_send_queue_depth", "Envíos esperando turno en el limitador",
+                         lambda: limitador.en_cola)
+    if ejecutor is not None:
+        registro.medidor("crm_to_thread_executor", "Tareas del ejecutor de asyncio.to_thread",
+                         lambda: {"en_cola": ejecutor.en_cola, "ocupados": ejecutor.ocupados,
+                                  "maximo": ejecutor.maximo},
+                         etiqueta="estado")
+
+
+class ManejadorMetricas(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(registro.exportar())
+
+
+def aplicacion_metricas() -> tornado.web.Application:
+    return tornado.web.Application([(r"/metrics", ManejadorMetricas)])
+
+
+def iniciar_servidor_metricas(puerto: int, direccion: str = "0.0.0.0") -> HTTPServer:
+    """Sirve /metrics en el event loop actual."""
+    servidor = HTTPServer(aplicacion_metricas())
+    servidor.listen(puerto, direccion)
+    logger.info(f"Métricas disponibles en http://{direccion}:{puerto}/metrics")
+    return servidor
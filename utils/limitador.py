@@ -0,0 +1,205 @@
+# Planificador de envíos a la API de Telegram (BaseRateLimiter de la Application).
+# Aplica dos cubos de tokens a cada mensaje: uno global (~30 msg/s por bot) y otro por chat
+# (~1 msg/s en privados, 20 msg/min en grupos). Cuando hay cola para el cubo global, las
+# respuestas interactivas salen antes que los envíos masivos, y un RetryAfter de Telegram
+# no hace fallar el envío: se pausa el chat (y el cubo global) y se vuelve a poner en cola.
+#
+# Los envíos masivos se marcan al llamar a la API:
+#     await bot.send_message(chat_id, texto, rate_limit_args=MASIVO)
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import warnings
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from telegram.warnings import PTBDeprecationWarning
+
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE
+from utils.metricas import Histograma, registro
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVO = 0
+MASIVO = 1
+MAX_CUBOS_CHAT = 10000  # a partir de aquí se purgan los cubos de chats inactivos
+
+latencia_telegram = registro.histograma(
+    "crm_telegram_api_seconds", "Latencia de las llamadas a la API de Telegram (sin la espera en cola)", ("metodo",))
+errores_telegram = registro.contador(
+    "crm_telegram_api_errors_total", "Llamadas a la API de Telegram fallidas", ("metodo", "error"))
+
+
+async def _llamar(callback, args, kwargs, endpoint: str):
+    inicio = time.monotonic()
+    try:
+        return await callback(*args, **kwargs)
+    except Exception as e:
+        errores_telegram.con(endpoint, type(e).__name__).inc()
+        raise
+    finally:
+        latencia_telegram.con(endpoint).observar(time.monotonic() - inicio)
+
+
+class CuboTokens:
+    """Cubo de tokens: `tasa` tokens por segundo hasta un máximo de `capacidad`."""
+
+    def __init__(self, tasa: float, capacidad: float):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tokens = capacidad
+        self.ultimo = time.monotonic()
+        self.pausa_hasta = 0.0
+
+    def _rellenar(self, ahora: float) -> None:
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def espera(self, ahora: float | None = None) -> float:
+        """Segundos hasta que haya un token disponible (0 si ya lo hay)."""
+        ahora = time.monotonic() if ahora is None else ahora
+        self._rellenar(ahora)
+        falta = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.tasa
+        return max(falta, self.pausa_hasta - ahora)
+
+    def consumir(self) -> None:
+        self.tokens -= 1
+
+    def pausar(self, segundos: float) -> None:
+        self.pausa_hasta = max(self.pausa_hasta, time.monotonic() + segundos)
+
+    def lleno(self, ahora: float) -> bool:
+        self._rellenar(ahora)
+        return self.tokens >= self.capacidad and self.pausa_hasta <= ahora
+
+
+def _segundos_retry_after(exc: RetryAfter) -> float:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", PTBDeprecationWarning)
+        valor = exc.retry_after
+    return valor.total_seconds() if isinstance(valor, timedelta) else float(valor)
+
+
+class LimitadorEnvios(BaseRateLimiter):
+    """Cubos de tokens global y por chat con cola de prioridad y reintento tras RetryAfter.
+
+    `rate_limit_args` admite INTERACTIVO (por defecto) o MASIVO.
+    """
+
+    def __init__(self, tasa_global: float = TELEGRAM_GLOBAL_RATE, tasa_chat: float = TELEGRAM_CHAT_RATE,
+                 rafaga_chat: float = TELEGRAM_CHAT_BURST, tasa_grupo: float = TELEGRAM_GROUP_RATE,
+                 max_reintentos: int = 5):
+        self.global_ = CuboTokens(tasa_global, max(1.0, tasa_global))
+        self.tasa_chat = tasa_chat
+        self.rafaga_chat = rafaga_chat
+        self.tasa_grupo = tasa_grupo
+        self.max_reintentos = max_reintentos
+        self._chats: dict = {}        # chat_id -> (CuboTokens, Lock)
+        self._cola: list = []         # heap (prioridad, orden, future) de turnos del cubo global
+        self._orden = itertools.count()
+        self._hay_turnos = asyncio.Event()
+        self._despachador: asyncio.Task | None = None
+        # Métricas
+        self.enviados = {INTERACTIVO: 0, MASIVO: 0}
+        self.reintentos = 0
+        self.espera = {INTERACTIVO: Histograma(), MASIVO: Histograma()}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._despachador is not None:
+            self._despachador.cancel()
+            self._despachador = None
+        for _, _, futuro in self._cola:
+            futuro.cancel()
+        self._cola.clear()
+
+    @property
+    def en_cola(self) -> int:
+        return len(self._cola)
+
+    # --- Cubos por chat ---
+    def _chat(self, chat_id):
+        entrada = self._chats.get(chat_id)
+        if entrada is None:
+            if len(self._chats) >= MAX_CUBOS_CHAT:
+                self._purgar_chats()
+            # chat_id negativo (o @canal): grupos y canales tienen un límite por minuto
+            grupo = isinstance(chat_id, str) or chat_id < 0
+            cubo = CuboTokens(self.tasa_grupo, 1.0) if grupo else CuboTokens(self.tasa_chat, self.rafaga_chat)
+            entrada = self._chats[chat_id] = (cubo, asyncio.Lock())
+        return entrada
+
+    def _purgar_chats(self) -> None:
+        ahora = time.monotonic()
+        for chat_id, (cubo, cerrojo) in list(self._chats.items()):
+            if not cerrojo.locked() and cubo.lleno(ahora):
+                del self._chats[chat_id]
+
+    # --- Cubo global con prioridad ---
+    async def _turno_global(self, prioridad: int) -> None:
+        futuro = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._cola, (prioridad, next(self._orden), futuro))
+        self._hay_turnos.set()
+        if self._despachador is None or self._despachador.done():
+            self._despachador = asyncio.create_task(self._despachar())
+        await futuro
+
+    async def _despachar(self) -> None:
+        """Reparte los tokens del cubo global: siempre al turno de más prioridad en cola."""
+        while True:
+            if not self._cola:
+                self._hay_turnos.clear()
+                await self._hay_turnos.wait()
+                continue
+            espera = self.global_.espera()
+            if espera > 0:
+                await asyncio.sleep(espera)
+                continue
+            _, _, futuro = heapq.heappop(self._cola)
+            if futuro.done():  # el envío se canceló mientras esperaba
+                continue
+            self.global_.consumir()
+            futuro.set_result(None)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # answerCallbackQuery, answerInlineQuery, getMe...: fuera de los límites de mensajes
+            return await _llamar(callback, args, kwargs, endpoint)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        prioridad = MASIVO if rate_limit_args == MASIVO else INTERACTIVO
+        cubo, cerrojo = self._chat(chat_id)
+        inicio = time.monotonic()
+
+        # El cerrojo del chat mantiene el orden de sus mensajes, también durante un RetryAfter
+        async with cerrojo:
+            for intento in range(self.max_reintentos + 1):
+                while (espera := cubo.espera()) > 0:
+                    await asyncio.sleep(espera)
+                cubo.consumir()
+                await self._turno_global(prioridad)
+                if intento == 0:
+                    self.espera[prioridad].observar(time.monotonic() - inicio)
+                try:
+                    resultado = await _llamar(callback, args, kwargs, endpoint)
+                    self.enviados[prioridad] += 1
+                    return resultado
+                except RetryAfter as exc:
+                    if intento == self.max_reintentos:
+                        logger.error(f"RetryAfter en el chat {chat_id} tras {intento} reintentos; se descarta el envío")
+                        raise
+                    segundos = _segundos_retry_after(exc) + 0.1
+                    self.reintentos += 1
+                    logger.info(f"Flood wait de {segundos:.1f} s en {endpoint} (chat {chat_id}); se reprograma")
+                    # Telegram no dice si el límite era del chat o del bot: se pausan ambos
+                    cubo.pausar(segundos)
+                    self.global_.pausar(segundos)
@@ -0,0 +1,144 @@
+# Métricas en memoria del bot (contadores y latencias por buckets) y su exportación
+# en el formato de texto de Prometheus (ver utils/instrumentacion.py para el endpoint /metrics).
+
+import bisect
+import threading
+
+# Buckets en segundos, de 1 ms a 10 s
+BUCKETS_LATENCIA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histograma:
+    """Histograma acumulado por buckets fijos; segura entre hilos."""
+
+    def __init__(self, buckets=BUCKETS_LATENCIA):
+        self.buckets = tuple(buckets)
+        self.cuentas = [0] * (len(self.buckets) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float) -> None:
+        with self._lock:
+            self.cuentas[bisect.bisect_left(self.buckets, valor)] += 1
+            self.suma += valor
+            self.total += 1
+
+    def percentil(self, p: float) -> float:
+        """Límite superior del bucket donde cae el percentil p (0-100); 0 si no hay datos."""
+        with self._lock:
+            if not self.total:
+                return 0.0
+            objetivo = self.total * p / 100
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets + (float("inf"),), self.cuentas):
+                acumulado += cuenta
+                if acumulado >= objetivo:
+                    return limite
+            return float("inf")
+
+
+class Contador:
+    """Contador monótono; seguro entre hilos."""
+
+    def __init__(self):
+        self.valor = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, cantidad: float = 1) -> None:
+        with self._lock:
+            self.valor += cantidad
+
+
+class Familia:
+    """Métrica con etiquetas: un Contador o Histograma por combinación de valores."""
+
+    def __init__(self, nombre: str, ayuda: str, tipo: str, etiquetas=(), fabrica=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.tipo = tipo
+        self.etiquetas = tuple(etiquetas)
+        self._fabrica = fabrica
+        self._hijos: dict = {}
+        self._lock = threading.Lock()
+
+    def con(self, *valores):
+        valores = tuple(str(v) for v in valores)
+        hijo = self._hijos.get(valores)
+        if hijo is None:
+            with self._lock:
+                hijo = self._hijos.setdefault(valores, self._fabrica())
+        return hijo
+
+    def muestras(self):
+        """[(etiquetas, métrica)] ordenadas para una salida estable."""
+        with self._lock:
+            return sorted(self._hijos.items())
+
+
+def _etiquetas(nombres, valores, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+class Registro:
+    """Métricas del proceso en formato de exposición de texto de Prometheus."""
+
+    def __init__(self):
+        self._familias: dict = {}
+        self._medidores: dict = {}  # nombre -> (ayuda, etiqueta, función)
+
+    def contador(self, nombre: str, ayuda: str, etiquetas=()) -> Familia:
+        return self._familias.setdefault(nombre, Familia(nombre, ayuda, "counter", etiquetas, Contador))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas=(), buckets=BUCKETS_LATENCIA) -> Familia:
+        return self._familias.setdefault(
+            nombre, Familia(nombre, ayuda, "histogram", etiquetas, lambda: Histograma(buckets)))
+
+    def medidor(self, nombre: str, ayuda: str, funcion, etiqueta: str | None = None) -> None:
+        """Valor instantáneo leído al exportar. Con `etiqueta`, `funcion` devuelve {valor_etiqueta: número}."""
+        self._medidores[nombre] = (ayuda, etiqueta, funcion)
+
+    def exportar(self) -> str:
+        lineas = []
+        for familia in self._familias.values():
+            lineas += [f"# HELP {familia.nombre} {familia.ayuda}", f"# TYPE {familia.nombre} {familia.tipo}"]
+            for valores, metrica in familia.muestras():
+                if familia.tipo == "counter":
+                    lineas.append(f"{familia.nombre}{_etiquetas(familia.etiquetas, valores)} {_numero(metrica.valor)}")
+                    continue
+                with metrica._lock:
+                    cuentas, suma, total = list(metrica.cuentas), metrica.suma, metrica.total
+                acumulado = 0
+                for limite, cuenta in zip(metrica.buckets + (float("inf"),), cuentas):
+                    acumulado += cuenta
+                    le = _etiquetas(familia.etiquetas, valores, f'le="{_numero(limite)}"')
+                    lineas.append(f"{familia.nombre}_bucket{le} {acumulado}")
+                sufijo = _etiquetas(familia.etiquetas, valores)
+                lineas += [f"{familia.nombre}_sum{sufijo} {_numero(suma)}", f"{familia.nombre}_count{sufijo} {total}"]
+        for nombre, (ayuda, etiqueta, funcion) in self._medidores.items():
+            try:
+                valor = funcion()
+            except Exception:
+                continue  # p. ej. la Application aún no existe
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+            if etiqueta:
+                lineas += [f"{nombre}{_etiquetas((etiqueta,), (str(k),))} {_numero(v)}" for k, v in sorted(valor.items())]
+            else:
+                lineas.append(f"{nombre} {_numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
@@ -0,0 +1,107 @@
+# Procesado concurrente de updates con orden garantizado por chat y por usuario.
+# La Application atiende hasta `concurrencia` updates a la vez; los de un mismo chat (o de
+# un mismo usuario) esperan a que termine el anterior, así que ConversationHandler y
+# user_data ven los mensajes de cada conversación en el orden en que llegaron.
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from utils.metricas import Histograma
+
+
+class ProcesadorPorChat(BaseUpdateProcessor):
+    """BaseUpdateProcessor con cerrojo por chat/usuario y límite de updates en ejecución.
+
+    El semáforo de BaseUpdateProcessor se toma antes de do_process_update, es decir, también
+    cuenta los updates que esperan su cerrojo: se usa solo como tope de updates pendientes
+    (`max_pendientes`). El límite real de ejecución es `concurrencia`, y se aplica después
+    del cerrojo para que un chat con muchos mensajes en cola no ocupe todos los huecos.
+    """
+
+    def __init__(self, concurrencia: int, max_pendientes: int | None = None):
+        super().__init__(max_pendientes or concurrencia * 64)
+        self.concurrencia = concurrencia
+        self._ejecucion = asyncio.BoundedSemaphore(concurrencia)
+        # clave -> [Lock, nº de updates que lo usan]; se borra al quedar sin uso
+        self._cerrojos: dict = {}
+        # Métricas
+        self.en_espera = 0
+        self.en_curso = 0
+        self.procesados = 0
+        self.espera_cerrojo = Histograma()
+        self.espera_total = Histograma()
+
+    @staticmethod
+    def claves(update: object) -> list:
+        """Cerrojos que necesita el update, en orden fijo para no provocar interbloqueos."""
+        if not isinstance(update, Update):
+            return []
+        claves = set()
+        if update.effective_chat:
+            claves.add(("chat", update.effective_chat.id))
+        if update.effective_user:
+            claves.add(("user", update.effective_user.id))
+        return sorted(claves)
+
+    @asynccontextmanager
+    async def _bloquear(self, claves: list):
+        entradas = []
+        for clave in claves:
+            entrada = self._cerrojos.setdefault(clave, [asyncio.Lock(), 0])
+            entrada[1] += 1
+            entradas.append((clave, entrada))
+        adquiridos = []
+        try:
+            for _, (cerrojo, _) in entradas:
+                await cerrojo.acquire()
+                adquiridos.append(cerrojo)
+            yield
+        finally:
+            for cerrojo in adquiridos:
+                cerrojo.release()
+            for clave, entrada in entradas:
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    del self._cerrojos[clave]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        inicio = time.monotonic()
+        self.en_espera += 1
+        esperando = True
+        try:
+            async with self._bloquear(self.claves(update)):
+                self.espera_cerrojo.observar(time.monotonic() - inicio)
+                async with self._ejecucion:
+                    self.espera_total.observar(time.monotonic() - inicio)
+                    self.en_espera -= 1
+                    esperando = False
+                    self.en_curso += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.en_curso -= 1
+                        self.procesados += 1
+        finally:
+            if esperando:
+                # Cancelado antes de ejecutarse (p. ej. al parar la Application)
+                self.en_espera -= 1
+                coroutine.close()
+
+    def resumen(self) -> dict:
+        return {
+            "en_espera": self.en_espera,
+            "en_curso": self.en_curso,
+            "procesados": self.procesados,
+            "cerrojos": len(self._cerrojos),
+            "espera_cerrojo_p95": self.espera_cerrojo.percentil(95),
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
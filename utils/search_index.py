@@ -0,0 +1,101 @@
+# Índice de búsqueda en memoria por trigramas, tolerante a erratas (similar a pg_trgm).
+
+import unicodedata
+from collections import Counter
+
+
+def normalizar(texto) -> str:
+    """Minúsculas y sin tildes, para que 'Logroño' y 'logrono' coincidan."""
+    texto = unicodedata.normalize("NFKD", str(texto or "")).lower()
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def trigramas(texto) -> set:
+    """Trigramas de cada palabra con el mismo relleno que pg_trgm ('  pa', 'pal', 'la ')."""
+    resultado = set()
+    for palabra in normalizar(texto).split():
+        palabra = f"  {palabra} "
+        resultado.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return resultado
+
+
+class TrigramIndex:
+    """Índice invertido trigrama -> ids, con altas, bajas y modificaciones incrementales.
+
+    Cada documento es un dict con los campos a indexar; se guarda tal cual para poder
+    mostrar los resultados sin volver a consultar la base de datos.
+    """
+
+    def __init__(self, campos):
+        self.campos = tuple(campos)
+        self._docs = {}
+        self._trigramas_doc = {}
+        self._palabras_doc = {}
+        self._postings = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def get(self, doc_id):
+        return self._docs.get(doc_id)
+
+    def add(self, doc_id, doc: dict) -> None:
+        """Indexa (o reindexa) un documento."""
+        self.remove(doc_id)
+        texto = " ".join(str(doc.get(c) or "") for c in self.campos)
+        tris = trigramas(texto)
+        self._docs[doc_id] = {c: doc.get(c) for c in self.campos}
+        self._trigramas_doc[doc_id] = tris
+        self._palabras_doc[doc_id] = normalizar(texto).split()
+        for t in tris:
+            self._postings.setdefault(t, set()).add(doc_id)
+
+    def update(self, doc_id, cambios: dict) -> None:
+        """Aplica cambios parciales a un documento ya indexado."""
+        doc = self._docs.get(doc_id)
+        if doc is not None:
+            self.add(doc_id, {**doc, **cambios})
+
+    def remove(self, doc_id) -> None:
+        for t in self._trigramas_doc.pop(doc_id, ()):
+            ids = self._postings.get(t)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._postings[t]
+        self._docs.pop(doc_id, None)
+        self._palabras_doc.pop(doc_id, None)
+
+    def search(self, texto: str, limite: int = 10, umbral: float = 0.3) -> list:
+        """Devuelve [(doc_id, doc, puntuación)] ordenado de mejor a peor.
+
+        La puntuación es la fracción de trigramas de la consulta presentes en el documento;
+        las coincidencias por prefijo de palabra se ordenan antes a igual puntuación.
+        """
+        consulta = trigramas(texto)
+        if not consulta:
+            return []
+        minimo = umbral * len(consulta)
+        # Se recorren los trigramas de menos a más frecuente. Cuando los que quedan ya no
+        # bastan para alcanzar el mínimo, un documento nuevo no puede calificar y solo se
+        # suman coincidencias a los candidatos existentes (evita recorrer listas enormes).
+        ordenados = sorted(consulta, key=lambda t: len(self._postings.get(t, ())))
+        comunes = Counter()
+        for i, t in enumerate(ordenados):
+            ids = self._postings.get(t, ())
+            if len(ordenados) - i >= minimo:
+                comunes.update(ids)
+            elif len(ids) < len(comunes):
+                comunes.update(d for d in ids if d in comunes)
+            else:
+                comunes.update(d for d in comunes if d in ids)
+
+        # Solo los mejores candidatos por nº de trigramas pasan al desempate por prefijo
+        candidatos = [(n, doc_id) for doc_id, n in comunes.most_common(limite * 5) if n >= minimo]
+        prefijos = normalizar(texto).split()
+        resultados = []
+        for n, doc_id in candidatos:
+            prefijo = all(any(p.startswith(q) for p in self._palabras_doc[doc_id]) for q in prefijos)
+            resultados.append((prefijo, n / len(consulta), doc_id))
+        resultados.sort(key=lambda r: (r[0], r[1]), reverse=True)
+        return [(doc_id, self._docs[doc_id], puntuacion) for _, puntuacion, doc_id in resultados[:limite]]
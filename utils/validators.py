@@ -1 +1,56 @@
 # Funciones de validación (email, teléfono, campos obligatorios, etc.)
+
+# Campos del alta de cliente, en el orden del diálogo: etiqueta -> columna de companies
+CAMPOS_CLIENTE = {
+    "nombre": "client_name",
+    "ciudad": "city",
+    "ruta": "route",
+    "categoría": "category",
+    "contacto": "contact_person",
+    "teléfono": "phone",
+    "dirección": "address",
+}
+
+# Mensaje cuando un campo obligatorio llega vacío
+_MENSAJES_VACIO = {
+    "nombre": "El nombre no puede estar vacío.",
+    "ciudad": "La ciudad no puede estar vacía.",
+    "ruta": "La ruta no puede estar vacía.",
+    "categoría": "La categoría no puede estar vacía.",
+    "contacto": "El contacto no puede estar vacío.",
+    "dirección": "La dirección no puede estar vacía.",
+}
+
+
+def validar_dato_cliente(campo: str, valor) -> str:
+    """Valida un dato del alta de cliente. Devuelve el mensaje de error o None si es válido."""
+    valor = str(valor or "").strip()
+    if campo == "teléfono":
+        return None if valor.isdigit() else "El teléfono debe ser numérico."
+    if campo in _MENSAJES_VACIO and not valor:
+        return _MENSAJES_VACIO[campo]
+    return None
+
+
+def validar_fila_cliente(fila: dict):
+    """Valida una fila importada (claves = etiqueta o columna) con las reglas del diálogo.
+
+    Devuelve (cliente, errores): el dict listo para insertar en companies y la lista de
+    mensajes de error; si hay errores el cliente no debe insertarse.
+    """
+    por_columna = {columna: etiqueta for etiqueta, columna in CAMPOS_CLIENTE.items()}
+    normalizada = {}
+    for clave, valor in fila.items():
+        clave = str(clave or "").strip().lower()
+        etiqueta = clave if clave in CAMPOS_CLIENTE else por_columna.get(clave)
+        if etiqueta:
+            normalizada[etiqueta] = "" if valor is None else str(valor).strip()
+
+    cliente, errores = {}, []
+    for etiqueta, columna in CAMPOS_CLIENTE.items():
+        valor = normalizada.get(etiqueta, "")
+        error = validar_dato_cliente(etiqueta, valor)
+        if error:
+            errores.append(error)
+        cliente[columna] = valor
+    return cliente, errores
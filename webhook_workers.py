@@ -0,0 +1,310 @@
+# Modo multi-proceso del webhook: `python bot.py --workers N`.
+# Un proceso frontal (tornado) recibe los POST de Telegram, valida WEBHOOK_SECRET_TOKEN y
+# reparte cada update por hash del chat_id a uno de N procesos worker a través de sockets
+# Unix locales. Todos los updates de un chat van siempre al mismo worker y por la misma
+# conexión, en orden, así que el estado en memoria de ConversationHandler sigue siendo
+# válido y el trabajo de CPU (Markdown, JSON de teclados, TLS) se reparte entre núcleos.
+#
+# El frontal vigila los workers: si uno termina, lo relanza en el mismo socket y vuelve a
+# conectar (mientras tanto sus updates responden 503 y Telegram los reintenta). Si se caen
+# más de MAX_REINICIOS veces en VENTANA_REINICIOS segundos, se detiene todo el servicio.
+#
+# Ficheros locales con varios workers:
+#   - persistencia.sqlite3: sin STATE_STORE_URL cada worker usa el suyo (persistencia-w<i>),
+#     válido porque un chat siempre cae en el mismo worker; al cambiar --workers se reparten
+#     de otra forma y las conversaciones a medias empiezan de cero. Con Redis no se usa.
+#   - sesiones.sqlite3 y difusiones.sqlite3: compartidos a propósito. Cada escritura es una
+#     fila por clave primaria (SQLite en WAL serializa los procesos) y las difusiones se
+#     reparten entre workers con un lease sobre ese mismo fichero.
+
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import struct
+import tempfile
+import time
+from collections import deque
+from functools import partial
+
+import tornado.web
+from telegram import Bot, Update
+
+logger = logging.getLogger(__name__)
+
+# Cada update viaja como una trama: longitud (4 bytes, big-endian) + JSON tal cual llegó
+CABECERA = struct.Struct("!I")
+CABECERA_SECRETO = "X-Telegram-Bot-Api-Secret-Token"
+MAX_REINICIOS = 5
+VENTANA_REINICIOS = 60.0
+
+
+def clave_de_reparto(update: dict) -> int:
+    """chat_id del update (o id del usuario si no tiene chat, p. ej. inline queries)."""
+    for valor in update.values():
+        if not isinstance(valor, dict):
+            continue
+        chat = valor.get("chat") or (valor.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        usuario = valor.get("from") or valor.get("user")
+        if usuario:
+            return usuario["id"]
+    return update.get("update_id", 0)
+
+
+def indice_worker(clave: int, workers: int) -> int:
+    # En un chat privado chat_id == user_id: sus inline queries caen en el mismo worker
+    return clave % workers
+
+
+def trama(datos: bytes) -> bytes:
+    return CABECERA.pack(len(datos)) + datos
+
+
+async def leer_trama(reader: asyncio.StreamReader) -> bytes | None:
+    try:
+        cabecera = await reader.readexactly(CABECERA.size)
+        return await reader.readexactly(CABECERA.unpack(cabecera)[0])
+    except asyncio.IncompleteReadError:
+        return None
+
+
+# === Proceso frontal ===
+
+class Reparto:
+    """Conexiones del proceso frontal con los workers, una por worker."""
+
+    def __init__(self, rutas: list[str]):
+        self.rutas = rutas
+        self._escritores: list[asyncio.StreamWriter | None] = []
+        self.enviados = [0] * len(rutas)
+
+    @staticmethod
+    async def _abrir(ruta: str, intentos: int, espera: float) -> asyncio.StreamWriter:
+        for intento in range(intentos):
+            try:
+                _, escritor = await asyncio.open_unix_connection(ruta)
+                return escritor
+            except (FileNotFoundError, ConnectionRefusedError):
+                if intento == intentos - 1:
+                    raise
+                await asyncio.sleep(espera)
+
+    async def conectar(self, intentos: int = 100, espera: float = 0.1) -> None:
+        """Conecta con cada worker, esperando a que haya abierto su socket."""
+        for ruta in self.rutas:
+            self._escritores.append(await self._abrir(ruta, intentos, espera))
+
+    def desconectar(self, indice: int) -> None:
+        """Deja el worker sin conexión: sus updates fallan hasta reconectar."""
+        escritor, self._escritores[indice] = self._escritores[indice], None
+        if escritor is not None:
+            escritor.close()
+
+    async def reconectar(self, indice: int, intentos: int = 100, espera: float = 0.1) -> None:
+        self.desconectar(indice)
+        self._escritores[indice] = await self._abrir(self.rutas[indice], intentos, espera)
+
+    async def enviar(self, update: dict, datos: bytes) -> int:
+        indice = indice_worker(clave_de_reparto(update), len(self._escritores))
+        escritor = self._escritores[indice]
+        if escritor is None or escritor.is_closing():
+            raise ConnectionError(f"el worker {indice} no está disponible")
+        escritor.write(trama(datos))
+        # drain() aplica contrapresión si el worker va atrasado
+        await escritor.drain()
+        self.enviados[indice] += 1
+        return indice
+
+    async def cerrar(self) -> None:
+        escritores = [e for e in self._escritores if e is not None]
+        for escritor in escritores:
+            escritor.close()
+        await asyncio.gather(*(e.wait_closed() for e in escritores), return_exceptions=True)
+        self._escritores = []
+
+
+class ManejadorWebhook(tornado.web.RequestHandler):
+    """POST de Telegram: valida el secreto y pasa el cuerpo sin tocar al worker del chat."""
+
+    def initialize(self, reparto: Reparto, secret_token: str | None):
+        self.reparto = reparto
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token:
+            recibido = self.request.headers.get(CABECERA_SECRETO, "")
+            if not hmac.compare_digest(recibido, self.secret_token):
+                self.set_status(403)
+                return
+        try:
+            update = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+        try:
+            await self.reparto.enviar(update, self.request.body)
+        except (ConnectionError, OSError) as e:
+            # Telegram reintenta el update si no recibe un 200
+            logger.error(f"No se pudo entregar el update {update.get('update_id')} a su worker: {e}")
+            self.set_status(503)
+            return
+        self.set_status(200)
+
+
+def aplicacion_frontal(reparto: Reparto, secret_token: str | None, url_path: str) -> tornado.web.Application:
+    return tornado.web.Application([
+        (rf"/{url_path}/?", ManejadorWebhook, {"reparto": reparto, "secret_token": secret_token}),
+    ])
+
+
+async def _esperar_senal() -> None:
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(senal, parar.set)
+    await parar.wait()
+
+
+async def _esperar_fin(proceso) -> None:
+    """Espera sin bloquear el event loop a que termine el proceso (su sentinel pasa a legible)."""
+    loop = asyncio.get_running_loop()
+    fin = loop.create_future()
+    loop.add_reader(proceso.sentinel, lambda: fin.done() or fin.set_result(None))
+    try:
+        await fin
+    finally:
+        loop.remove_reader(proceso.sentinel)
+
+
+async def supervisar(procesos: list, lanzar, reparto: Reparto, max_reinicios: int = MAX_REINICIOS,
+                     ventana: float = VENTANA_REINICIOS) -> None:
+    """Relanza los workers que terminan y reconecta con ellos.
+
+    `procesos` se actualiza en el sitio con los procesos nuevos. Vuelve (y el servicio se
+    detiene) si hay más de `max_reinicios` caídas en `ventana` segundos.
+    """
+    reinicios = deque()
+    vigilados = {asyncio.create_task(_esperar_fin(p)): i for i, p in enumerate(procesos)}
+    try:
+        while True:
+            hechos, _ = await asyncio.wait(vigilados, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in hechos:
+                indice = vigilados.pop(tarea)
+                procesos[indice].join(0)
+                reparto.desconectar(indice)
+                ahora = time.monotonic()
+                reinicios.append(ahora)
+                while reinicios[0] < ahora - ventana:
+                    reinicios.popleft()
+                if len(reinicios) > max_reinicios:
+                    logger.critical(f"{len(reinicios)} caídas de workers en {ventana:.0f} s: se detiene el servicio")
+                    return
+                logger.error(f"El worker {indice} terminó (código {procesos[indice].exitcode}); se relanza")
+                procesos[indice] = lanzar(indice)
+                await reparto.reconectar(indice)
+                vigilados[asyncio.create_task(_esperar_fin(procesos[indice]))] = indice
+    finally:
+        for tarea in vigilados:
+            tarea.cancel()
+
+
+async def _servir_frontal(procesos, lanzar, rutas, port, url_path, webhook_url, secret_token, token) -> bool:
+    """Sirve el webhook hasta una señal (devuelve True) o hasta que el supervisor se rinde (False)."""
+    reparto = Reparto(rutas)
+    await reparto.conectar()
+    async with Bot(token) as bot:
+        await bot.set_webhook(
+            webhook_url, secret_token=secret_token, allowed_updates=Update.ALL_TYPES, drop_pending_updates=True
+        )
+    servidor = aplicacion_frontal(reparto, secret_token, url_path).listen(port, address="0.0.0.0")
+    logger.info(f"Frontal del webhook en el puerto {port} repartiendo entre {len(rutas)} workers")
+    senal = asyncio.create_task(_esperar_senal())
+    supervisor = asyncio.create_task(supervisar(procesos, lanzar, reparto))
+    try:
+        await asyncio.wait({senal, supervisor}, return_when=asyncio.FIRST_COMPLETED)
+        if supervisor.done() and not supervisor.cancelled() and supervisor.exception():
+            logger.critical(f"No se pudo relanzar un worker: {supervisor.exception()}")
+        return senal.done()
+    finally:
+        senal.cancel()
+        supervisor.cancel()
+        servidor.stop()
+        await reparto.cerrar()
+        logger.info(f"Updates repartidos por worker: {reparto.enviados}")
+
+
+# === Procesos worker ===
+
+async def recibir_updates(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, application) -> None:
+    """Lee tramas del frontal y las encola en la Application en el orden de llegada."""
+    while (datos := await leer_trama(reader)) is not None:
+        try:
+            update = Update.de_json(json.loads(datos), application.bot)
+        except Exception as e:
+            logger.error(f"Update recibido del frontal no válido: {e}")
+            continue
+        await application.update_queue.put(update)
+    writer.close()
+
+
+async def _servir_worker(ruta: str, workers: int, indice: int) -> None:
+    import bot  # se importa en el worker: cada proceso construye su propia Application
+
+    # Todos los workers comparten el token: cada uno se queda con 1/N del límite global de envíos
+    application = bot.construir_aplicacion(workers, indice)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    # El ProcesadorPorChat de la Application mantiene el orden de llegada dentro de cada chat
+    await application.start()
+    servidor = await asyncio.start_unix_server(partial(recibir_updates, application=application), path=ruta)
+    try:
+        await _esperar_senal()
+    finally:
+        servidor.close()
+        await servidor.wait_closed()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def _worker(ruta: str, workers: int, indice: int) -> None:
+    asyncio.run(_servir_worker(ruta, workers, indice))
+
+
+def ejecutar_con_workers(workers: int, port: int, url_path: str, webhook_url: str,
+                         secret_token: str | None, token: str) -> None:
+    """Arranca N workers y el frontal del webhook; bloquea hasta SIGTERM/SIGINT.
+
+    Sale con código 1 si los workers caen en bucle y el supervisor deja de relanzarlos.
+    """
+    directorio = tempfile.mkdtemp(prefix="crm-webhook-")
+    rutas = [os.path.join(directorio, f"worker-{i}.sock") for i in range(workers)]
+    contexto = multiprocessing.get_context("spawn")
+
+    def lanzar(indice: int):
+        proceso = contexto.Process(target=_worker, args=(rutas[indice], workers, indice),
+                                   name=f"webhook-worker-{indice}")
+        proceso.start()
+        return proceso
+
+    procesos = [lanzar(i) for i in range(workers)]
+    try:
+        if not asyncio.run(_servir_frontal(procesos, lanzar, rutas, port, url_path, webhook_url, secret_token, token)):
+            raise SystemExit(1)
+    finally:
+        for proceso in procesos:
+            if proceso.is_alive():
+                proceso.terminate()
+        for proceso in procesos:
+            proceso.join(timeout=15)
+        shutil.rmtree(directorio, ignore_errors=True)